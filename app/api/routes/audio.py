@@ -1,12 +1,23 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from services.whisper_service import WhisperService
-from services.mistral_service import MistralService
+import asyncio
+import contextlib
+from fastapi import APIRouter, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+from services.whisper_service import get_whisper_service, start_background_load, whisper_status, whisper_batcher
+from services.streaming_transcription import StreamingTranscriber, FfmpegStreamDecoder
+from utils.audio_processing import SAMPLING_RATE, PCM_ENCODINGS, pcm_to_float32, StreamResampler
 from core.config import settings
+from core.telemetry import get_logger
+
+logger = get_logger(__name__)
 
 router = APIRouter()
 
-whisper_service = WhisperService()
-mistral_service = MistralService(settings.MISTRAL_API_KEY)
+@router.on_event("startup")
+async def load_whisper():
+    if settings.WHISPER_LOAD_MODE == "eager":
+        await asyncio.to_thread(get_whisper_service)
+    elif settings.WHISPER_LOAD_MODE == "background":
+        start_background_load()
 
 @router.post("/process")
 async def process_audio(file: UploadFile = File(...)):
@@ -14,8 +25,8 @@ async def process_audio(file: UploadFile = File(...)):
         # Read the audio file
         audio_data = await file.read()
         
-        # Transcribe audio
-        transcription, timestamps = whisper_service.transcribe(audio_data)
+        # Transcribe audio in the batching worker thread, off the event loop
+        transcription, timestamps = await whisper_batcher.submit_async(audio_data)
         # print(transcription)
         
         #TODO: ADD MISTRAL SERVICE FOR THE IMAGES HERE> 
@@ -30,6 +41,124 @@ async def process_audio(file: UploadFile = File(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def log_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Transcribing a stream utterance failed", exc_info=task.exception())
+
+async def send_hypothesis(websocket: WebSocket, request: dict):
+    transcription, chunks = await whisper_batcher.submit_async({"raw": request["audio"], "sampling_rate": SAMPLING_RATE})
+    # Chunk timestamps are relative to the utterance, shift them onto the stream's timeline
+    timestamps = [
+        {
+            "text": chunk["text"],
+            "timestamp": [None if t is None else round(request["start"] + t, 3) for t in chunk["timestamp"]],
+        }
+        for chunk in chunks
+    ]
+    await websocket.send_json({
+        "type": request["type"],
+        "text": transcription.strip(),
+        "start": request["start"],
+        "end": request["end"],
+        "chunks": timestamps,
+    })
+
+@router.websocket("/stream")
+async def stream_audio(websocket: WebSocket, encoding: str = "pcm_s16le", sample_rate: int = SAMPLING_RATE):
+    """
+    Live transcription. The client sends binary audio messages, either raw mono PCM
+    (`encoding` pcm_s16le or pcm_f32le at `sample_rate`) or a compressed stream such as
+    Opus in WebM/Ogg (`encoding` opus, decoded with ffmpeg), and a text message "end" to
+    finish. The server answers with JSON "partial" hypotheses while the user is speaking
+    and a "final" hypothesis with timestamps after each utterance.
+    """
+    await websocket.accept()
+    if encoding not in PCM_ENCODINGS and encoding != "opus":
+        await websocket.close(code=1003, reason=f"Unsupported encoding: {encoding}")
+        return
+
+    transcriber = StreamingTranscriber()
+    decoder = FfmpegStreamDecoder() if encoding == "opus" else None
+    # One resampler for the whole connection, so its filter runs across message boundaries
+    resampler = StreamResampler(sample_rate) if decoder is None else None
+    partial_task = None
+    final_task = None
+    reader_task = None
+    # Bytes of a sample split across two messages
+    remainder = b""
+
+    async def send_final(previous, request):
+        # Finals are sent in order; a failed one was logged and does not hold up the next
+        if previous is not None:
+            with contextlib.suppress(Exception):
+                await previous
+        await send_hypothesis(websocket, request)
+
+    async def handle(requests):
+        nonlocal partial_task, final_task
+        for request in requests:
+            if request["type"] == "final":
+                # The final hypothesis replaces any partial still being computed
+                if partial_task is not None:
+                    partial_task.cancel()
+                    partial_task = None
+                # Transcribed off the receive loop, so audio keeps being read meanwhile
+                final_task = asyncio.create_task(send_final(final_task, request))
+                final_task.add_done_callback(log_failure)
+            elif (partial_task is None or partial_task.done()) and (final_task is None or final_task.done()):
+                # Skip partials while a hypothesis is still running so we never fall behind
+                partial_task = asyncio.create_task(send_hypothesis(websocket, request))
+                partial_task.add_done_callback(log_failure)
+
+    async def read_decoded():
+        while (samples := await decoder.read()) is not None:
+            await handle(transcriber.feed(samples))
+
+    try:
+        if decoder is not None:
+            await decoder.start()
+            reader_task = asyncio.create_task(read_decoded())
+
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes"):
+                if decoder is not None:
+                    await decoder.write(message["bytes"])
+                else:
+                    data = remainder + message["bytes"]
+                    usable = len(data) - len(data) % PCM_ENCODINGS[encoding].itemsize
+                    remainder = data[usable:]
+                    samples = resampler.process(pcm_to_float32(data[:usable], encoding))
+                    await handle(transcriber.feed(samples))
+            elif message.get("text") == "end":
+                break
+
+        if decoder is not None:
+            await decoder.end()
+            await reader_task
+        else:
+            await handle(transcriber.feed(resampler.flush()))
+        await handle(transcriber.flush())
+        if final_task is not None:
+            await asyncio.wait({final_task})
+        await websocket.send_json({"type": "end"})
+        await websocket.close()
+    except WebSocketDisconnect:
+        logger.info("Audio stream client disconnected")
+    finally:
+        for task in (partial_task, final_task, reader_task):
+            if task is not None:
+                task.cancel()
+        if decoder is not None:
+            await decoder.close()
+
 @router.get("/health")
 async def audio_health_check():
-    return {"status": "Audio processing is operational"}
\ No newline at end of file
+    status = whisper_status()
+    batcher = whisper_batcher.metrics()
+    if not status["ready"]:
+        # Not ready yet, so readiness probes keep traffic away until the model is loaded
+        return JSONResponse(status_code=503, content={"status": "Audio model is not ready", "whisper": status, "batcher": batcher})
+    return {"status": "Audio processing is operational", "whisper": status, "batcher": batcher}
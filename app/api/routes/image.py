@@ -1,15 +1,39 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from utils.image_processing import get_cached_image, reduce_image_size, encode_image
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from utils.image_processing import (
+    reduce_image_size, encode_image_jpeg, encode_frame, decode_image, jpeg_etag,
+    image_cache, get_preprocess_executor,
+)
+from utils.image_sizing import LIVE
+from utils.floorplan_graph import FloorplanGraph
+from utils.frame_cues import detect_cues, gate_frame, hazard_result
 from core.config import settings
+from core.telemetry import get_logger, span
 from pydantic import BaseModel
 from .audio import process_audio
 from services.mistral_service import mistral_service
+from services.response_cache import response_cache
+from services.request_scheduler import request_scheduler
+from services.model_router import model_router
+from services.floorplan_registry import floorplan_registry, VenueAssets
+from services.navigation_pipeline import FrameSelector, NavigationFrames, NavigationPipeline, PipelineStageError
+from services.session_store import NavigationSession, SessionConflict, session_store
+from utils.video_processing import iter_named_video_frames, temporary_video_file, DEFAULT_SAMPLE_FPS
+import asyncio
+import base64
 import os
+import json
+import time
+import uuid
+import weakref
+from contextlib import AsyncExitStack
+from typing import List
+
+logger = get_logger(__name__)
 
 router = APIRouter()
 
-# Global variable to store the floorplan
-floorplan_base64 = None
 
 
 class NavigationRequest(BaseModel):
@@ -18,102 +42,574 @@ class NavigationRequest(BaseModel):
 
 @router.on_event("startup")
 async def load_floorplan():
-    global floorplan_base64
-    floorplan_path = settings.FLOORPLAN_IMAGE_PATH
-    floorplan_base64 = get_cached_image(floorplan_path)
-    if floorplan_base64 is None:
-        raise HTTPException(status_code=500, detail="Failed to load floorplan image")
+    # Encode every venue's floorplan up front, in parallel and off the event loop
+    await asyncio.to_thread(floorplan_registry.load)
+    await get_venue(settings.DEFAULT_VENUE_ID)
+
+async def get_venue(venue_id: str, with_graph: bool = False) -> VenueAssets:
+    """
+    Returns a snapshot of a venue with its floorplan (and occupancy grid, with `with_graph`) loaded,
+    reloading anything that changed on disk off the event loop.
+    """
+    get = floorplan_registry.get_with_graph if with_graph else floorplan_registry.get
+    try:
+        return await asyncio.to_thread(get, venue_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown venue: {venue_id}")
+    except ValueError:
+        raise HTTPException(status_code=500, detail=f"Failed to load floorplan of venue: {venue_id}")
+
+@router.get("/venues")
+async def list_venues():
+    return {"venues": [venue.info() for venue in floorplan_registry.venues()]}
+
+def plan_route(graph: FloorplanGraph, current_position, target_position):
+    """
+    Plans a route between the positions reported by the model, or returns None if they
+    are missing or malformed or no route exists.
+    """
+    try:
+        with span("route_plan"):
+            return graph.plan(current_position, target_position)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def add_local_route(result: dict, graph: FloorplanGraph, planned: tuple = None) -> dict:
+    """
+    Completes a localisation result with the plan of a route computed on the floorplan
+    grid. `planned` is an earlier ((current_position, target_position), route) for the
+    same frame, reused when the positions have not changed.
+    """
+    if "error" in result:
+        return result
+    positions = (result.get("current_position"), result.get("target_position"))
+    if planned is not None and planned[0] == positions:
+        route = planned[1]
+    else:
+        route = plan_route(graph, *positions)
+    if route is None:
+        return {**result, "route_error": "Could not plan a route between the current and target positions"}
+    return {
+        **result,
+        "plan": route["steps"],
+        "current_action": route["steps"][0]["description"],
+        "route": {"waypoints": route["waypoints"], "distance": route["distance"]},
+    }
+
+def accepts_jpeg(request: Request) -> bool:
+    """
+    Whether the Accept header lists `image/jpeg` with a non-zero quality value.
+    """
+    for media_range in request.headers.get("accept", "").split(","):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        if media_type.lower() != "image/jpeg":
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            return True
+    return False
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Whether the client already holds this version: its If-None-Match lists the ETag.
+    """
+    if_none_match = request.headers.get("if-none-match", "")
+    client_etags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in client_etags or "*" in client_etags
+
+def jpeg_response(jpeg: bytes, etag: str, cache_control: str, not_modified: bool = False) -> Response:
+    """
+    Returns the raw JPEG, or an empty 304 when `not_modified`. Only GET requests may be
+    answered with a 304.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept"}
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    return Response(content=jpeg, media_type="image/jpeg", headers=headers)
 
 @router.get("/floorplan")
-async def get_floorplan():
-    global floorplan_base64
-    if floorplan_base64 is None:
-        raise HTTPException(status_code=500, detail="Floorplan not loaded")
-    return {"image": floorplan_base64}
+async def get_floorplan(request: Request, venue_id: str = settings.DEFAULT_VENUE_ID):
+    """
+    Returns the venue's floorplan as raw JPEG bytes with an ETag when the client accepts
+    `image/jpeg`, otherwise as base64 JSON.
+    """
+    floorplan = (await get_venue(venue_id)).floorplan
+    if accepts_jpeg(request):
+        # The floorplan rarely changes: let clients keep it and revalidate with If-None-Match
+        return jpeg_response(floorplan.jpeg, floorplan.etag, "no-cache", etag_matches(request, floorplan.etag))
+    return {"image": floorplan.base64}
 
 
 @router.post("/live")
-async def process_live_image(file: UploadFile = File(...)):
+async def process_live_image(request: Request, file: UploadFile = File(...)):
+    """
+    Resizes and re-encodes a live image. Returns raw JPEG bytes when the client accepts
+    `image/jpeg`, otherwise base64 JSON.
+    """
     contents = await file.read()
-    base64_live_image = encode_image(contents)
-    print("Base64 live image: ", base64_live_image)
-    if base64_live_image is None:
+    jpeg = encode_image_jpeg(contents, role=LIVE)
+    if jpeg is None:
         raise HTTPException(status_code=500, detail="Failed to process live image")
-    return {"image": base64_live_image}
+    if accepts_jpeg(request):
+        # A fresh encode of the upload, conditional requests do not apply
+        return jpeg_response(jpeg, jpeg_etag(jpeg), "no-store")
+    return {"image": base64.b64encode(jpeg).decode('utf-8')}
 
-@router.post("/navigate")
-async def navigate(task: str = Form(...)):
-    global floorplan_base64
-    if floorplan_base64 is None:
-        raise HTTPException(status_code=500, detail="Floorplan not loaded")
-    
-    transcription = "Help me find the fire exit"
+def format_event(event: str, data: dict, sse: bool) -> str:
+    """
+    Formats a navigation event either as a server-sent event or as one line of NDJSON.
+    """
+    if sse:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"event": event, **data}) + "\n"
+
+def prepare_frames(frames, dedup_threshold: float) -> NavigationFrames:
+    """
+    Selects and encodes the key frames from an iterable of (filename, image) pairs,
+    skipping duplicates of the last key frame and answering hazard frames locally, see
+    FrameSelector. Key frames are encoded on the preprocessing thread pool while the
+    next frames are being decoded.
+    """
+    selector = FrameSelector(dedup_threshold)
+    navigation_frames = NavigationFrames()
+    executor = get_preprocess_executor()
+    for filename, img in frames:
+        decision, cues = selector.select(img)
+        if decision == "hazard":
+            navigation_frames.add_hazard(filename, hazard_result(cues))
+        elif decision == "duplicate":
+            navigation_frames.add(filename)
+        else:
+            navigation_frames.add(filename, executor.submit(encode_frame, img, role=LIVE))
+
+    # Swap the pending encodes for their results
+    for index, future in enumerate(navigation_frames.live_images):
+        base64_live_image = future.result()
+        if base64_live_image is None:
+            filename = navigation_frames.groups[index][0][1]
+            raise HTTPException(status_code=500, detail=f"Failed to process live image: {filename}")
+        navigation_frames.live_images[index] = base64_live_image
+
+    logger.info("Selected %d of %d frames, %d hazards", len(navigation_frames.live_images), navigation_frames.total,
+                len(navigation_frames.hazards))
+    return navigation_frames
+
+def token_estimate(floorplan_base64: str, frames: NavigationFrames, transcription: str, frames_per_request: int,
+                   localize_only: bool = False) -> dict:
+    """
+    Estimates the tokens of the model requests made for the key frames, prompt and
+    expected completion included, to report alongside the results.
+    """
+    per_request = [
+        mistral_service.estimate_prompt_tokens(floorplan_base64, [frames.live_images[index] for index in indices], transcription, localize_only)
+        for indices in mistral_service.frame_groups(len(frames.live_images), frames_per_request)
+    ]
+    return {
+        "per_request": per_request,
+        "total": sum(per_request),
+    }
+
+async def stream_navigation(request: Request, task: str, floorplan_base64: str, frames: NavigationFrames, transcription: str, sse: bool, use_cache: bool,
+                            frames_per_request: int, graph: FloorplanGraph = None):
+    """
+    Emits each frame's navigation result as soon as the model has answered, followed by
+    a final summary event. Stops and cancels outstanding requests if the client disconnects.
+
+    The model replies are streamed, and a key frame's current location and first plan
+    step are emitted as "partial" events as soon as they have been generated. With a
+    floorplan `graph`, the model only localises and the route is planned locally as soon
+    as both positions are known.
+    """
+    start_time = time.perf_counter()
+    first_step_seconds = None
+    completed = 0
+    errors = 0
+    # Per key frame: the positions reported so far, and the ((current, target), route) planned from them
+    positions = {}
+    planned = {}
+    frame_results = mistral_service.iter_frame_events(task, floorplan_base64, frames.live_images, transcription, use_cache=use_cache,
+                                                      frames_per_request=frames_per_request, localize_only=graph is not None)
+    try:
+        # Hazard frames were answered locally and go out first
+        for hazard in frames.hazards:
+            yield format_event("hazard", hazard, sse)
+        async for event in frame_results:
+            if await request.is_disconnected():
+                logger.info("Client disconnected, stopping navigation stream")
+                return
+            index = event["index"]
+            position, filename = frames.groups[index][0]
+            if event["type"] == "partial":
+                partials = [(event["field"], event["value"])]
+                if graph is not None and event["field"] in ("current_position", "target_position"):
+                    frame_positions = positions.setdefault(index, {})
+                    frame_positions[event["field"]] = event["value"]
+                    if len(frame_positions) == 2:
+                        route_positions = (frame_positions["current_position"], frame_positions["target_position"])
+                        route = await asyncio.to_thread(plan_route, graph, *route_positions)
+                        planned[index] = (route_positions, route)
+                        if route is not None:
+                            partials.append(("first_step", route["steps"][0]))
+                for field, value in partials:
+                    if field == "first_step" and first_step_seconds is None:
+                        first_step_seconds = round(time.perf_counter() - start_time, 3)
+                    yield format_event("partial", {"index": position, "frame": filename, "field": field, "value": value}, sse)
+                continue
+
+            result = event["result"]
+            if graph is not None:
+                result = await asyncio.to_thread(add_local_route, result, graph, planned.get(index))
+            completed += 1
+            if "error" in result:
+                errors += 1
+            for frame_result in frames.frame_results(index, result):
+                yield format_event("frame", frame_result, sse)
+
+        yield format_event("summary", {
+            "frames": frames.total,
+            "skipped_frames": frames.skipped,
+            "hazards": len(frames.hazards),
+            "model_calls": len(mistral_service.frame_groups(completed, frames_per_request)),
+            "errors": errors,
+            "transcription": transcription,
+            "estimated_tokens": token_estimate(floorplan_base64, frames, transcription, frames_per_request, graph is not None),
+            "first_step_seconds": first_step_seconds,
+            "elapsed_seconds": round(time.perf_counter() - start_time, 3),
+        }, sse)
+    finally:
+        await frame_results.aclose()
+
+def iter_demo_frames():
+    """
+    Reads and decodes the frames of the demo walkthrough from disk.
+    """
     # FOR DEMO PURPOSES, WE ARE USING A static folder as we can't access the live video feed
     # due to rate limiting on the API side.
     image_path = '/Users/raoulritter/mistral-a16z-hackathon/IMG_6794_frames'
     
-    results = []
-    
     # Iterate through all images in the directory
     # for filename in os.listdir(image_path):
     for filename in sorted(os.listdir(image_path)):
         if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-            floorplan_path = settings.FLOORPLAN_IMAGE_PATH
-            floorplan_base64 = get_cached_image(floorplan_path)
             file_path = os.path.join(image_path, filename)
             
             # Read the image file
             with open(file_path, "rb") as image_file:
                 contents = image_file.read()
-                print(filename)
+                logger.debug("Read live image %s", filename)
             
-            base64_live_image = encode_image(contents)
-            if base64_live_image is None:
+            # Large photos are decoded straight at reduced resolution
+            img = decode_image(contents, role=LIVE)
+            if img is None:
                 raise HTTPException(status_code=500, detail=f"Failed to process live image: {filename}")
             
-            # Process the task with Mistral service for each frame
-            
-            result = mistral_service.process_task(task, floorplan_base64, base64_live_image, transcription)
-            # print
-            results.append({"frame": filename, "navigation": result})
-    
-    return {
-        "frames": results,
-        "transcription": transcription
-    }
+            yield filename, img
 
+@router.post("/navigate")
+async def navigate(request: Request, task: str = Form(...), stream: bool = Form(False),
+                   video_file: UploadFile = File(None), fps: float = Form(DEFAULT_SAMPLE_FPS),
+                   dedup_threshold: float = Form(settings.KEYFRAME_DIFF_THRESHOLD),
+                   frames_per_request: int = Form(settings.FRAMES_PER_REQUEST),
+                   local_planning: bool = Form(settings.LOCAL_ROUTE_PLANNING),
+                   venue_id: str = Form(settings.DEFAULT_VENUE_ID)):
+    """
+    Runs the navigation task over every frame, against the floorplan of `venue_id`.
+    Frames are sampled from `video_file` at `fps` when a video is uploaded, otherwise
+    they are read from the demo frame folder.
+    Frames that differ from the last key frame by less than `dedup_threshold` are not
+    sent to the model and reuse its result instead. With LOCAL_PREFILTER_ENABLED, so
+    are frames whose local cues match the last key frame's, and frames with an obstacle
+    right in front of the person are answered locally and listed in `hazard_frames`. Key frames are sent to the model
+    `frames_per_request` at a time, sharing one copy of the floorplan per request.
 
+    With `local_planning` set, the model is only asked where the person and their
+    destination are on the floorplan, and the route is planned locally on the
+    floorplan's occupancy grid.
 
-# BELOW IS THE ROUTE FOR THE LIVE VIDEO FEED
+    With `stream` set, results are streamed as they arrive: as server-sent events when
+    the client accepts `text/event-stream`, otherwise as newline-delimited JSON. The
+    current location and first plan step of each key frame are streamed ahead of its
+    full result.
 
-# @router.post("/navigate")
-# async def navigate(task: str = Form(...), video_file: UploadFile = File(...)):
-    # global floorplan_base64
-    # if floorplan_base64 is None:
-    #     raise HTTPException(status_code=500, detail="Floorplan not loaded")
-    
-    # # Process the audio file
-    # audio_data = await audio_file.read()
-    # audio_result = await process_audio(audio_file)
-    # if "error" in audio_result:
-    #     raise HTTPException(status_code=500, detail=audio_result["error"])
-    
-    # transcription = audio_result["transcription"]
+    Model responses are served from the response cache unless the request carries
+    `Cache-Control: no-cache`.
+    """
+    venue = await get_venue(venue_id, with_graph=local_planning)
     
+    transcription = "Help me find the fire exit"
+    if video_file is not None:
+        # Decode, select and encode the sampled frames in memory, off the event loop
+        async with temporary_video_file(video_file.file, video_file.filename) as video_path:
+            try:
+                frames = await asyncio.to_thread(prepare_frames, iter_named_video_frames(video_path, fps), dedup_threshold)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Failed to read video: {video_file.filename}")
+    else:
+        frames = await asyncio.to_thread(prepare_frames, iter_demo_frames(), dedup_threshold)
     
+    floorplan_base64 = venue.floorplan.base64
+    use_cache = "no-cache" not in request.headers.get("cache-control", "")
+    graph = venue.graph if local_planning else None
     
-   
-    # base64_live_image = encode_image(contents)
-    # if base64_live_image is None:
-    #     raise HTTPException(status_code=500, detail="Failed to process live image")
+    if stream:
+        sse = "text/event-stream" in request.headers.get("accept", "")
+        return StreamingResponse(
+            stream_navigation(request, task, floorplan_base64, frames, transcription, sse, use_cache, frames_per_request, graph),
+            media_type="text/event-stream" if sse else "application/x-ndjson",
+        )
     
-    # # Process the task with Mistral service
-    # result = mistral_service.process_task(task, floorplan_base64, base64_live_image, transcription)
+    # Process the key frames with Mistral service concurrently, results come back in frame order
+    navigations = await mistral_service.process_frames(task, floorplan_base64, frames.live_images, transcription, use_cache=use_cache,
+                                                       frames_per_request=frames_per_request, localize_only=local_planning)
+    if graph is not None:
+        navigations = await asyncio.to_thread(lambda: [add_local_route(result, graph) for result in navigations])
+    results = []
+    for keyframe_index, result in enumerate(navigations):
+        results.extend(frames.frame_results(keyframe_index, result))
     
-    # return {
-    #     "navigation": result,
-    #     "transcription": transcription
-    # }
+    return {
+        "venue_id": venue.venue_id,
+        "frames": results,
+        "skipped_frames": frames.skipped,
+        "hazard_frames": frames.hazards,
+        "transcription": transcription,
+        "estimated_tokens": token_estimate(floorplan_base64, frames, transcription, frames_per_request, local_planning),
+    }
+
+
+
+def iter_uploaded_frames(uploads: list):
+    """
+    Decodes uploaded frames, given as (filename, contents) pairs in playback order.
+
+    :raises ValueError: If a frame cannot be decoded
+    """
+    for filename, contents in uploads:
+        img = decode_image(contents, role=LIVE)
+        if img is None:
+            raise ValueError(f"Failed to read frame: {filename}")
+        yield filename, img
+
+def pipeline_summary(pipeline: NavigationPipeline) -> dict:
+    return {
+        "frame_count": pipeline.frames.total,
+        "skipped_frames": pipeline.frames.skipped,
+        "model_calls": pipeline.model_calls,
+        "hazards": len(pipeline.frames.hazards),
+        "transcription": pipeline.transcription,
+        "timings": pipeline.timings,
+    }
+
+def pipeline_http_error(error: PipelineStageError) -> HTTPException:
+    cause = error.__cause__
+    if isinstance(cause, HTTPException):
+        return cause
+    # Unreadable uploads are the client's fault
+    return HTTPException(status_code=400 if isinstance(cause, ValueError) else 500, detail=str(error))
+
+async def stream_voice_navigation(request: Request, pipeline: NavigationPipeline, audio: bytes, frames, sse: bool,
+                                  graph: FloorplanGraph = None):
+    """
+    Emits the transcription as soon as it is known, hazards found by the local
+    pre-filter as they are found, then each frame's navigation result as the model
+    answers, followed by a summary event, or an "error" event if a stage
+    of the pipeline fails.
+    """
+    events = pipeline.run(audio, frames)
+    try:
+        async for event in events:
+            if await request.is_disconnected():
+                logger.info("Client disconnected, stopping voice navigation stream")
+                return
+            if event["type"] == "transcription":
+                yield format_event("transcription", {"text": event["text"], "seconds": event["seconds"]}, sse)
+                continue
+            if event["type"] == "hazard":
+                yield format_event("hazard", {"index": event["index"], "frame": event["frame"], **event["result"]}, sse)
+                continue
+            result = event["result"]
+            if graph is not None:
+                result = await asyncio.to_thread(add_local_route, result, graph)
+            for frame_result in pipeline.frames.frame_results(event["index"], result):
+                yield format_event("frame", frame_result, sse)
+        yield format_event("summary", pipeline_summary(pipeline), sse)
+    except PipelineStageError as e:
+        yield format_event("error", {"stage": e.stage, "detail": pipeline_http_error(e).detail}, sse)
+    finally:
+        await events.aclose()
+
+@router.post("/navigate/voice")
+async def navigate_voice(request: Request, audio_file: UploadFile = File(...), task: str = Form("navigate"), stream: bool = Form(False),
+                         video_file: UploadFile = File(None), frames: List[UploadFile] = File(None),
+                         fps: float = Form(DEFAULT_SAMPLE_FPS),
+                         dedup_threshold: float = Form(settings.KEYFRAME_DIFF_THRESHOLD),
+                         frames_per_request: int = Form(settings.FRAMES_PER_REQUEST),
+                         local_planning: bool = Form(settings.LOCAL_ROUTE_PLANNING),
+                         venue_id: str = Form(settings.DEFAULT_VENUE_ID)):
+    """
+    Voice-driven navigation: transcribes the spoken request in `audio_file` and answers
+    it for every frame of `video_file`, or of the uploaded `frames` (images in playback
+    order), or of the demo frame folder when neither is given.
+
+    Transcription runs concurrently with decoding and encoding the frames, see
+    services.navigation_pipeline; the other parameters behave as in /navigate. With
+    `stream` set, the transcription is streamed first, then the frame results as they
+    arrive.
+    """
+    venue = await get_venue(venue_id, with_graph=local_planning)
+    audio = await audio_file.read()
+    # Holds the temporary video file until the pipeline is done with it, which is after
+    # this handler returns when the response is streamed: the response closes it then,
+    # also when the client disconnects before the stream starts
+    resources = AsyncExitStack()
+    if video_file is not None:
+        video_path = await resources.enter_async_context(temporary_video_file(video_file.file, video_file.filename))
+        source = iter_named_video_frames(video_path, fps)
+    elif frames:
+        source = iter_uploaded_frames([(frame.filename, await frame.read()) for frame in frames])
+    else:
+        source = iter_demo_frames()
+
+    use_cache = "no-cache" not in request.headers.get("cache-control", "")
+    graph = venue.graph if local_planning else None
+    pipeline = NavigationPipeline(task, venue.floorplan.base64, dedup_threshold, frames_per_request, use_cache=use_cache,
+                                  localize_only=local_planning)
+
+    if stream:
+        sse = "text/event-stream" in request.headers.get("accept", "")
+        return StreamingResponse(
+            stream_voice_navigation(request, pipeline, audio, source, sse, graph),
+            media_type="text/event-stream" if sse else "application/x-ndjson",
+            background=BackgroundTask(resources.aclose),
+        )
+
+    results = []
+    async with resources:
+        try:
+            async for event in pipeline.run(audio, source):
+                if event["type"] != "result":
+                    continue
+                result = event["result"]
+                if graph is not None:
+                    result = await asyncio.to_thread(add_local_route, result, graph)
+                results.extend(pipeline.frames.frame_results(event["index"], result))
+        except PipelineStageError as e:
+            raise pipeline_http_error(e)
+    results.sort(key=lambda result: result["index"])
+
+    return {
+        "venue_id": venue.venue_id,
+        **pipeline_summary(pipeline),
+        "frames": results,
+        "hazard_frames": pipeline.frames.hazards,
+    }
+
+# One lock per session in use, so frames of a session are processed one at a time and
+# each sees the progress recorded for the one before. The locks only cover this process;
+# across workers sharing a store, saves are compare-and-swap and are retried this often
+session_locks = weakref.WeakValueDictionary()
+SESSION_SAVE_ATTEMPTS = 3
+
+async def update_session(session_id: str, img, cues, transcription: str, task: str, venue, use_cache: bool) -> tuple:
+    """
+    Reads the session, answers the live frame and saves the session again.
+
+    Returns:
+    - tuple: (session, mode)
+
+    :raises SessionConflict: If the session was saved by another request in the meantime
+    """
+    session = await asyncio.to_thread(session_store.get, session_id) or NavigationSession(session_id)
+    # Later frames keep the session's request unless a new one is spoken
+    transcription = transcription or session.transcription
+    if not transcription:
+        raise HTTPException(status_code=400, detail="A transcription is required to start a session")
+
+    if (
+        cues is not None
+        and mistral_service.replan_reason(session, transcription, venue.venue_id) is None
+        and gate_frame(cues, session.cue_signature, session.frames_since_model) == "skip"
+    ):
+        mode = "local"
+        session.frames_since_model += 1
+        # Frames answered locally are activity too, the session must not expire mid-walk
+        session.touch()
+    else:
+        base64_live_image = await asyncio.to_thread(encode_frame, img, role=LIVE)
+        if base64_live_image is None:
+            raise HTTPException(status_code=500, detail="Failed to process live image")
+        mode, result = await mistral_service.process_session_frame_async(
+            session, task, venue.floorplan.base64, base64_live_image, transcription, venue.venue_id, use_cache,
+        )
+        if "error" in result:
+            raise HTTPException(status_code=502, detail=result["error"])
+        session.cue_signature = cues.signature if cues is not None else None
+        session.frames_since_model = 0
+    await asyncio.to_thread(session_store.save, session)
+    return session, mode
+
+@router.post("/navigate/session")
+async def navigate_session(request: Request, file: UploadFile = File(...), session_id: str = Form(None),
+                           transcription: str = Form(None), task: str = Form("navigate"),
+                           venue_id: str = Form(settings.DEFAULT_VENUE_ID)):
+    """
+    Navigation over a session of live frames sent one at a time. The first frame (or one
+    with a new `transcription`) gets a full plan; later frames of the session only
+    check progress along it with a short prompt, and the plan is made again when the
+    person diverges from it. Omit `session_id` to start a session, then pass the
+    returned one with each following frame; sessions expire after SESSION_TTL_SECONDS
+    without frames.
+
+    Each frame first goes through the local pre-filter (utils.frame_cues): an obstacle
+    right in front of the person is reported at once ("hazard" mode) without waiting
+    for the model or for earlier frames of the session, and frames whose cues match
+    the last frame sent to the model reuse its answer ("local" mode).
+    """
+    venue = await get_venue(venue_id)
+    session_id = session_id or uuid.uuid4().hex
+
+    contents = await file.read()
+    img = await asyncio.to_thread(decode_image, contents, role=LIVE)
+    if img is None:
+        raise HTTPException(status_code=400, detail="Failed to process live image")
+    cues = await asyncio.to_thread(detect_cues, img) if settings.LOCAL_PREFILTER_ENABLED else None
+    if cues is not None and cues.urgent_hazard:
+        return {
+            "session_id": session_id,
+            "venue_id": venue.venue_id,
+            "mode": "hazard",
+            "hazard": hazard_result(cues),
+        }
+
+    use_cache = "no-cache" not in request.headers.get("cache-control", "")
+    lock = session_locks.get(session_id)
+    if lock is None:
+        lock = session_locks[session_id] = asyncio.Lock()
+    async with lock:
+        for attempt in range(1, SESSION_SAVE_ATTEMPTS + 1):
+            try:
+                session, mode = await update_session(session_id, img, cues, transcription, task, venue, use_cache)
+                break
+            except SessionConflict:
+                if attempt == SESSION_SAVE_ATTEMPTS:
+                    raise HTTPException(status_code=409, detail="The session is being updated by another request, try again")
+                logger.info("Navigation session %s was saved by another request, processing the frame again", session_id)
+
+    return {
+        "session_id": session_id,
+        "venue_id": venue.venue_id,
+        "mode": mode,
+        "navigation": session.navigation(),
+        "replans": session.replans,
+        "cues": cues.to_dict() if cues is not None else None,
+    }
 
 @router.post("/reduce")
 async def reduce_image(input_path: str, output_path: str, width: int = 400, height: int = 300, quality: int = 75):
@@ -124,4 +620,12 @@ async def reduce_image(input_path: str, output_path: str, width: int = 400, heig
 
 @router.get("/health")
 async def image_health_check():
-    return {"status": "Image processing is operational"}
\ No newline at end of file
+    return {
+        "status": "Image processing is operational",
+        "image_cache": image_cache.stats(),
+        "response_cache": response_cache.stats() if response_cache is not None else None,
+        "scheduler": request_scheduler.metrics(),
+        "model_router": model_router.stats(),
+        "floorplans": floorplan_registry.stats(),
+        "sessions": session_store.stats(),
+    }
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+Compares in-process audio decoding with the ffmpeg subprocess used by the Hugging Face pipeline.
+
+Run from the app directory:
+
+    python -m benchmarks.audio_decode --seconds 10 --output audio_decode.json
+
+Synthetic WAV files (and FLAC when soundfile is installed) are generated in memory at a
+few common sample rates and channel counts, then decoded to 16 kHz mono float32 by
+utils.audio_processing.decode_audio and by transformers' ffmpeg_read.
+"""
+import argparse
+import io
+import numpy as np
+from benchmarks.common import make_wav, synthetic_signal, time_call, write_results
+from utils.audio_processing import SAMPLING_RATE, decode_audio, soundfile
+
+def make_flac(signal, sample_rate):
+    buffer = io.BytesIO()
+    soundfile.write(buffer, signal, sample_rate, format="FLAC")
+    return buffer.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    try:
+        from transformers.pipelines.audio_utils import ffmpeg_read
+    except ImportError:
+        ffmpeg_read = None
+
+    cases = {}
+    for sample_rate, channels in [(16000, 1), (44100, 2), (48000, 1)]:
+        signal = synthetic_signal(args.seconds, sample_rate, channels)
+        cases[f"wav_{sample_rate}hz_{channels}ch"] = make_wav(signal, sample_rate)
+        if soundfile is not None:
+            cases[f"flac_{sample_rate}hz_{channels}ch"] = make_flac(signal, sample_rate)
+
+    results = {}
+    for name, data in cases.items():
+        in_process = time_call(lambda: decode_audio(data), repeats=args.repeats)
+        samples = in_process.pop("result")
+        case = {"bytes": len(data), "in_process": in_process, "samples": None if samples is None else len(samples)}
+
+        if ffmpeg_read is None:
+            case["ffmpeg"] = {"error": "transformers is not installed"}
+        else:
+            try:
+                ffmpeg = time_call(lambda: ffmpeg_read(data, SAMPLING_RATE), repeats=args.repeats)
+                reference = ffmpeg.pop("result")
+                case["ffmpeg"] = ffmpeg
+                case["speedup"] = round(ffmpeg["p50_ms"] / in_process["p50_ms"], 2)
+                if samples is not None:
+                    length = min(len(samples), len(reference))
+                    case["max_abs_difference"] = round(float(np.max(np.abs(samples[:length] - reference[:length]))), 5)
+            except ValueError as e:
+                case["ffmpeg"] = {"error": str(e)}
+        results[name] = case
+
+    write_results("audio_decode", {"seconds": args.seconds, "cases": results}, args.output)
+
+if __name__ == "__main__":
+    main()
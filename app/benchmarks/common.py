@@ -0,0 +1,91 @@
+import io
+import json
+import platform
+import statistics
+import subprocess
+import time
+import wave
+import numpy as np
+
+def time_call(fn, repeats=5, warmup=1):
+    """
+    Times repeated calls of `fn` after `warmup` untimed calls.
+
+    Returns:
+    - dict: The last return value under "result" and the timings in milliseconds.
+    """
+    result = None
+    for _ in range(warmup):
+        result = fn()
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return {"result": result, **summarize(timings)}
+
+def percentile(values, q):
+    """
+    Returns the q-th percentile (0 to 100) of `values` using linear interpolation.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize(timings_ms):
+    return {
+        "runs": len(timings_ms),
+        "mean_ms": round(statistics.fmean(timings_ms), 3),
+        "p50_ms": round(percentile(timings_ms, 50), 3),
+        "p95_ms": round(percentile(timings_ms, 95), 3),
+        "p99_ms": round(percentile(timings_ms, 99), 3),
+        "min_ms": round(min(timings_ms), 3),
+    }
+
+def synthetic_signal(seconds, sample_rate, channels):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    signal = 0.3 * np.sin(2 * np.pi * 220 * t) + 0.05 * rng.standard_normal(len(t))
+    return np.repeat(signal[:, None], channels, axis=1).astype(np.float32)
+
+def make_wav(signal, sample_rate):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(signal.shape[1])
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes((signal * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_results(name, results, output=None):
+    """
+    Prints the results of a benchmark as JSON and writes them to `output` if given,
+    tagged with the commit and machine so runs can be compared across commits.
+    """
+    report = {
+        "benchmark": name,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    serialized = json.dumps(report, indent=2)
+    print(serialized)
+    if output:
+        with open(output, "w") as f:
+            f.write(serialized + "\n")
+    return report
@@ -0,0 +1,61 @@
+"""
+Compares sequential and batched image preprocessing over a directory of frames.
+
+Run from the app directory:
+
+    python -m benchmarks.image_preprocessing --dir ../IMG_6794_frames --output image_preprocessing.json
+
+Three variants encode every frame to a base64 JPEG at DESIRED_SIZE:
+- "sequential": encode_image one frame at a time, as the request path used to.
+- "batched": encode_images on the preprocessing thread pool with full-resolution decoding.
+- "batched_reduced": encode_images with reduced-resolution JPEG decoding for large frames.
+"""
+import argparse
+import os
+from benchmarks.common import time_call, write_results
+from utils.image_processing import encode_image, encode_images, get_preprocess_executor
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default="data/live", help="Directory of frames to preprocess")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    frames = []
+    for filename in sorted(os.listdir(args.dir)):
+        if filename.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(args.dir, filename), "rb") as f:
+                frames.append(f.read())
+    if not frames:
+        parser.error(f"No images found in {args.dir}")
+
+    variants = {
+        "sequential": lambda: [encode_image(frame) for frame in frames],
+        "batched": lambda: encode_images(frames, reduced_decode=False),
+        "batched_reduced": lambda: encode_images(frames, reduced_decode=True),
+    }
+
+    results = {}
+    for name, run in variants.items():
+        timing = time_call(run, repeats=args.repeats)
+        encoded = timing.pop("result")
+        results[name] = {
+            **timing,
+            "frames_per_second": round(len(frames) / (timing["p50_ms"] / 1000), 1),
+            "failed": sum(1 for image in encoded if image is None),
+            "payload_bytes": sum(len(image) for image in encoded if image is not None),
+        }
+
+    write_results("image_preprocessing", {
+        "directory": args.dir,
+        "frames": len(frames),
+        "input_bytes": sum(len(frame) for frame in frames),
+        "workers": get_preprocess_executor()._max_workers,
+        "variants": results,
+    }, args.output)
+
+if __name__ == "__main__":
+    main()
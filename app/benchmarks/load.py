@@ -0,0 +1,138 @@
+"""
+Drives a running server with concurrent /image/navigate and /audio/process requests and
+reports throughput and latency percentiles.
+
+Run from the app directory, against a server whose model calls go to the mock endpoint
+(see benchmarks.mock_mistral):
+
+    python -m benchmarks.mock_mistral --port 8001 --latency-ms 800 &
+    MISTRAL_API_URL=http://127.0.0.1:8001/v1/chat/completions uvicorn main:app --port 8000 &
+    python -m benchmarks.load --concurrency 8 --requests 200 --video ../demo.mp4 --output load.json
+
+Each scenario keeps `--concurrency` requests in flight until `--requests` have completed.
+Latency is measured to the end of the response body; "first_byte" is the time to the
+first body chunk, which is what the user waits for when `--stream` is set. Responses
+are not cached server-side unless `--use-cache` is given. With `--mock-url`, the mock's
+counters are included in the report.
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+import httpx
+from benchmarks.common import make_wav, summarize, synthetic_signal, write_results
+
+SCENARIOS = ("navigate", "audio")
+
+def navigate_request(args, video: bytes) -> dict:
+    data = {"task": "Help me find the fire exit", "stream": str(args.stream).lower()}
+    if args.frames_per_request:
+        data["frames_per_request"] = str(args.frames_per_request)
+    request = {"method": "POST", "url": "/image/navigate", "data": data}
+    if video is not None:
+        request["files"] = {"video_file": ("video.mp4", video)}
+    return request
+
+def audio_request(args, audio: bytes) -> dict:
+    return {"method": "POST", "url": "/audio/process", "files": {"file": ("speech.wav", audio, "audio/wav")}}
+
+async def timed_request(client: httpx.AsyncClient, request: dict) -> dict:
+    start = time.perf_counter()
+    first_byte = None
+    try:
+        async with client.stream(**request) as response:
+            async for _ in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - start
+            status = response.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    elapsed = time.perf_counter() - start
+    return {"status": status, "latency_ms": elapsed * 1000, "first_byte_ms": (first_byte if first_byte is not None else elapsed) * 1000}
+
+async def run_scenario(client: httpx.AsyncClient, request: dict, concurrency: int, total: int) -> dict:
+    samples = []
+    remaining = total
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            samples.append(await timed_request(client, request))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+
+    statuses = Counter(str(sample["status"]) for sample in samples)
+    succeeded = [sample for sample in samples if sample["status"] == 200]
+    result = {
+        "requests": len(samples),
+        "concurrency": concurrency,
+        "statuses": dict(statuses),
+        "error_rate": round(1 - len(succeeded) / len(samples), 4),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(succeeded) / wall, 3),
+    }
+    if succeeded:
+        result["latency"] = summarize([sample["latency_ms"] for sample in succeeded])
+        result["first_byte"] = summarize([sample["first_byte_ms"] for sample in succeeded])
+    return result
+
+async def run(args) -> dict:
+    video = None
+    if args.video:
+        with open(args.video, "rb") as f:
+            video = f.read()
+    if args.audio:
+        with open(args.audio, "rb") as f:
+            audio = f.read()
+    else:
+        audio = make_wav(synthetic_signal(args.audio_seconds, 16000, 1), 16000)
+
+    headers = {} if args.use_cache else {"Cache-Control": "no-cache"}
+    if args.stream:
+        headers["Accept"] = "text/event-stream"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    async with httpx.AsyncClient(base_url=args.base_url, headers=headers, limits=limits, timeout=args.timeout) as client:
+        for scenario in args.scenarios:
+            request = navigate_request(args, video) if scenario == "navigate" else audio_request(args, audio)
+            for _ in range(args.warmup):
+                await timed_request(client, request)
+            results[scenario] = await run_scenario(client, request, args.concurrency, args.requests)
+
+        if args.mock_url:
+            async with httpx.AsyncClient() as mock:
+                results["mock"] = (await mock.get(f"{args.mock_url.rstrip('/')}/stats")).json()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=50, help="Requests per scenario")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed requests per scenario")
+    parser.add_argument("--video", help="Video uploaded to /image/navigate, the demo frames are used otherwise")
+    parser.add_argument("--stream", action="store_true", help="Stream /image/navigate results")
+    parser.add_argument("--frames-per-request", type=int, help="Live frames per model request in /image/navigate")
+    parser.add_argument("--audio", help="Audio file uploaded to /audio/process, a synthetic tone otherwise")
+    parser.add_argument("--audio-seconds", type=float, default=5.0)
+    parser.add_argument("--use-cache", action="store_true", help="Allow the server to answer from its response cache")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--mock-url", help="Base URL of benchmarks.mock_mistral, to include its counters")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    write_results("load", {
+        "base_url": args.base_url,
+        "stream": args.stream,
+        "use_cache": args.use_cache,
+        "video": args.video,
+        "scenarios": results,
+    }, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Micro-benchmarks of the request path's building blocks on synthetic inputs.
+
+Run from the app directory (the settings need a MISTRAL_API_KEY, any value will do):
+
+    MISTRAL_API_KEY=unused python -m benchmarks.micro --output micro.json
+    MISTRAL_API_KEY=unused python -m benchmarks.micro --whisper --output micro.json
+
+Cases:
+- "encode_image": decode, resize and encode a synthetic 1920x1080 camera frame, with the
+  fixed default size and with the live image sizing policy.
+- "get_cached_image": the floorplan lookup, on a miss (cache cleared first) and on a hit.
+- "create_prompt": build the chat messages for one live frame, and the serialised body.
+- "parse_content": extract the navigation JSON from a fenced model reply.
+- "local_cues": the local pre-filter (exit sign and obstacle cues) on a decoded 1920x1080
+  frame; it runs on every live frame and should stay well under 50 ms.
+- "transcribe_audio": Whisper on a few seconds of synthetic audio. It only runs with
+  `--whisper`, because loading the model takes far longer than the other cases.
+"""
+import argparse
+import os
+import tempfile
+import cv2
+import numpy as np
+from benchmarks.common import make_wav, synthetic_signal, time_call, write_results
+from services.mistral_service import mistral_service
+from utils.frame_cues import detect_cues
+from utils.image_processing import encode_image, get_cached_image, image_cache, read_image
+from utils.image_sizing import FLOORPLAN, LIVE
+
+REPLY = '```json\n{"current_location": "Corridor", "plan": ["Walk straight ahead for about 10 steps", "Turn right"], "current_action": "Walk straight ahead"}\n```'
+
+def synthetic_jpeg(width, height, seed=0):
+    """
+    A JPEG with smooth gradients and noise, so it compresses roughly like a photo.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    img = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=2)
+    img += rng.normal(0, 12, img.shape)
+    success, buffer = cv2.imencode(".jpg", np.clip(img, 0, 255).astype(np.uint8), [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if not success:
+        raise ValueError("Failed to encode the synthetic image")
+    return buffer.tobytes()
+
+def summary(timing):
+    timing.pop("result")
+    return timing
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--whisper", action="store_true", help="Also benchmark Whisper inference")
+    parser.add_argument("--audio-seconds", type=float, default=5.0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    frame = synthetic_jpeg(1920, 1080)
+    results = {
+        "encode_image": {
+            "input_bytes": len(frame),
+            "default_size": summary(time_call(lambda: encode_image(frame), repeats=args.repeats)),
+            "live_policy": summary(time_call(lambda: encode_image(frame, role=LIVE), repeats=args.repeats)),
+        },
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        floorplan_path = os.path.join(directory, "floorplan.jpg")
+        with open(floorplan_path, "wb") as f:
+            f.write(synthetic_jpeg(2000, 1400, seed=1))
+
+        def miss():
+            image_cache.clear()
+            return get_cached_image(floorplan_path, role=FLOORPLAN)
+
+        results["get_cached_image"] = {
+            "miss": summary(time_call(miss, repeats=args.repeats)),
+            "hit": summary(time_call(lambda: get_cached_image(floorplan_path, role=FLOORPLAN), repeats=args.repeats)),
+        }
+        floorplan = get_cached_image(floorplan_path, role=FLOORPLAN)
+
+    live = encode_image(frame, role=LIVE)
+    task, transcription = "Help me find the fire exit", "Where is the nearest fire exit?"
+    results["create_prompt"] = {
+        "messages": summary(time_call(lambda: mistral_service.create_prompt(task, floorplan, live, transcription), repeats=args.repeats)),
+        "serialized_body": summary(time_call(lambda: mistral_service.build_prompt(task, floorplan, [live], transcription).body, repeats=args.repeats)),
+    }
+    results["parse_content"] = summary(time_call(lambda: mistral_service.parse_content(REPLY), repeats=args.repeats))
+    decoded = read_image(frame)
+    results["local_cues"] = summary(time_call(lambda: detect_cues(decoded), repeats=args.repeats))
+
+    if args.whisper:
+        try:
+            from services.whisper_service import get_whisper_service
+        except ImportError as e:
+            results["transcribe_audio"] = {"error": f"Whisper is not available: {e}"}
+        else:
+            service = get_whisper_service()
+            audio = make_wav(synthetic_signal(args.audio_seconds, 16000, 1), 16000)
+            results["transcribe_audio"] = {
+                "audio_seconds": args.audio_seconds,
+                **summary(time_call(lambda: service.transcribe(audio), repeats=max(1, args.repeats // 4))),
+            }
+
+    write_results("micro", results, args.output)
+
+if __name__ == "__main__":
+    main()
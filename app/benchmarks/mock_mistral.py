@@ -0,0 +1,173 @@
+"""
+A local stand-in for the Mistral chat-completions endpoint, for load tests that should
+not depend on (or pay for) the real API.
+
+Run from the app directory:
+
+    python -m benchmarks.mock_mistral --port 8001 --latency-ms 800 --jitter-ms 200 --rate-limit-ratio 0.05 --malformed-ratio 0.02
+
+and point the application at it:
+
+    MISTRAL_API_URL=http://127.0.0.1:8001/v1/chat/completions uvicorn main:app
+
+Replies are navigation results for every live frame in the request (one object, a list,
+or {"frames": [...]} in JSON mode), in plain or streaming (server-sent events) mode.
+A fraction of requests is answered with 429 and a Retry-After header, and a fraction
+with replies that are not valid JSON, to exercise the scheduler's retries and the
+parser's error handling. GET /stats reports what was served.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+NAVIGATION_RESULT = {
+    "current_location": "Corridor next to the kitchen",
+    "current_position": {"x": 0.25, "y": 0.7},
+    "target_position": {"x": 0.8, "y": 0.15},
+    "plan": ["Walk straight ahead for about 10 steps", "Turn right at the end of the corridor", "The fire exit is on your left"],
+    "current_action": "Walk straight ahead for about 10 steps",
+}
+
+# Replies that fail JSON parsing in different ways
+MALFORMED_REPLIES = [
+    "I'm sorry, I can't see the floorplan clearly enough to help.",
+    '```json\n{"current_location": "Corridor", "plan": ["Walk straight ahead"\n```',
+    '{"current_location": "Corridor", "plan": [Walk straight ahead]}',
+]
+
+# Characters per streamed chunk, roughly a token or two
+STREAM_CHUNK_SIZE = 8
+
+# Reported usage: text averages about 4 characters per token, images are counted at a typical budget
+IMAGE_TOKENS = 1500
+
+class MockOptions:
+    def __init__(self, latency_ms: float = 500.0, jitter_ms: float = 0.0, rate_limit_ratio: float = 0.0, retry_after_seconds: float = 1.0,
+                 malformed_ratio: float = 0.0, seed: int = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after_seconds = retry_after_seconds
+        self.malformed_ratio = malformed_ratio
+        self.random = random.Random(seed)
+
+    def latency(self) -> float:
+        return max(0.0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+def live_frame_count(messages: list) -> int:
+    """
+    Counts the live frames in a request: every image after the floorplan.
+    """
+    images = sum(
+        1
+        for message in messages if isinstance(message.get("content"), list)
+        for part in message["content"] if part.get("type") == "image_url"
+    )
+    return max(1, images - 1)
+
+def prompt_tokens(messages: list) -> int:
+    tokens = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens += len(content) // 4
+            continue
+        for part in content or []:
+            tokens += IMAGE_TOKENS if part.get("type") == "image_url" else len(part.get("text", "")) // 4
+    return tokens
+
+def navigation_reply(frames: int, json_mode: bool) -> str:
+    if frames == 1:
+        result = NAVIGATION_RESULT
+    elif json_mode:
+        result = {"frames": [NAVIGATION_RESULT] * frames}
+    else:
+        result = [NAVIGATION_RESULT] * frames
+    serialized = json.dumps(result)
+    # JSON mode replies are bare JSON, otherwise the model tends to fence it
+    return serialized if json_mode else f"```json\n{serialized}\n```"
+
+def create_app(options: MockOptions) -> FastAPI:
+    app = FastAPI(title="Mock Mistral chat completions")
+    stats = Counter()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        if options.random.random() < options.rate_limit_ratio:
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                content={"message": "Requests rate limit exceeded"},
+                headers={"Retry-After": str(options.retry_after_seconds)},
+            )
+
+        messages = body.get("messages", [])
+        frames = live_frame_count(messages)
+        stats["frames"] += frames
+        if options.random.random() < options.malformed_ratio:
+            stats["malformed"] += 1
+            content = options.random.choice(MALFORMED_REPLIES)
+        else:
+            content = navigation_reply(frames, body.get("response_format", {}).get("type") == "json_object")
+
+        prompt = prompt_tokens(messages)
+        usage = {"prompt_tokens": prompt, "completion_tokens": len(content) // 4, "total_tokens": prompt + len(content) // 4}
+        latency = options.latency()
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+            return {
+                "id": f"mock-{stats['requests']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        chunks = [content[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(content), STREAM_CHUNK_SIZE)]
+
+        async def events():
+            # Half the latency before the first token, the rest spread over the reply
+            await asyncio.sleep(latency / 2)
+            for index, chunk in enumerate(chunks):
+                payload = {"choices": [{"index": 0, "delta": {"content": chunk}}]}
+                if index == len(chunks) - 1:
+                    payload["usage"] = usage
+                yield f"data: {json.dumps(payload)}\n\n"
+                await asyncio.sleep(latency / 2 / len(chunks))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return dict(stats)
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=500.0, help="Mean time to answer a request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Latency varies uniformly by up to this much")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after-seconds", type=float, default=1.0)
+    parser.add_argument("--malformed-ratio", type=float, default=0.0, help="Fraction of replies that are not valid JSON")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import uvicorn
+    options = MockOptions(args.latency_ms, args.jitter_ms, args.rate_limit_ratio, args.retry_after_seconds, args.malformed_ratio, args.seed)
+    uvicorn.run(create_app(options), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
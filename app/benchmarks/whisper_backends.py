@@ -0,0 +1,91 @@
+"""
+Compares the Whisper CPU inference backends on the bundled sample audio.
+
+Run from the app directory:
+
+    python -m benchmarks.whisper_backends --backends none int8 compile --output whisper_backends.json
+
+Each backend transcribes every clip in data/live/audio `--repeats` times after a warm-up.
+Latency is reported per clip; accuracy is the word error rate against the transcripts of
+the reference backend (float32, "none"). Decoding is greedy, so runs are reproducible.
+"""
+import argparse
+import os
+import re
+import time
+import torch
+from benchmarks.common import time_call, write_results
+from services.whisper_service import WhisperService, CPU_BACKENDS
+
+AUDIO_DIR = "data/live/audio"
+
+def normalize_words(text):
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+def word_error_rate(reference, hypothesis):
+    """
+    Word-level Levenshtein distance between two transcripts, divided by the reference length.
+    """
+    reference, hypothesis = normalize_words(reference), normalize_words(hypothesis)
+    if not reference:
+        return 0.0 if not hypothesis else 1.0
+
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, start=1):
+        current = [i] + [0] * len(hypothesis)
+        for j, hyp_word in enumerate(hypothesis, start=1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word),
+            )
+        previous = current
+    return previous[-1] / len(reference)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["none", "int8", "compile"], choices=CPU_BACKENDS)
+    parser.add_argument("--reference", default="none", choices=CPU_BACKENDS)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    clips = sorted(f for f in os.listdir(AUDIO_DIR) if f.endswith((".mp3", ".wav", ".flac")))
+    audio = {}
+    for clip in clips:
+        with open(os.path.join(AUDIO_DIR, clip), "rb") as f:
+            audio[clip] = f.read()
+
+    backends = [args.reference] + [b for b in args.backends if b != args.reference]
+    transcripts = {}
+    results = {}
+    for backend in backends:
+        start = time.perf_counter()
+        service = WhisperService(cpu_backend=backend)
+        service.warm_up()
+        load_seconds = time.perf_counter() - start
+
+        clip_results = {}
+        for clip, data in audio.items():
+            timing = time_call(lambda: service.transcribe(data), repeats=args.repeats, warmup=0)
+            text, _ = timing.pop("result")
+            transcripts.setdefault(backend, {})[clip] = text
+            clip_results[clip] = {
+                **timing,
+                "text": text,
+                "wer": round(word_error_rate(transcripts[args.reference][clip], text), 4),
+            }
+
+        results[backend] = {
+            "load_and_warmup_seconds": round(load_seconds, 2),
+            "total_p50_ms": round(sum(c["p50_ms"] for c in clip_results.values()), 3),
+            "mean_wer": round(sum(c["wer"] for c in clip_results.values()) / max(len(clip_results), 1), 4),
+            "clips": clip_results,
+        }
+        del service
+
+    write_results("whisper_backends", {"torch_threads": torch.get_num_threads(), "backends": results}, args.output)
+
+if __name__ == "__main__":
+    main()
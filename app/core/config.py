@@ -4,9 +4,118 @@ class Settings(BaseSettings):
     PROJECT_NAME: str = "Vision-Impaired Assistance Application"
     PROJECT_VERSION: str = "0.1.0"
     MISTRAL_API_KEY: str
+    # Level of the application's log records: DEBUG also logs the duration of every processing stage
+    LOG_LEVEL: str = "INFO"
     LIVE_IMAGE_PATH: str = "data/live/live1.jpg"
     # FLOORPLAN_IMAGE_PATH: str = "data/preload/floorplan.jpg"
     FLOORPLAN_IMAGE_PATH: str = "data/preload/floorplan2.jpeg"
+    # Venues served by this deployment; the default venue uses FLOORPLAN_IMAGE_PATH unless the manifest lists it
+    FLOORPLAN_MANIFEST_PATH: str = "data/preload/venues.json"
+    DEFAULT_VENUE_ID: str = "default"
+    # Memory budget for the floorplans and occupancy grids kept by services.floorplan_registry
+    FLOORPLAN_REGISTRY_MAX_BYTES: int = 64 * 1024 * 1024
+    # How often a venue's manifest entry and floorplan file are checked for changes
+    FLOORPLAN_RELOAD_INTERVAL_SECONDS: float = 2.0
+    MISTRAL_API_URL: str = "https://api.mistral.ai/v1/chat/completions"
+    # Model routing (services.model_router): the primary model and comma-separated fallback models
+    # (e.g. smaller ones), tried in that order within MODEL_DEADLINE_SECONDS; the primary model has
+    # MODEL_PRIMARY_DEADLINE_SHARE of it, the fallbacks share the rest. Requests are hedged with a
+    # second call once they take longer than this percentile of recent primary answers, 0 disables
+    MISTRAL_MODEL: str = "pixtral-12b-2409"
+    MISTRAL_FALLBACK_MODELS: str = ""
+    MODEL_DEADLINE_SECONDS: float = 10.0
+    MODEL_PRIMARY_DEADLINE_SHARE: float = 0.6
+    MODEL_HEDGE_PERCENTILE: float = 0.95
+    MODEL_HEDGE_MIN_SAMPLES: int = 20
+    # Timeouts of a single HTTP call to the Mistral API: connecting, and waiting for data
+    MISTRAL_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    MISTRAL_READ_TIMEOUT_SECONDS: float = 30.0
+    # Keep-alive pool shared by all async requests to the Mistral API
+    MISTRAL_MAX_CONNECTIONS: int = 8
+    # Maximum number of frames sent to the model at the same time in /image/navigate
+    NAVIGATE_CONCURRENCY: int = 4
+    # Live frames sent together in one model request in /image/navigate, sharing one copy of the floorplan
+    FRAMES_PER_REQUEST: int = 1
+    # Request replies as a JSON object through the API's response_format
+    MISTRAL_JSON_MODE: bool = False
+    # Local route planning: the model only localises the user, routes come from an occupancy grid of the floorplan
+    LOCAL_ROUTE_PLANNING: bool = False
+    FLOORPLAN_GRAPH_CACHE_DIR: str = "data/cache/floorplan_graphs"
+    FLOORPLAN_GRID_MAX_CELLS: int = 200
+    FLOORPLAN_WALL_PENALTY: float = 2.0
+    # Scale of the floorplan image, 0 when unknown
+    FLOORPLAN_METERS_PER_PIXEL: float = 0.0
+    # Bounds of the queues between the stages of services.navigation_pipeline: decoded frames
+    # waiting to be encoded, and encoded key frames waiting for a model call
+    PIPELINE_DECODED_QUEUE_SIZE: int = 4
+    PIPELINE_ENCODED_QUEUE_SIZE: int = 32
+    # Navigation sessions (/image/navigate/session): "memory" or "sqlite" store, idle time before a
+    # session expires and the most sessions kept in memory
+    SESSION_STORE_BACKEND: str = "memory"
+    SESSION_STORE_PATH: str = "data/cache/sessions.sqlite3"
+    SESSION_TTL_SECONDS: int = 15 * 60
+    SESSION_STORE_MAX_SESSIONS: int = 10000
+    # Reply budget of the progress check sent for later frames of a session, and how many
+    # progress checks are made before the plan is made again regardless
+    PROGRESS_CHECK_MAX_TOKENS: int = 96
+    SESSION_MAX_PROGRESS_CHECKS: int = 20
+    # Local pre-filter (utils.frame_cues) run on live frames before the model, in the session, video
+    # and voice pipelines: frames whose cues match the last frame sent reuse its answer for up to
+    # LOCAL_GATE_MAX_SKIPPED_FRAMES frames, and obstacles right in front of the person are reported
+    # at once without a model call
+    LOCAL_PREFILTER_ENABLED: bool = True
+    LOCAL_GATE_MAX_SKIPPED_FRAMES: int = 5
+    # Edge density (0 to 1) of the walking path above which it counts as obstructed, and of its
+    # nearest rows above which the obstacle is an urgent hazard
+    OBSTACLE_EDGE_DENSITY: float = 0.12
+    OBSTACLE_URGENT_EDGE_DENSITY: float = 0.2
+    # Smallest green sign region counted as an exit sign, as a fraction of the frame
+    EXIT_SIGN_MIN_AREA: float = 0.002
+    # Memory budget for the encoded images kept by utils.image_processing.image_cache
+    IMAGE_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    # Frames that differ from the last frame sent to the model by less than this
+    # (mean absolute difference of grayscale thumbnails, 0 to 1) are skipped; 0 disables
+    KEYFRAME_DIFF_THRESHOLD: float = 0.02
+    # Threads used for batch image preprocessing, 0 uses one per CPU core
+    IMAGE_PREPROCESS_WORKERS: int = 0
+    # Sizing of images sent to the vision model, per role: longest edge, image-token budget and JPEG quality
+    FLOORPLAN_IMAGE_MAX_EDGE: int = 1024
+    FLOORPLAN_IMAGE_TOKEN_BUDGET: int = 2500
+    FLOORPLAN_JPEG_QUALITY: int = 85
+    LIVE_IMAGE_MAX_EDGE: int = 1024
+    LIVE_IMAGE_TOKEN_BUDGET: int = 1200
+    LIVE_JPEG_QUALITY: int = 70
+    # On-disk cache of model responses, keyed by a hash of the request body
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_PATH: str = "data/cache/responses.sqlite3"
+    RESPONSE_CACHE_TTL_SECONDS: int = 24 * 60 * 60
+    RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    # Outbound request budget for the Mistral API, match these to the account's rate limits
+    MISTRAL_REQUESTS_PER_SECOND: float = 1.0
+    MISTRAL_TOKENS_PER_MINUTE: int = 500000
+    MISTRAL_MAX_RETRIES: int = 3
+    MISTRAL_BACKOFF_BASE_SECONDS: float = 0.5
+    MISTRAL_BACKOFF_MAX_SECONDS: float = 8.0
+    WHISPER_MODEL: str = "openai/whisper-large-v3-turbo"
+    # When to load the Whisper model: "eager" (before serving), "background" (in a thread at startup) or "lazy" (on first use)
+    WHISPER_LOAD_MODE: str = "background"
+    WHISPER_WARMUP: bool = True
+    # CPU inference backend used when no GPU is available: "none" (float32), "int8", "compile" or "onnx"
+    WHISPER_CPU_BACKEND: str = "none"
+    # Where the "onnx" backend keeps its export of WHISPER_MODEL, so only the first start exports it
+    WHISPER_ONNX_EXPORT_DIR: str = "data/cache/whisper_onnx"
+    # Number of threads torch uses for CPU inference, 0 keeps the torch default
+    WHISPER_CPU_THREADS: int = 0
+    # Concurrent /audio/process requests are transcribed together in batches of up to
+    # this size, waiting at most this long for a batch to fill
+    WHISPER_MAX_BATCH_SIZE: int = 8
+    WHISPER_BATCH_MAX_WAIT_MS: float = 10.0
+    # Live transcription over /audio/stream: RMS level above which a frame counts as speech,
+    # silence that ends an utterance, interval between partial results and the longest utterance kept
+    STREAM_VAD_ENERGY_THRESHOLD: float = 0.01
+    STREAM_SILENCE_SECONDS: float = 0.6
+    STREAM_PARTIAL_INTERVAL_SECONDS: float = 1.0
+    STREAM_MAX_UTTERANCE_SECONDS: float = 20.0
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,174 @@
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from core.config import settings
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+# ID of the HTTP request being served, attached to every log record and span
+request_id_var = contextvars.ContextVar("request_id", default="-")
+# Stage timings of the HTTP request being served, as (stage, seconds) pairs
+request_spans_var = contextvars.ContextVar("request_spans", default=None)
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+def configure_logging(level: str = None):
+    """
+    Sends the application's log records to stderr with the request ID of the request
+    being served, at `level` (LOG_LEVEL by default).
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler.addFilter(RequestIdFilter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel((level or settings.LOG_LEVEL).upper())
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
+
+# Stage latencies range from well under a millisecond (prompt build) to tens of seconds (model round-trip)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Histogram:
+    """
+    A Prometheus histogram with one series per combination of label values.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (not cumulative), the last slot is +Inf, then sum and count
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            labels = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = ",".join(labels + [f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = "{" + ",".join(labels) + "}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {values[-2]}")
+            lines.append(f"{self.name}_count{suffix} {values[-1]}")
+        return lines
+
+class MetricsRegistry:
+    """
+    The metrics exposed on /metrics, in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, documentation, labelnames, buckets)
+            return self._metrics[name]
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Process-wide metrics registry
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    "assistant_stage_duration_seconds",
+    "Time spent in each processing stage.",
+    ("stage",),
+)
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "assistant_http_request_duration_seconds",
+    "Time from receiving an HTTP request to sending the response headers.",
+    ("method", "route", "status"),
+)
+MODEL_ANSWER_SECONDS = metrics.histogram(
+    "assistant_model_answer_duration_seconds",
+    "Time until a model request was answered, by the routing tier that answered it.",
+    ("tier", "model"),
+)
+
+_tracer = trace.get_tracer("vision-assistant") if trace is not None else None
+_logger = get_logger(__name__)
+
+@contextmanager
+def span(stage: str, **attributes):
+    """
+    Times a processing stage: the duration goes into the stage histogram, the current
+    request's span list (logged with the request) and, when OpenTelemetry is installed,
+    a tracing span carrying `attributes`.
+    """
+    start = time.perf_counter()
+    otel_span = _tracer.start_as_current_span(stage, attributes=attributes) if _tracer is not None else None
+    try:
+        if otel_span is not None:
+            with otel_span:
+                yield
+        else:
+            yield
+    finally:
+        record_stage(stage, time.perf_counter() - start, **attributes)
+
+def record_stage(stage: str, elapsed: float, **attributes):
+    """
+    Records a stage timed by the caller, for stages that span the yields of a generator
+    and so cannot be wrapped in `span`.
+    """
+    STAGE_SECONDS.observe(elapsed, stage=stage)
+    spans = request_spans_var.get()
+    if spans is not None:
+        spans.append((stage, elapsed))
+    _logger.debug("%s took %.1f ms %s", stage, elapsed * 1000, attributes or "")
+
+def summarize_spans(spans: list) -> str:
+    """
+    Formats a request's stage timings as "stage=12.3ms (x2)", one entry per stage.
+    """
+    totals = {}
+    for stage, elapsed in spans:
+        total, count = totals.get(stage, (0.0, 0))
+        totals[stage] = (total + elapsed, count + 1)
+    return ", ".join(
+        f"{stage}={total * 1000:.1f}ms" + (f" (x{count})" if count > 1 else "")
+        for stage, (total, count) in totals.items()
+    )
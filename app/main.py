@@ -1,11 +1,24 @@
-from fastapi import FastAPI
+import re
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from api.routes import audio, image
 from core.config import settings
-from services.whisper_service import WhisperService
-from services.mistral_service import MistralService
-from utils.image_processing import encode_image, get_cached_image
+from core.telemetry import (
+    HTTP_REQUEST_SECONDS, configure_logging, get_logger, metrics, request_id_var, request_spans_var, summarize_spans,
+)
+from services.mistral_service import mistral_service
+from utils.image_processing import encode_image, get_cached_image, image_cache
+from utils.image_sizing import FLOORPLAN
 from fastapi.middleware.cors import CORSMiddleware
 
+configure_logging()
+logger = get_logger(__name__)
+
+# Request IDs accepted from clients, anything else is replaced by a generated one
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
 app = FastAPI(title=settings.PROJECT_NAME, version=settings.PROJECT_VERSION)
 
 app.add_middleware(
@@ -14,11 +27,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
-# Setup services
-whisper_service = WhisperService()
-mistral_service = MistralService(settings.MISTRAL_API_KEY)
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """
+    Tags the request with an ID (the client's X-Request-ID, or a new one), returned in the
+    X-Request-ID response header and attached to its log records, and records its latency
+    and stage timings.
+    """
+    request_id = request.headers.get("X-Request-ID", "")
+    if not REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex
+    request_id_var.set(request_id)
+    spans = []
+    request_spans_var.set(spans)
+
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        # None of our routes take path parameters, so matched paths keep the label set small; unknown paths share one label
+        route = request.url.path if request.scope.get("endpoint") is not None else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(elapsed, method=request.method, route=route, status=status)
+        logger.info("%s %s %s in %.1f ms%s", request.method, request.url.path, status, elapsed * 1000,
+                    f" ({summarize_spans(spans)})" if spans else "")
 
 # Include routers
 app.include_router(audio.router, prefix="/audio", tags=["audio"])
@@ -34,16 +73,27 @@ async def startup_event():
         # Encode images on startup
         for path in [reduced_image_path]:
         # for path in [reduced_image_path, live_image_path]:
-            base64_image = get_cached_image(path)
+            base64_image = get_cached_image(path, role=FLOORPLAN)
             if base64_image is None:
                 raise ValueError(f"Failed to encode image: {path}")
+        logger.info("Image cache: %s", image_cache.stats())
     except Exception as e:
-        print(f"Error during startup: {str(e)}")
+        logger.error("Error during startup: %s", e)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Close the pooled connections to the Mistral API
+    await mistral_service.aclose()
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Vision-Impaired Assistance Application"}
 
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 
 if __name__ == "__main__":
     import uvicorn
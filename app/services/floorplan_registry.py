@@ -0,0 +1,292 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+from core.config import settings
+from core.telemetry import get_logger
+from utils.image_processing import image_cache, get_preprocess_executor, CachedImage
+from utils.image_sizing import FLOORPLAN
+from utils.floorplan_graph import FloorplanGraph, load_floorplan_graph
+
+logger = get_logger(__name__)
+
+class VenueAssets(NamedTuple):
+    """
+    A venue's loaded assets, as handed out by FloorplanRegistry. Unloading the venue does
+    not affect a snapshot that is already in use.
+    """
+    venue_id: str
+    name: str
+    floorplan: CachedImage
+    graph: FloorplanGraph
+    meters_per_pixel: float
+
+class Venue:
+    """
+    One building served by the deployment: its floorplan and the assets derived from it.
+
+    `floorplan` (the encoded image) and `graph` (the occupancy grid for local route
+    planning) are loaded by FloorplanRegistry and may be dropped again to stay within
+    its memory budget, so they are only read and changed under `lock`; requests use a
+    VenueAssets snapshot instead.
+    """
+
+    def __init__(self, venue_id: str, name: str, floorplan_path: str, meters_per_pixel: float = None):
+        self.venue_id = venue_id
+        self.name = name
+        self.floorplan_path = floorplan_path
+        self.meters_per_pixel = settings.FLOORPLAN_METERS_PER_PIXEL if meters_per_pixel is None else meters_per_pixel
+        self.floorplan: CachedImage = None
+        self.graph: FloorplanGraph = None
+        # (size, mtime) of the floorplan file the assets were derived from
+        self.signature = None
+        self.lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        size = self.floorplan.size if self.floorplan is not None else 0
+        if self.graph is not None:
+            size += self.graph.nbytes
+        return size
+
+    def file_signature(self):
+        try:
+            stat = os.stat(self.floorplan_path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def snapshot(self) -> VenueAssets:
+        return VenueAssets(self.venue_id, self.name, self.floorplan, self.graph, self.meters_per_pixel)
+
+    def unload(self):
+        self.floorplan = None
+        self.graph = None
+        self.signature = None
+
+    def info(self) -> dict:
+        return {
+            "venue_id": self.venue_id,
+            "name": self.name,
+            "floorplan_path": self.floorplan_path,
+            "loaded": self.floorplan is not None,
+            "graph_loaded": self.graph is not None,
+            "bytes": self.size,
+        }
+
+class FloorplanRegistry:
+    """
+    The venues served by this deployment, keyed by venue ID.
+
+    Venues are listed in a JSON manifest:
+
+        {"venues": [{"id": "codenode", "name": "CodeNode", "floorplan": "codenode.jpeg", "meters_per_pixel": 0.05}]}
+
+    Floorplan paths are relative to the manifest's directory. The venue `default_venue_id`
+    always exists and falls back to `default_floorplan_path` when the manifest does not
+    list it. All floorplans are encoded in parallel by `load`; the encoded images and
+    occupancy grids stay in memory up to `max_bytes`, beyond which the least recently
+    used venues are unloaded and reloaded on their next use.
+
+    Changes are picked up without a restart: every lookup checks (at most once per
+    `reload_interval` seconds) whether the manifest or the venue's floorplan changed on
+    disk, and reloads what changed.
+    """
+
+    def __init__(self, manifest_path: str, default_venue_id: str, default_floorplan_path: str, max_bytes: int, reload_interval: float):
+        self.manifest_path = manifest_path
+        self.default_venue_id = default_venue_id
+        self.default_floorplan_path = default_floorplan_path
+        self.max_bytes = max_bytes
+        self.reload_interval = reload_interval
+        self._venues = {}
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._manifest_signature = None
+        self._manifest_checked_at = 0.0
+        self._venue_checked_at = {}
+        self.reloads = 0
+        self.evictions = 0
+
+    def _manifest_stat(self):
+        try:
+            stat = os.stat(self.manifest_path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _read_manifest(self) -> dict:
+        venues = {}
+        signature = self._manifest_stat()
+        if signature is not None:
+            try:
+                with open(self.manifest_path) as f:
+                    manifest = json.load(f)
+                base = os.path.dirname(self.manifest_path)
+                for entry in manifest.get("venues", []):
+                    venue_id = entry["id"]
+                    venues[venue_id] = Venue(
+                        venue_id, entry.get("name", venue_id), os.path.join(base, entry["floorplan"]), entry.get("meters_per_pixel"),
+                    )
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.error("Failed to read venue manifest %s: %s", self.manifest_path, e)
+                # Keep serving the venues we already know
+                return self._venues
+        if self.default_venue_id not in venues:
+            venues[self.default_venue_id] = Venue(self.default_venue_id, self.default_venue_id, self.default_floorplan_path)
+        self._manifest_signature = signature
+        return venues
+
+    def _refresh_manifest(self):
+        now = time.monotonic()
+        if now - self._manifest_checked_at < self.reload_interval:
+            return
+        self._manifest_checked_at = now
+        if self._manifest_stat() == self._manifest_signature:
+            return
+
+        logger.info("Venue manifest changed, reloading %s", self.manifest_path)
+        venues = self._read_manifest()
+        with self._lock:
+            for venue_id, venue in venues.items():
+                current = self._venues.get(venue_id)
+                # Keep the loaded assets of venues whose floorplan did not change
+                if current is not None and current.floorplan_path == venue.floorplan_path:
+                    current.name = venue.name
+                    current.meters_per_pixel = venue.meters_per_pixel
+                    venues[venue_id] = current
+            for venue_id in set(self._venues) - set(venues):
+                self._loaded.pop(venue_id, None)
+            self._venues = venues
+        self.reloads += 1
+
+    def load(self):
+        """
+        Reads the manifest and encodes every venue's floorplan in parallel, also building
+        the occupancy grids when local route planning is enabled.
+        """
+        self._venues = self._read_manifest()
+        self._manifest_checked_at = time.monotonic()
+        with_graph = settings.LOCAL_ROUTE_PLANNING
+        executor = get_preprocess_executor()
+        venues = list(self._venues.values())
+        loaded = executor.map(lambda venue: self._load_venue(venue, with_graph), venues)
+        for venue, assets in zip(venues, loaded):
+            if assets is None:
+                logger.error("Failed to load floorplan of venue %s: %s", venue.venue_id, venue.floorplan_path)
+        logger.info("Floorplan registry: %s", self.stats())
+
+    def venues(self) -> list:
+        self._refresh_manifest()
+        return [self._venues[venue_id] for venue_id in sorted(self._venues)]
+
+    def _load_venue(self, venue: Venue, with_graph: bool = False):
+        """
+        (Re)loads a venue's assets if they are missing or its floorplan changed on disk.
+
+        Returns:
+        - VenueAssets: A snapshot of the loaded assets, or None if they cannot be loaded.
+        """
+        with venue.lock:
+            signature = venue.file_signature()
+            if signature is None:
+                return None
+            if signature != venue.signature:
+                if venue.signature is not None:
+                    logger.info("Floorplan of venue %s changed, reloading", venue.venue_id)
+                    self.reloads += 1
+                venue.unload()
+            if venue.floorplan is None:
+                venue.floorplan = image_cache.get_entry(venue.floorplan_path, role=FLOORPLAN)
+                if venue.floorplan is None:
+                    return None
+                venue.signature = signature
+            if with_graph and venue.graph is None:
+                venue.graph = load_floorplan_graph(venue.floorplan_path)
+                if venue.graph is None:
+                    return None
+                venue.graph.meters_per_pixel = venue.meters_per_pixel
+            assets = venue.snapshot()
+        self._touch(venue)
+        return assets
+
+    def _touch(self, venue: Venue):
+        with self._lock:
+            self._loaded[venue.venue_id] = venue
+            self._loaded.move_to_end(venue.venue_id)
+            total = sum(loaded.size for loaded in self._loaded.values())
+            # Never evict the venue that is being used
+            evicted = []
+            while total > self.max_bytes and len(self._loaded) > 1:
+                _, least_recent = self._loaded.popitem(last=False)
+                total -= least_recent.size
+                evicted.append(least_recent)
+
+        # Unload under the venue's lock, so a load in progress is not undone half-way
+        for least_recent in evicted:
+            with least_recent.lock:
+                with self._lock:
+                    # Used again since it was picked for eviction
+                    if least_recent.venue_id in self._loaded:
+                        continue
+                    self.evictions += 1
+                least_recent.unload()
+
+    def _get(self, venue_id: str, with_graph: bool) -> VenueAssets:
+        self._refresh_manifest()
+        venue = self._venues.get(venue_id)
+        if venue is None:
+            raise KeyError(venue_id)
+
+        now = time.monotonic()
+        assets = None
+        if now - self._venue_checked_at.get(venue_id, 0.0) < self.reload_interval:
+            with venue.lock:
+                assets = venue.snapshot()
+            if assets.floorplan is None or (with_graph and assets.graph is None):
+                assets = None
+        if assets is None:
+            self._venue_checked_at[venue_id] = now
+            assets = self._load_venue(venue, with_graph)
+            if assets is None:
+                raise ValueError(f"Failed to load floorplan of venue {venue_id}")
+        else:
+            self._touch(venue)
+        return assets
+
+    def get(self, venue_id: str) -> VenueAssets:
+        """
+        Returns a snapshot of the venue with its encoded floorplan loaded.
+
+        :raises KeyError: If the venue is unknown
+        :raises ValueError: If its floorplan cannot be loaded
+        """
+        return self._get(venue_id, with_graph=False)
+
+    def get_with_graph(self, venue_id: str) -> VenueAssets:
+        """
+        Same as get, with the venue's occupancy grid loaded as well.
+        """
+        return self._get(venue_id, with_graph=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "venues": len(self._venues),
+                "loaded": list(self._loaded),
+                "bytes": sum(venue.size for venue in self._loaded.values()),
+                "max_bytes": self.max_bytes,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+            }
+
+# Process-wide registry of the venues' floorplans
+floorplan_registry = FloorplanRegistry(
+    settings.FLOORPLAN_MANIFEST_PATH,
+    settings.DEFAULT_VENUE_ID,
+    settings.FLOORPLAN_IMAGE_PATH,
+    settings.FLOORPLAN_REGISTRY_MAX_BYTES,
+    settings.FLOORPLAN_RELOAD_INTERVAL_SECONDS,
+)
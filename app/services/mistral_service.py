@@ -1,48 +1,84 @@
-import requests
+import asyncio
+import hashlib
+import httpx
 import json
-from core.config import settings
-from requests.exceptions import SSLError, RequestException
 import time
-
-class MistralService:
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.url = "https://api.mistral.ai/v1/chat/completions"
-        self.headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-
-    def create_prompt(self, task: str, base64_floor_plan: str, base64_live_image: str, transcription: str) -> list:
-        prompt = f"""
+from collections import OrderedDict
+from core.config import settings
+from core.telemetry import get_logger, record_stage, span
+from services.response_cache import ResponseCache, response_cache
+from services.request_scheduler import RequestScheduler, request_scheduler
+from services.model_router import PRIMARY, ModelDeadlineExceeded, ModelRouter, StreamDeadlineExceeded, model_router
+from services.session_store import NavigationSession
+from utils.image_processing import base64_image_tokens
+from utils.image_sizing import POLICIES
+from utils.json_parsing import IncrementalJsonParser, extract_json
+
+logger = get_logger(__name__)
+
+# Rough token accounting for the tokens-per-minute budget: image tokens are read from the
+# JPEG dimensions, text averages about 4 characters per token. Images whose size cannot
+# be read are counted at the largest image-token budget.
+ESTIMATED_TOKENS_PER_IMAGE = max(policy.max_tokens for policy in POLICIES.values())
+ESTIMATED_COMPLETION_TOKENS = 512
+
+def estimate_content_tokens(content: list) -> int:
+    """
+    Estimates the prompt tokens of a list of message content parts.
+    """
+    tokens = 0
+    for part in content:
+        if part["type"] == "text":
+            tokens += len(part["text"]) // 4
+        elif part["type"] == "image_url":
+            tokens += image_url_tokens(part["image_url"])
+    return tokens
+
+def image_url_tokens(image_url: str) -> int:
+    """
+    Estimates the tokens of an image passed as a base64 JPEG data URL.
+    """
+    _, _, base64_image = image_url.partition("base64,")
+    return image_tokens(base64_image)
+
+def image_tokens(base64_image: str) -> int:
+    """
+    Estimates the tokens of a base64 JPEG.
+    """
+    try:
+        tokens = base64_image_tokens(base64_image)
+    except ValueError:
+        tokens = None
+    return tokens if tokens is not None else ESTIMATED_TOKENS_PER_IMAGE
+
+# The static instructions of the navigation prompt. They come first in every request,
+# followed by the floorplan, so consecutive requests share the longest possible prefix.
+NAVIGATION_INSTRUCTIONS = """
         Using the floor plan, live image, and audio transcription provided, perform the following:
 
         1. **Infer the current position** of the person based on the live image and audio transcription.
-        2. **Determine the target task** they want to accomplish based on the audio transcription: "{transcription}"
+        2. **Determine the target task** they want to accomplish based on the audio transcription.
         3. **Plan the optimal path** to reach the target location necessary to complete the task.
-        
-
-        Audio Transcription: {transcription}
 
         **Please provide the output in the following JSON format:**
 
-        ```{{
+        ```{
         "current_location": "Inferred current location",
         "target_task": "Task determined from audio transcription",
         "plan": [
-            {{
+            {
             "step_number": 1,
             "action": "Action description",
             "description": "Detailed description of the action"
-            }},
+            },
+            // Additional steps as needed
         ],
         "current_action": "Current action being performed"
-        }}
+        }
         ```
 
         **Notes:**
         - Ensure that each step in the plan is clear and actionable.
-        - You are in Europe, so the fire exit is green.
         - If there are multiple ways to perform a step, choose the most efficient one based on the floor plan.
         - If additional information is required to complete the task, indicate what is needed.
         - Provide detailed navigation instructions similar to Google Maps, including turns and approximate distances in steps.
@@ -51,272 +87,654 @@ class MistralService:
         Please generate the structured JSON response based on the above instructions.
         """
 
-        return [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": prompt
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": f"data:image/jpeg;base64,{base64_floor_plan}"
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": f"data:image/jpeg;base64,{base64_live_image}"
-                    }
-                ]
-            }
-        ]
+# Instructions used with local route planning: the model only localises the person and
+# the destination, the route is computed from the floorplan's occupancy grid
+LOCALIZATION_INSTRUCTIONS = """
+        Using the floor plan, live image, and audio transcription provided, perform the following:
 
-    def send_request(self, messages, max_retries=3, retry_delay=5):
-        data = {
-            "model": self.model,
-            "messages": messages
+        1. **Infer the current position** of the person based on the live image and audio transcription.
+        2. **Determine the target task** they want to accomplish based on the audio transcription.
+        3. **Locate the target** on the floor plan: the place where the task can be completed.
+
+        Positions are fractions of the floor plan image's width and height, measured from its
+        top left corner: {"x": 0.0, "y": 0.0} is the top left and {"x": 1.0, "y": 1.0} the bottom right.
+
+        **Please provide the output in the following JSON format:**
+
+        ```{
+        "current_location": "Inferred current location",
+        "current_position": {"x": 0.5, "y": 0.5},
+        "target_task": "Task determined from audio transcription",
+        "target_location": "Location where the task can be completed",
+        "target_position": {"x": 0.5, "y": 0.5}
         }
+        ```
 
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(self.url, headers=self.headers, data=json.dumps(data))
-                response.raise_for_status()
-                print(f"Response: {response}")
-
-                return response
-            except (SSLError, RequestException) as e:
-                if attempt == max_retries - 1:
-                    raise Exception(f"Failed to connect to Mistral API after {max_retries} attempts: {str(e)}")
-                print(f"Attempt {attempt + 1} failed. Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-
-    def process_task(self, task: str, base64_floor_plan: str, base64_live_image: str, transcription: str) -> dict:
-        messages = self.create_prompt(task, base64_floor_plan, base64_live_image, transcription)
-        # response = self.send_request(messages)
-        try:
-            response = self.send_request(messages)
-        except Exception as e:
-            print(f"Error: {str(e)}")
-            return {"error": "Failed to process the task"}
-        
-        if 'choices' in response and len(response['choices']) > 0:
-            content = response['choices'][0]['message']['content']
-            # Extract JSON from the content (assuming it's wrapped in ```json ... ```)
-            json_start = content.find('```json') + 7
-            json_end = content.rfind('```')
-            json_str = content[json_start:json_end].strip()
-            
-            try:
-                return json.loads(json_str)
-            except json.JSONDecodeError:
-                return {"error": "Failed to parse JSON response"}
-        else:
-            return {"error": "Unable to process the task"}
+        **Notes:**
+        - Do not plan the route, it is computed separately from the positions.
+        - Be as precise as possible with both positions.
 
-# Initialize the service
-mistral_service = MistralService(settings.MISTRAL_API_KEY)
-
-# class MistralService:
-#     def __init__(self, api_key: str):
-#         self.api_key = api_key
-#         self.url = "https://api.mistral.ai/v1/chat/completions"
-#         self.headers = {
-#             "Content-Type": "application/json",
-#             "Authorization": f"Bearer {self.api_key}"
-#         }
-
-#     def create_prompt(self, task: str, base64_floor_plan: str, base64_live_image: str) -> list:
-#         prompt = f"""
-#         Using the floor plan provided below and the live image, perform the following:
-
-#         1. **Infer the current position** of the person based on the live image.
-#         2. **Determine the target task** they want to accomplish (e.g., getting coffee).
-#         3. **Plan the optimal path** to reach the target location necessary to complete the task.
-
-#         **Please provide the output in the following JSON format:**
-
-#         ```{{
-#         "current_location": "Dining Area",
-#         "target_task": "{task}",
-#         "plan": [
-#             {{
-#             "step_number": 1,
-#             "action": "Identify Current Location",
-#             "description": "Confirm that the user is in the Dining Area based on the live image and floor plan."
-#             }},
-#             {{
-#             "step_number": 2,
-#             "action": "Navigate to Kitchen",
-#             "description": "Head towards the Kitchen, which is adjacent to the Dining Area."
-#             }},
-#             {{
-#             "step_number": 3,
-#             "action": "Locate Coffee Maker",
-#             "description": "Find the coffee maker on the kitchen countertops, specifically in the 'coffee' zone to the left of the kitchen."
-#             }},
-#             {{
-#             "step_number": 4,
-#             "action": "Prepare Coffee",
-#             "description": "Use the coffee maker to brew coffee."
-#             }}
-#         ],
-#         "current_action": "Identifying current location"
-#         }}
-#         ```
-
-#         **Notes:**
-#         - Ensure that each step in the plan is clear and actionable.
-#         - If there are multiple ways to perform a step, choose the most efficient one based on the floor plan.
-#         - If additional information is required to complete the task, indicate what is needed.
-#         - Provide detailed navigation instructions similar to Google Maps, including turns and approximate distances in steps.
-
-#         Please generate the structured JSON response based on the above instructions.
-#         """
-
-#         return [
-#             {
-#                 "role": "user",
-#                 "content": [
-#                     {
-#                         "type": "text",
-#                         "text": prompt
-#                     },
-#                     {
-#                         "type": "image_url",
-#                         "image_url": f"data:image/jpeg;base64,{base64_floor_plan}"
-#                     },
-#                     {
-#                         "type": "image_url",
-#                         "image_url": f"data:image/jpeg;base64,{base64_live_image}"
-#                     }
-#                 ]
-#             }
-#         ]
-
-#     def send_request(self, messages: list) -> dict:
-#         data = {
-#             "model": "pixtral-12b-2409",
-#             "messages": messages
-#         }
-
-#         response = requests.post(self.url, headers=self.headers, data=json.dumps(data))
-#         return response.json()
-
-#     def process_task(self, task: str, base64_floor_plan: str, base64_live_image: str) -> dict:
-#         messages = self.create_prompt(task, base64_floor_plan, base64_live_image)
-#         response = self.send_request(messages)
-        
-#         if 'choices' in response and len(response['choices']) > 0:
-#             content = response['choices'][0]['message']['content']
-#             # Extract JSON from the content (assuming it's wrapped in ```json ... ```)
-#             json_start = content.find('```json') + 7
-#             json_end = content.rfind('```')
-#             json_str = content[json_start:json_end].strip()
-            
-#             try:
-#                 return json.loads(json_str)
-#             except json.JSONDecodeError:
-#                 return {"error": "Failed to parse JSON response"}
-#         else:
-#             return {"error": "Unable to process the task"}
-
-# # Initialize the service
-# mistral_service = MistralService(settings.MISTRAL_API_KEY)
+        Please generate the structured JSON response based on the above instructions.
+        """
+
+# Instructions of the progress check sent for later frames of a navigation session: the plan
+# is already known (it is part of the request), so the model only reports progress along it
+PROGRESS_INSTRUCTIONS = """
+        A person is following a navigation plan on the floor plan provided. Using the floor plan,
+        the live image, the plan and their last known progress, check how they are progressing.
+
+        **Please provide the output in the following JSON format:**
+
+        ```{
+        "on_track": true,
+        "current_step": 2,
+        "current_location": "Inferred current location",
+        "arrived": false
+        }
+        ```
 
+        **Notes:**
+        - "current_step" is the number of the plan step the person is performing now.
+        - Set "on_track" to false if the person has left the planned route or the plan no longer fits what the live image shows.
+        - Set "arrived" to true once the person has reached the target.
+        - Answer with this JSON only, without explanations.
+        """
+
+MULTI_FRAME_INSTRUCTIONS = (
+    "The {count} live images below are consecutive frames from the person's camera, in order. "
+    "Provide one JSON object in the format above for each frame, as a JSON array in the same order."
+)
+
+# JSON mode only allows an object at the top level, so the per-frame results are wrapped
+MULTI_FRAME_JSON_MODE_INSTRUCTIONS = (
+    "The {count} live images below are consecutive frames from the person's camera, in order. "
+    'Provide one JSON object in the format above for each frame, as a JSON object {{"frames": [...]}} '
+    "with the frames in the same order."
+)
+
+# Streamed fields reported before the reply is complete, by their path within one frame's result
+EARLY_FIELDS = {
+    ("current_location",): "current_location",
+    ("plan", 0): "first_step",
+    ("current_position",): "current_position",
+    ("target_position",): "target_position",
+}
+
+def image_part(base64_image: str) -> dict:
+    return {
+        "type": "image_url",
+        "image_url": f"data:image/jpeg;base64,{base64_image}"
+    }
+
+class PromptPrefix:
+    """
+    The static part of a navigation prompt: the instructions and the floorplan.
+
+    The content parts are serialised to JSON once, when the prefix is built, so the
+    floorplan is not re-encoded for every request that uses it.
+    """
+
+    def __init__(self, base64_floor_plan: str, instructions: str = NAVIGATION_INSTRUCTIONS):
+        self.content = [
+            {
+                "type": "text",
+                "text": instructions
+            },
+            image_part(base64_floor_plan),
+        ]
+        # The parts without the enclosing brackets, ready to be spliced into a content array
+        self.serialized = json.dumps(self.content)[1:-1].encode("utf-8")
+        self.digest = hashlib.sha256(self.serialized).hexdigest()
+        self.tokens = estimate_content_tokens(self.content)
+
+def prompt_text(transcription: str, frames: int, json_mode: bool = False, context: str = None) -> str:
+    """
+    The text part of a prompt's per-request suffix.
+    """
+    text = f"Audio Transcription: {transcription}"
+    if context:
+        text += "\n\n" + context
+    if frames > 1:
+        instructions = MULTI_FRAME_JSON_MODE_INSTRUCTIONS if json_mode else MULTI_FRAME_INSTRUCTIONS
+        text += "\n\n" + instructions.format(count=frames)
+    return text
+
+class Prompt:
+    """
+    A navigation request for one or more live frames: the shared PromptPrefix followed by
+    the per-request suffix (transcription and live images).
+    """
+
+    def __init__(self, prefix: PromptPrefix, transcription: str, base64_live_images: list, json_mode: bool = False, context: str = None,
+                 max_tokens: int = None):
+        self.prefix = prefix
+        self.frames = len(base64_live_images)
+        self.json_mode = json_mode
+        # Caps the reply length, for prompts with a small output schema
+        self.max_tokens = max_tokens
+        text = prompt_text(transcription, self.frames, json_mode, context)
+        self.suffix = [{"type": "text", "text": text}] + [image_part(image) for image in base64_live_images]
+
+    @property
+    def messages(self) -> list:
+        return [{"role": "user", "content": self.prefix.content + self.suffix}]
+
+    @property
+    def body(self) -> bytes:
+        return self.serialize()
+
+    def serialize(self, stream: bool = False, model: str = None) -> bytes:
+        """
+        The serialised request body for `model` (the primary model by default), assembled
+        from the pre-serialised prefix.
+        """
+        suffix = json.dumps(self.suffix)[1:-1].encode("utf-8")
+        options = {}
+        if self.json_mode:
+            options["response_format"] = {"type": "json_object"}
+        if self.max_tokens:
+            options["max_tokens"] = self.max_tokens
+        if stream:
+            options["stream"] = True
+        parts = [
+            b'{"model": ', json.dumps(model or settings.MISTRAL_MODEL).encode("utf-8"),
+            b', "messages": [{"role": "user", "content": [', self.prefix.serialized, b", ", suffix, b"]}]",
+        ]
+        if options:
+            parts += [b", ", json.dumps(options)[1:-1].encode("utf-8")]
+        parts.append(b"}")
+        return b"".join(parts)
+
+    @property
+    def cache_key(self) -> str:
+        # Streaming does not change the reply, so streamed and plain requests share entries
+        suffix = json.dumps(self.suffix, sort_keys=True)
+        return hashlib.sha256(f"{settings.MISTRAL_MODEL}\n{self.json_mode}\n{self.max_tokens}\n{self.prefix.digest}\n{suffix}".encode("utf-8")).hexdigest()
+
+    @property
+    def question_key(self) -> str:
+        """
+        Identifies the question asked, regardless of the live images: requests with the
+        same key can fall back to each other's answers.
+        """
+        text = "\n".join(part["text"] for part in self.suffix if part["type"] == "text")
+        return hashlib.sha256(f"{self.json_mode}\n{self.prefix.digest}\n{text}".encode("utf-8")).hexdigest()
+
+    @property
+    def tokens(self) -> int:
+        completion_tokens = self.max_tokens or ESTIMATED_COMPLETION_TOKENS * self.frames
+        return self.prefix.tokens + estimate_content_tokens(self.suffix) + completion_tokens
 
 class MistralService:
-    def __init__(self, api_key: str):
+    # Prompt prefixes kept for reuse, one per floorplan and instructions
+    MAX_PROMPT_PREFIXES = 8
+
+    def __init__(self, api_key: str, url: str = None, max_connections: int = None, response_cache: ResponseCache = None,
+                 scheduler: RequestScheduler = None, json_mode: bool = None, router: ModelRouter = None):
         self.api_key = api_key
-        self.url = "https://api.mistral.ai/v1/chat/completions"
+        # The URL can point at a local stand-in for the chat-completions endpoint
+        self.url = url or settings.MISTRAL_API_URL
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
         }
+        self.max_connections = max_connections or settings.MISTRAL_MAX_CONNECTIONS
+        self._async_client = None
+        self.response_cache = response_cache
+        self.scheduler = scheduler
+        # Picks the model tier that answers each async request; without one, only the primary model is used
+        self.router = router
+        self._prompt_prefixes = OrderedDict()
+        # Ask for a JSON object through the API's response format instead of relying on the prompt alone
+        self.json_mode = settings.MISTRAL_JSON_MODE if json_mode is None else json_mode
+
+    def get_async_client(self) -> httpx.AsyncClient:
+        """
+        Returns the shared keep-alive client, creating it on first use so that every
+        async request reuses pooled TCP/TLS connections instead of opening new ones.
+        """
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(
+                headers=self.headers,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                timeout=httpx.Timeout(settings.MISTRAL_READ_TIMEOUT_SECONDS, connect=settings.MISTRAL_CONNECT_TIMEOUT_SECONDS),
+            )
+        return self._async_client
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
     def create_prompt(self, task: str, base64_floor_plan: str, base64_live_image: str, transcription: str) -> list:
-        prompt = f"""
-        Using the floor plan, live image, and audio transcription provided, perform the following:
+        return self.build_prompt(task, base64_floor_plan, [base64_live_image], transcription).messages
 
-        1. **Infer the current position** of the person based on the live image and audio transcription.
-        2. **Determine the target task** they want to accomplish based on the audio transcription: "{transcription}"
-        3. **Plan the optimal path** to reach the target location necessary to complete the task.
+    def get_prompt_prefix(self, base64_floor_plan: str, instructions: str = NAVIGATION_INSTRUCTIONS) -> PromptPrefix:
+        """
+        Returns the PromptPrefix for a floorplan, building and serialising it on first use.
+        """
+        key = (instructions, base64_floor_plan)
+        prefix = self._prompt_prefixes.get(key)
+        if prefix is None:
+            prefix = PromptPrefix(base64_floor_plan, instructions)
+            self._prompt_prefixes[key] = prefix
+            if len(self._prompt_prefixes) > self.MAX_PROMPT_PREFIXES:
+                self._prompt_prefixes.popitem(last=False)
+        else:
+            self._prompt_prefixes.move_to_end(key)
+        return prefix
 
-        Audio Transcription: {transcription}
+    def build_prompt(self, task: str, base64_floor_plan: str, base64_live_images: list, transcription: str, localize_only: bool = False) -> Prompt:
+        """
+        Builds the request for one or more live frames, which share one copy of the floorplan.
+        With `localize_only`, the model is asked for the current and target positions
+        instead of a route.
+        """
+        instructions = LOCALIZATION_INSTRUCTIONS if localize_only else NAVIGATION_INSTRUCTIONS
+        with span("prompt_build", frames=len(base64_live_images)):
+            return Prompt(self.get_prompt_prefix(base64_floor_plan, instructions), transcription, base64_live_images, self.json_mode)
 
-        **Please provide the output in the following JSON format:**
+    def estimate_prompt_tokens(self, base64_floor_plan: str, base64_live_images: list, transcription: str, localize_only: bool = False) -> int:
+        """
+        The `tokens` of the Prompt that build_prompt would return, without building it:
+        the cached prefix's count plus the suffix text and the live images' JPEG headers.
+        """
+        instructions = LOCALIZATION_INSTRUCTIONS if localize_only else NAVIGATION_INSTRUCTIONS
+        prefix = self.get_prompt_prefix(base64_floor_plan, instructions)
+        text = prompt_text(transcription, len(base64_live_images), self.json_mode)
+        images = sum(image_tokens(image) for image in base64_live_images)
+        return prefix.tokens + len(text) // 4 + images + ESTIMATED_COMPLETION_TOKENS * len(base64_live_images)
 
-        ```{{
-        "current_location": "Inferred current location",
-        "target_task": "Task determined from audio transcription",
-        "plan": [
-            {{
-            "step_number": 1,
-            "action": "Action description",
-            "description": "Detailed description of the action"
-            }},
-            // Additional steps as needed
-        ],
-        "current_action": "Current action being performed"
-        }}
-        ```
+    def build_progress_prompt(self, base64_floor_plan: str, base64_live_image: str, transcription: str, session: NavigationSession) -> Prompt:
+        """
+        Builds the progress check for a later frame of a navigation session: the session's
+        plan and last known progress go with the frame, and the reply is a small object
+        capped at PROGRESS_CHECK_MAX_TOKENS.
+        """
+        with span("prompt_build", frames=1):
+            return Prompt(self.get_prompt_prefix(base64_floor_plan, PROGRESS_INSTRUCTIONS), transcription, [base64_live_image], self.json_mode,
+                          context=session.describe_plan(), max_tokens=settings.PROGRESS_CHECK_MAX_TOKENS)
 
-        **Notes:**
-        - Ensure that each step in the plan is clear and actionable.
-        - If there are multiple ways to perform a step, choose the most efficient one based on the floor plan.
-        - If additional information is required to complete the task, indicate what is needed.
-        - Provide detailed navigation instructions similar to Google Maps, including turns and approximate distances in steps.
-        - Consider any relevant information from the audio transcription when planning the path and actions.
+    @staticmethod
+    def replan_reason(session: NavigationSession, transcription: str, venue_id: str):
+        """
+        Returns why the session's plan has to be made (again) before checking progress
+        along it, or None if it still applies.
+        """
+        if not session.has_plan:
+            return "no_plan"
+        if transcription != session.transcription or venue_id != session.venue_id:
+            return "new_request"
+        if session.progress_checks >= settings.SESSION_MAX_PROGRESS_CHECKS:
+            return "refresh"
+        return None
+
+    async def process_session_frame_async(self, session: NavigationSession, task: str, base64_floor_plan: str, base64_live_image: str,
+                                          transcription: str, venue_id: str = None, use_cache: bool = True) -> tuple:
+        """
+        Processes a live frame of a navigation session, updating the session in place.
 
-        Please generate the structured JSON response based on the above instructions.
+        While the session's plan applies, only a progress check is sent; the full
+        navigation prompt is sent when there is no plan yet, the request changed, or the
+        progress check reports (or suggests, by failing) that the person diverged from it.
+
+        Returns:
+        - tuple: ("progress" or "plan", the model's result)
+        """
+        reason = self.replan_reason(session, transcription, venue_id)
+        if reason is None:
+            prompt = self.build_progress_prompt(base64_floor_plan, base64_live_image, transcription, session)
+            try:
+                result = self.parse_response(await self.send_prompt_async(prompt, use_cache))
+            except (httpx.HTTPError, ValueError) as e:
+                logger.error("Progress check failed: %s", e)
+                result = {"error": "Failed to process the task"}
+            if not isinstance(result, dict):
+                result = {"error": "Unexpected progress check result"}
+            if "error" not in result and session.apply_progress(result):
+                return "progress", result
+            reason = "progress_failed" if "error" in result else "diverged"
+
+        logger.info("Planning navigation session %s: %s", session.session_id, reason)
+        result = (await self.process_frame_group_async(task, base64_floor_plan, [base64_live_image], transcription, use_cache))[0]
+        if "error" not in result:
+            session.apply_plan(transcription, venue_id, result)
+        return "plan", result
+
+    async def send_prompt_async(self, prompt: Prompt, use_cache: bool = True, priority: float = None, deadline: float = None) -> dict:
+        cache_key = prompt.cache_key if self.response_cache is not None and use_cache else None
+        build_body = lambda model: prompt.serialize(model=model)
+        return await self.post_async(build_body, cache_key, prompt.tokens, priority, deadline, prompt.question_key)
+
+    async def post_async(self, build_body, cache_key: str, tokens: int, priority: float = None, deadline: float = None,
+                         last_known_key: str = None) -> dict:
+        """
+        Sends a chat-completion request, through the response cache, the router and the
+        scheduler when they are configured. `build_body` serialises the request for a
+        given model. The router's answer carries a "routing" entry with the tier and
+        model that gave it, see services.model_router.
         """
+        if cache_key is not None:
+            cached = await asyncio.to_thread(self.response_cache.get, cache_key)
+            if cached is not None:
+                return cached
+
+        client = self.get_async_client()
+
+        async def call(model):
+            body = build_body(model)
+            if self.scheduler is None:
+                response = await client.post(self.url, content=body)
+            else:
+                response = await self.scheduler.send(lambda: client.post(self.url, content=body), tokens, priority)
+            response = response.json()
+            if self.scheduler is not None:
+                used_tokens = response.get("usage", {}).get("total_tokens")
+                if used_tokens:
+                    self.scheduler.record_usage(tokens, used_tokens)
+            return response
+
+        with span("model_round_trip"):
+            if self.router is None:
+                response, tier, model = await call(settings.MISTRAL_MODEL), None, settings.MISTRAL_MODEL
+            else:
+                response, tier, model = await self.router.route(call, deadline, last_known_key)
+        # Only the primary model's answers are worth keeping
+        if cache_key is not None and 'choices' in response and model == settings.MISTRAL_MODEL:
+            await asyncio.to_thread(self.response_cache.set, cache_key, response)
+        if tier is not None:
+            response = {**response, "routing": {"tier": tier, "model": model}}
+        return response
+
+    async def stream_prompt_async(self, prompt: Prompt, use_cache: bool = True, priority: float = None):
+        """
+        Sends a request in the API's streaming mode and yields the reply text as it is
+        generated. A cached reply is yielded in one piece; a completed stream is cached
+        like a plain response.
 
-        return [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": prompt
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": f"data:image/jpeg;base64,{base64_floor_plan}"
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": f"data:image/jpeg;base64,{base64_live_image}"
-                    }
-                ]
-            }
-        ]
-    def send_request(self, messages: list) -> dict:
-        data = {
-            "model": "pixtral-12b-2409",
-            "messages": messages
-        }
+        Streams always use the primary model. With a router, a stream that has not
+        completed within the router's deadline is abandoned for the last-known answer,
+        yielded in one piece if nothing was yielded yet.
+
+        :raises httpx.HTTPStatusError: If the API answers with an error status
+        :raises ModelDeadlineExceeded: If nothing was yielded in time and there is no last-known answer
+        :raises StreamDeadlineExceeded: If the stream was cut off after part of the reply was yielded
+        """
+        cache_key = prompt.cache_key if self.response_cache is not None and use_cache else None
+        if cache_key is not None:
+            cached = await asyncio.to_thread(self.response_cache.get, cache_key)
+            if cached is not None and cached.get("choices"):
+                yield cached["choices"][0]["message"]["content"]
+                return
+
+        client = self.get_async_client()
+        request = client.build_request("POST", self.url, content=prompt.serialize(stream=True))
+        send = lambda: client.send(request, stream=True)
+        # Timed by hand, a span cannot be held open across the yields below
+        start = time.perf_counter()
+        deadline = self.router.deadline if self.router is not None else None
+        try:
+            if self.scheduler is None:
+                response = await asyncio.wait_for(send(), deadline)
+            else:
+                response = await asyncio.wait_for(self.scheduler.send(send, prompt.tokens, priority), deadline)
+        except asyncio.TimeoutError:
+            last_known = self.router.last_known_answer(prompt.question_key, time.perf_counter() - start)
+            if last_known is None:
+                raise ModelDeadlineExceeded(f"The model stream did not start within {deadline:.1f} seconds")
+            yield last_known["choices"][0]["message"]["content"]
+            return
+
+        content = []
+        usage = None
+        first_token = True
+        try:
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+            # Server-sent events, one completion chunk per "data:" line, read within what is left of the deadline
+            lines = response.aiter_lines()
+            while True:
+                remaining = None if deadline is None else max(0.0, start + deadline - time.perf_counter())
+                try:
+                    line = await asyncio.wait_for(anext(lines), remaining)
+                except StopAsyncIteration:
+                    break
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                chunk = json.loads(payload)
+                usage = chunk.get("usage") or usage
+                for choice in chunk.get("choices", [])[:1]:
+                    delta = choice.get("delta", {}).get("content")
+                    if delta:
+                        if first_token:
+                            record_stage("model_first_token", time.perf_counter() - start)
+                            first_token = False
+                        content.append(delta)
+                        yield delta
+        except asyncio.TimeoutError:
+            last_known = self.router.last_known_answer(prompt.question_key, time.perf_counter() - start)
+            message = f"The model stream did not complete within {deadline:.1f} seconds"
+            if content:
+                raise StreamDeadlineExceeded(message, last_known)
+            if last_known is None:
+                raise ModelDeadlineExceeded(message)
+            yield last_known["choices"][0]["message"]["content"]
+            return
+        finally:
+            await response.aclose()
+        record_stage("model_round_trip", time.perf_counter() - start)
+
+        if self.scheduler is not None and usage and usage.get("total_tokens"):
+            self.scheduler.record_usage(prompt.tokens, usage["total_tokens"])
+        if not content:
+            return
+        response = {"choices": [{"message": {"role": "assistant", "content": "".join(content)}}], "usage": usage}
+        if self.router is not None:
+            self.router.record_answer(PRIMARY, settings.MISTRAL_MODEL, time.perf_counter() - start)
+            self.router.remember(prompt.question_key, response)
+        if cache_key is not None:
+            await asyncio.to_thread(self.response_cache.set, cache_key, response)
+
+    async def process_frame_group_async(self, task: str, base64_floor_plan: str, base64_live_images: list, transcription: str, use_cache: bool = True,
+                                        localize_only: bool = False) -> list:
+        """
+        Processes several live frames in a single request and returns one result per frame.
+        """
+        prompt = self.build_prompt(task, base64_floor_plan, base64_live_images, transcription, localize_only)
+        try:
+            response = await self.send_prompt_async(prompt, use_cache)
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error("Model request failed: %s", e)
+            return [{"error": "Failed to process the task"}] * prompt.frames
+        results = self.split_results(self.parse_response(response), prompt.frames)
+        if self.router is None:
+            return results
+        # Answers from the response cache did not go through the router
+        answered_by = response.get("routing", {"tier": "cache", "model": None})
+        return [result if "error" in result else {**result, "answered_by": answered_by} for result in results]
+
+    async def stream_frame_group_async(self, task: str, base64_floor_plan: str, base64_live_images: list, transcription: str, use_cache: bool = True,
+                                       localize_only: bool = False):
+        """
+        Processes several live frames in a single streamed request. Yields "partial" events
+        for the EARLY_FIELDS of each frame as soon as they have been generated, then one
+        "result" event per frame once the reply is complete. Events carry the position of
+        the frame within `base64_live_images` as "frame".
+        """
+        prompt = self.build_prompt(task, base64_floor_plan, base64_live_images, transcription, localize_only)
+        # Deep enough for ("frames", frame, "plan", 0) in a multi-frame JSON mode reply
+        parser = IncrementalJsonParser(max_depth=4)
+        content = []
+        try:
+            async for delta in self.stream_prompt_async(prompt, use_cache):
+                content.append(delta)
+                for path, value in parser.feed(delta):
+                    event = self.partial_event(path, value, prompt.frames)
+                    if event is not None:
+                        yield event
+        except StreamDeadlineExceeded as e:
+            # Partials already sent stay, the results come from the last answer to the same question
+            logger.warning("Model request failed: %s", e)
+            if e.last_known is None:
+                results = [{"error": "Failed to process the task"}] * prompt.frames
+            else:
+                results = self.split_results(self.parse_response(e.last_known), prompt.frames)
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error("Model request failed: %s", e)
+            results = [{"error": "Failed to process the task"}] * prompt.frames
+        else:
+            results = self.split_results(self.parse_content("".join(content)), prompt.frames)
+
+        for frame, result in enumerate(results):
+            yield {"type": "result", "frame": frame, "result": result}
 
-        response = requests.post(self.url, headers=self.headers, data=json.dumps(data))
-        return response.json()
+    @staticmethod
+    def partial_event(path: tuple, value, frames: int):
+        """
+        Turns a value completed by the incremental parser into a "partial" event, or None
+        if it is not one of the EARLY_FIELDS.
+        """
+        frame = 0
+        if frames > 1:
+            if path[:1] == ("frames",):
+                path = path[1:]
+            if not path or not isinstance(path[0], int):
+                return None
+            frame, path = path[0], path[1:]
+        field = EARLY_FIELDS.get(path)
+        if field is None:
+            return None
+        return {"type": "partial", "frame": frame, "field": field, "value": value}
+
+    @staticmethod
+    def split_results(result, frames: int) -> list:
+        """
+        Splits a parsed response into one result per frame. Multi-frame requests are
+        answered with a JSON array (or {"frames": [...]} in JSON mode), single frames
+        with a single object.
+        """
+        if isinstance(result, dict):
+            if "error" in result or frames == 1:
+                return [result] * frames
+            result = result.get("frames")
+        if isinstance(result, list) and len(result) == frames and all(isinstance(item, dict) for item in result):
+            return result
+        return [{"error": "Unexpected number of frame results"}] * frames
+
+    @staticmethod
+    def frame_groups(frames: int, frames_per_request: int = None) -> list:
+        """
+        Splits frame indices into the groups sent together in one request each.
+        """
+        frames_per_request = max(1, frames_per_request or settings.FRAMES_PER_REQUEST)
+        return [list(range(start, min(start + frames_per_request, frames))) for start in range(0, frames, frames_per_request)]
+
+    async def iter_frames(self, task: str, base64_floor_plan: str, base64_live_images: list, transcription: str, concurrency: int = None, use_cache: bool = True,
+                          frames_per_request: int = None, localize_only: bool = False):
+        """
+        Processes several live frames against the same floor plan concurrently and yields
+        (index, result) pairs as soon as each frame is done.
 
-    def process_task(self, task: str, base64_floor_plan: str, base64_live_image: str, transcription: str) -> dict:
-        messages = self.create_prompt(task, base64_floor_plan, base64_live_image, transcription)
-        response = self.send_request(messages)
-        
+        Frames are sent `frames_per_request` at a time, and at most `concurrency` requests
+        are in flight at once. Requests that are still pending are cancelled when the
+        consumer stops iterating early.
+        """
+        semaphore = asyncio.Semaphore(concurrency or settings.NAVIGATE_CONCURRENCY)
+
+        async def process_group(indices):
+            async with semaphore:
+                images = [base64_live_images[index] for index in indices]
+                results = await self.process_frame_group_async(task, base64_floor_plan, images, transcription, use_cache, localize_only)
+                return list(zip(indices, results))
+
+        groups = self.frame_groups(len(base64_live_images), frames_per_request)
+        tasks = [asyncio.create_task(process_group(indices)) for indices in groups]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                for index_result in await next_done:
+                    yield index_result
+        finally:
+            for pending in tasks:
+                pending.cancel()
+
+    async def iter_frame_events(self, task: str, base64_floor_plan: str, base64_live_images: list, transcription: str, concurrency: int = None, use_cache: bool = True,
+                                frames_per_request: int = None, localize_only: bool = False):
+        """
+        Same as iter_frames, but streams the model replies: yields the events of
+        stream_frame_group_async, with "index" set to the frame's position in
+        `base64_live_images`, as soon as they are available.
+        """
+        semaphore = asyncio.Semaphore(concurrency or settings.NAVIGATE_CONCURRENCY)
+        events = asyncio.Queue()
+
+        async def stream_group(indices):
+            pending = set(indices)
+            try:
+                async with semaphore:
+                    images = [base64_live_images[index] for index in indices]
+                    async for event in self.stream_frame_group_async(task, base64_floor_plan, images, transcription, use_cache, localize_only):
+                        event["index"] = indices[event.pop("frame")]
+                        if event["type"] == "result":
+                            pending.discard(event["index"])
+                        await events.put(event)
+            except Exception as e:
+                # Every frame must get a result, or the consumer would wait forever
+                logger.exception("Streaming frames %s failed: %s", indices, e)
+                for index in sorted(pending):
+                    await events.put({"type": "result", "index": index, "result": {"error": "Failed to process the task"}})
+
+        groups = self.frame_groups(len(base64_live_images), frames_per_request)
+        tasks = [asyncio.create_task(stream_group(indices)) for indices in groups]
+        remaining = len(base64_live_images)
+        try:
+            while remaining:
+                event = await events.get()
+                if event["type"] == "result":
+                    remaining -= 1
+                yield event
+        finally:
+            for pending in tasks:
+                pending.cancel()
+
+    async def process_frames(self, task: str, base64_floor_plan: str, base64_live_images: list, transcription: str, concurrency: int = None, use_cache: bool = True,
+                             frames_per_request: int = None, localize_only: bool = False) -> list:
+        """
+        Processes several live frames concurrently, returning the results in the same
+        order as `base64_live_images`.
+        """
+        results = [None] * len(base64_live_images)
+        async for index, result in self.iter_frames(task, base64_floor_plan, base64_live_images, transcription, concurrency, use_cache, frames_per_request,
+                                                    localize_only):
+            results[index] = result
+        return results
+
+    def parse_response(self, response: dict) -> dict:
         if 'choices' in response and len(response['choices']) > 0:
             content = response['choices'][0]['message']['content']
-            print(f"content: {content}")
-            # Extract JSON from the content (assuming it's wrapped in ```json ... ```)
-            json_start = content.find('```json') + 7
-            json_end = content.rfind('```')
-            json_str = content[json_start:json_end].strip()
-            
-            try:
-                return json.loads(json_str)
-            except json.JSONDecodeError:
-                return {"error": "Failed to parse JSON response"}
+            return self.parse_content(content)
         else:
             return {"error": "Unable to process the task"}
+
+    def parse_content(self, content: str):
+        logger.debug("content: %s", content)
+        if not content:
+            return {"error": "Unable to process the task"}
+        # The JSON is usually wrapped in ```json ... ```, but fences are not guaranteed
+        with span("json_parse"):
+            try:
+                return extract_json(content)
+            except ValueError:
+                logger.warning("Failed to parse JSON from the reply: %.200s", content)
+                return {"error": "Failed to parse JSON response"}
 # Initialize the service
-mistral_service = MistralService(settings.MISTRAL_API_KEY)
+mistral_service = MistralService(settings.MISTRAL_API_KEY, response_cache=response_cache, scheduler=request_scheduler, router=model_router)
 
     
 
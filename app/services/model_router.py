@@ -0,0 +1,233 @@
+import asyncio
+from collections import Counter, OrderedDict, deque
+import httpx
+from core.config import settings
+from core.telemetry import MODEL_ANSWER_SECONDS, get_logger
+
+logger = get_logger(__name__)
+
+# Routing tiers, in the order they are tried
+PRIMARY = "primary"
+HEDGE = "hedge"
+FALLBACK = "fallback"
+LAST_KNOWN = "last_known"
+
+class ModelDeadlineExceeded(httpx.TimeoutException):
+    """
+    No model answered within the request's deadline and there was no earlier answer to
+    fall back to.
+    """
+
+class StreamDeadlineExceeded(ModelDeadlineExceeded):
+    """
+    A streamed reply did not complete within the deadline after part of it was already
+    passed on. Carries the last-known answer to the question, or None, to replace it.
+    """
+
+    def __init__(self, message: str, last_known: dict = None):
+        super().__init__(message)
+        self.last_known = last_known
+
+class LatencyTracker:
+    """
+    The latencies of the most recent answers of a model, for percentile estimates.
+    """
+
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, fraction: float, min_samples: int):
+        """
+        Returns the `fraction` percentile, or None with fewer than `min_samples` samples.
+        """
+        if len(self.samples) < max(1, min_samples):
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class ModelRouter:
+    """
+    Gets an answer to a model request within a deadline, trading quality for time when
+    the primary model is slow:
+
+    1. The request goes to the primary model.
+    2. If it has not answered by the `hedge_percentile` latency of its recent answers, a
+       second, identical request is sent (a hedge); whichever answers first is used.
+    3. If neither has answered when the primary model's share of the deadline is used
+       up, or both failed, the request is also sent to each fallback model in turn,
+       typically smaller and faster ones. Earlier attempts keep running.
+    4. If no model answered by the deadline, the last answer to the same question (an
+       earlier frame with the same request) is returned.
+
+    Every answer records the tier and model that gave it.
+    """
+
+    # Questions whose last answer is kept for the last-known tier
+    MAX_LAST_KNOWN = 256
+
+    def __init__(self, models: list, deadline: float, hedge_percentile: float = 0.0, hedge_min_samples: int = 20,
+                 primary_share: float = 0.6):
+        self.models = models
+        self.deadline = deadline
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.primary_share = primary_share
+        self.primary_latency = LatencyTracker()
+        self._last_known = OrderedDict()
+        self.answers = Counter()
+        self.failures = 0
+
+    @property
+    def primary_model(self) -> str:
+        return self.models[0]
+
+    def hedge_delay(self):
+        """
+        Seconds after which the primary model request is hedged, or None when hedging is
+        disabled or there are too few samples yet.
+        """
+        if not self.hedge_percentile:
+            return None
+        return self.primary_latency.percentile(self.hedge_percentile, self.hedge_min_samples)
+
+    def schedule(self, deadline: float) -> list:
+        """
+        The attempts of a request as (start offset in seconds, tier, model), in start order.
+        """
+        fallbacks = self.models[1:]
+        primary_budget = deadline * self.primary_share if fallbacks else deadline
+        attempts = [(0.0, PRIMARY, self.primary_model)]
+        hedge_delay = self.hedge_delay()
+        if hedge_delay is not None and hedge_delay < primary_budget:
+            attempts.append((hedge_delay, HEDGE, self.primary_model))
+        # The fallbacks share what is left of the deadline
+        slot = (deadline - primary_budget) / max(1, len(fallbacks))
+        attempts += [(primary_budget + index * slot, FALLBACK, model) for index, model in enumerate(fallbacks)]
+        return attempts
+
+    async def route(self, call, deadline: float = None, last_known_key: str = None) -> tuple:
+        """
+        Routes a request.
+
+        Parameters:
+        - call (callable): Coroutine function taking a model name and returning the
+          decoded response. Responses without "choices" count as failed attempts.
+        - deadline (float): Seconds to get an answer in, the router's deadline by default.
+        - last_known_key (str): Identifies the question for the last-known tier; None
+          disables it.
+
+        Returns:
+        - tuple: (response, tier, model). When every attempt failed, the last failed
+          response is returned with tier None.
+
+        :raises ModelDeadlineExceeded: If nothing answered in time and there is no last-known answer
+        :raises httpx.HTTPError: If every attempt failed with a transport error (or ValueError, with a reply that is not JSON)
+        """
+        deadline = deadline or self.deadline
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        schedule = self.schedule(deadline)
+        pending = {}
+        failed_models = set()
+        failure = None
+        try:
+            while True:
+                elapsed = loop.time() - start
+                # Start the attempts that are due, or the next one at once when nothing is running
+                while schedule and (schedule[0][0] <= elapsed or not pending):
+                    _, tier, model = schedule.pop(0)
+                    if tier == HEDGE and model in failed_models:
+                        continue
+                    pending[asyncio.create_task(call(model))] = (tier, model, loop.time())
+                if not pending:
+                    break
+                remaining = start + deadline - loop.time()
+                if remaining <= 0:
+                    break
+                timeout = min(remaining, schedule[0][0] - elapsed) if schedule else remaining
+                done, _ = await asyncio.wait(pending, timeout=max(0.0, timeout), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tier, model, started = pending.pop(task)
+                    try:
+                        response = task.result()
+                    except (httpx.HTTPError, ValueError) as e:
+                        logger.warning("Model request to %s (%s) failed: %s", model, tier, e)
+                        failed_models.add(model)
+                        failure = e
+                        continue
+                    if "choices" not in response:
+                        logger.warning("Model request to %s (%s) failed: %.200s", model, tier, response)
+                        failed_models.add(model)
+                        failure = response
+                        continue
+                    if model == self.primary_model:
+                        self.primary_latency.record(loop.time() - started)
+                    self.remember(last_known_key, response)
+                    self.record_answer(tier, model, loop.time() - start)
+                    return response, tier, model
+        finally:
+            for task in pending:
+                task.cancel()
+
+        last_known = self.last_known_answer(last_known_key, loop.time() - start)
+        if last_known is not None:
+            return last_known, LAST_KNOWN, None
+        self.failures += 1
+        if isinstance(failure, dict):
+            return failure, None, None
+        if isinstance(failure, Exception) and loop.time() - start < deadline:
+            raise failure
+        raise ModelDeadlineExceeded(f"No model answered within {deadline:.1f} seconds")
+
+    def remember(self, key: str, response: dict):
+        """
+        Keeps an answer as the last-known answer to its question.
+        """
+        if key is None:
+            return
+        self._last_known[key] = response
+        self._last_known.move_to_end(key)
+        if len(self._last_known) > self.MAX_LAST_KNOWN:
+            self._last_known.popitem(last=False)
+
+    def last_known_answer(self, key: str, seconds: float):
+        """
+        Returns the last answer to the question, recording it as answered by the
+        last-known tier after `seconds`, or None if there is none.
+        """
+        response = self._last_known.get(key) if key is not None else None
+        if response is not None:
+            self._last_known.move_to_end(key)
+            self.record_answer(LAST_KNOWN, None, seconds)
+        return response
+
+    def record_answer(self, tier: str, model: str, seconds: float):
+        self.answers[tier] += 1
+        MODEL_ANSWER_SECONDS.observe(seconds, tier=tier, model=model or "-")
+        if tier != PRIMARY:
+            logger.info("Model request answered by the %s tier (%s) after %.2f s", tier, model or "no model", seconds)
+
+    def stats(self):
+        hedge_delay = self.hedge_delay()
+        return {
+            "models": self.models,
+            "deadline_seconds": self.deadline,
+            "hedge_delay_seconds": round(hedge_delay, 3) if hedge_delay is not None else None,
+            "answers": dict(self.answers),
+            "failures": self.failures,
+        }
+
+def configured_models() -> list:
+    return [settings.MISTRAL_MODEL] + [model.strip() for model in settings.MISTRAL_FALLBACK_MODELS.split(",") if model.strip()]
+
+# Initialize the router
+model_router = ModelRouter(
+    configured_models(),
+    settings.MODEL_DEADLINE_SECONDS,
+    settings.MODEL_HEDGE_PERCENTILE,
+    settings.MODEL_HEDGE_MIN_SAMPLES,
+    settings.MODEL_PRIMARY_DEADLINE_SHARE,
+)
@@ -0,0 +1,361 @@
+import asyncio
+import threading
+import time
+from core.config import settings
+from core.telemetry import get_logger, record_stage
+from services.mistral_service import mistral_service
+from services.whisper_service import whisper_batcher
+from utils.frame_cues import detect_cues, gate_frame, hazard_result
+from utils.image_processing import KeyframeSelector, encode_frame, get_preprocess_executor
+from utils.image_sizing import LIVE
+
+logger = get_logger(__name__)
+
+class NavigationFrames:
+    """
+    The frames of one navigation request. Only key frames are encoded and sent to the
+    model; duplicate frames reuse the result of the key frame before them, and hazard
+    frames are answered locally.
+    """
+
+    def __init__(self):
+        self.live_images = []
+        # For each key frame, the (position, filename) of every frame it stands for
+        self.groups = []
+        # The local answers to hazard frames, with their position and filename
+        self.hazards = []
+        self.total = 0
+
+    @property
+    def skipped(self) -> int:
+        return self.total - len(self.live_images) - len(self.hazards)
+
+    def add(self, filename: str, base64_live_image: str = None):
+        """
+        Adds a frame; pass the encoded image for key frames and None for duplicates.
+        """
+        if base64_live_image is not None or not self.groups:
+            self.live_images.append(base64_live_image)
+            self.groups.append([])
+        self.groups[-1].append((self.total, filename))
+        self.total += 1
+
+    def add_hazard(self, filename: str, result: dict) -> dict:
+        """
+        Adds a frame answered locally with a hazard warning, see utils.frame_cues.
+        """
+        hazard = {"index": self.total, "frame": filename, **result}
+        self.hazards.append(hazard)
+        self.total += 1
+        return hazard
+
+    def frame_results(self, keyframe_index: int, navigation: dict) -> list:
+        """
+        Returns the results of every frame covered by the given key frame.
+        """
+        group = self.groups[keyframe_index]
+        keyframe_name = group[0][1]
+        results = []
+        for position, filename in group:
+            result = {"index": position, "frame": filename, "navigation": navigation}
+            if filename != keyframe_name:
+                result["duplicate_of"] = keyframe_name
+            results.append(result)
+        return results
+
+class FrameSelector:
+    """
+    Decides which frames of a navigation request go to the model. `select` returns:
+
+    - "hazard" when the local pre-filter (utils.frame_cues) finds an urgent hazard; the
+      frame is answered locally, without the model.
+    - "duplicate" when the frame can reuse the result of the last key frame: its local
+      cues match those of the key frame (for up to LOCAL_GATE_MAX_SKIPPED_FRAMES frames
+      in a row), or it is a near-duplicate of it (utils.image_processing.KeyframeSelector).
+    - "key" for a key frame, sent to the model. Frames whose cues differ from the last
+      key frame's are always key frames, however little their pixels changed.
+
+    The cues are only computed with LOCAL_PREFILTER_ENABLED; otherwise frames are
+    selected on their differences alone.
+    """
+
+    def __init__(self, dedup_threshold: float, prefilter: bool = None):
+        self.keyframes = KeyframeSelector(dedup_threshold)
+        self.prefilter = settings.LOCAL_PREFILTER_ENABLED if prefilter is None else prefilter
+        self.last_signature = None
+        self.frames_since_model = 0
+
+    def select(self, img) -> tuple:
+        """
+        Returns (decision, cues), with cues None when the pre-filter is disabled.
+        """
+        cues = detect_cues(img) if self.prefilter else None
+        cues_changed = False
+        if cues is not None:
+            decision = gate_frame(cues, self.last_signature, self.frames_since_model)
+            if decision == "hazard":
+                return "hazard", cues
+            if decision == "skip":
+                self.frames_since_model += 1
+                return "duplicate", cues
+            cues_changed = self.last_signature is not None and cues.signature != self.last_signature
+        if not self.keyframes.is_keyframe(img, force=cues_changed):
+            self.frames_since_model += 1
+            return "duplicate", cues
+        self.last_signature = cues.signature if cues is not None else None
+        self.frames_since_model = 0
+        return "key", cues
+
+class PipelineStageError(Exception):
+    """
+    A stage of the NavigationPipeline failed; the original exception is the __cause__.
+    """
+
+    def __init__(self, stage: str, error: Exception):
+        super().__init__(f"{stage} failed: {error}")
+        self.stage = stage
+
+# Marks the end of a stage's output
+_END = object()
+
+class NavigationPipeline:
+    """
+    Voice-driven navigation as explicit stages connected by bounded queues:
+
+        audio  -> transcribe --------------------------------------+
+        frames -> decode + key frame selection -> encode ----------+-> model calls -> results
+
+    Transcription runs in the Whisper batching thread while the frames are decoded (in a
+    worker thread) and encoded (on the preprocessing pool), so the CPU-heavy speech
+    recognition overlaps with the image work instead of preceding it. The model calls
+    need the transcription and start as soon as it is known.
+
+    The queues bound the work buffered between stages: at most `decoded_queue_size` raw
+    frames wait for encoding and `encoded_queue_size` key frames for a model call, so a
+    long video cannot run ahead of the model and fill memory. When the transcription
+    takes longer than the frames, decoding pauses once both queues are full.
+
+    With LOCAL_PREFILTER_ENABLED, the decode stage also runs the local pre-filter of
+    utils.frame_cues on every frame (see FrameSelector): urgent hazards are answered
+    locally and reported straight away, ahead of the transcription and the model, and
+    frames whose cues match the last key frame's are not sent to the model.
+    """
+
+    def __init__(self, task: str, base64_floor_plan: str, dedup_threshold: float = None, frames_per_request: int = None,
+                 concurrency: int = None, use_cache: bool = True, localize_only: bool = False,
+                 decoded_queue_size: int = None, encoded_queue_size: int = None):
+        self.task = task
+        self.base64_floor_plan = base64_floor_plan
+        self.dedup_threshold = settings.KEYFRAME_DIFF_THRESHOLD if dedup_threshold is None else dedup_threshold
+        self.frames_per_request = max(1, frames_per_request or settings.FRAMES_PER_REQUEST)
+        self.concurrency = concurrency or settings.NAVIGATE_CONCURRENCY
+        self.use_cache = use_cache
+        self.localize_only = localize_only
+        self.decoded_queue_size = decoded_queue_size or settings.PIPELINE_DECODED_QUEUE_SIZE
+        self.encoded_queue_size = encoded_queue_size or settings.PIPELINE_ENCODED_QUEUE_SIZE
+
+        self.frames = NavigationFrames()
+        self.transcription = None
+        self.model_calls = 0
+        # Seconds from the start of the run until each stage finished
+        self.timings = {}
+        self._start = None
+        self._closed = threading.Event()
+
+    def _mark(self, name: str):
+        self.timings[name] = round(time.perf_counter() - self._start, 3)
+
+    async def run(self, audio, frames):
+        """
+        Runs the pipeline over `audio` (the encoded recording, or a dict of raw samples as
+        accepted by the Whisper pipeline) and `frames`, an iterable of (filename, image)
+        pairs that is consumed in a worker thread.
+
+        Yields a "transcription" event once the speech is transcribed, a "hazard" event
+        (with the frame's index and filename) as soon as a frame shows an urgent hazard,
+        and a "result" event per key frame (in completion order) carrying its index in
+        `self.frames.live_images`. A result is only yielded once every frame it stands
+        for is known, so `self.frames.frame_results` is complete for it.
+
+        :raises PipelineStageError: If transcription, decoding or encoding fails
+        """
+        loop = asyncio.get_running_loop()
+        self._start = time.perf_counter()
+        decoded = asyncio.Queue(self.decoded_queue_size)
+        encoded = asyncio.Queue(self.encoded_queue_size)
+        events = asyncio.Queue()
+        transcription = asyncio.create_task(self._transcribe(audio, events))
+        decoder = loop.run_in_executor(None, self._decode_stage, frames, decoded, events, loop)
+        stages = [
+            transcription,
+            # Shielded, so cancelling the stages below does not mark the thread as done while it still runs
+            asyncio.create_task(self._forward_failure(asyncio.shield(decoder), "decode", events)),
+            asyncio.create_task(self._encode_stage(decoded, encoded, events)),
+            asyncio.create_task(self._model_stage(transcription, encoded, events)),
+        ]
+
+        # Key frame results wait here until the group of frames they stand for is complete
+        pending = {}
+        closed_groups = 0
+        try:
+            while True:
+                event = await events.get()
+                if event is _END:
+                    break
+                if isinstance(event, PipelineStageError):
+                    raise event
+                if event["type"] == "groups_closed":
+                    closed_groups = event["count"]
+                elif event["type"] == "result":
+                    pending[event["index"]] = event
+                else:
+                    yield event
+                for index in sorted(index for index in pending if index < closed_groups):
+                    yield pending.pop(index)
+            self._mark("elapsed_seconds")
+        finally:
+            self._closed.set()
+            for stage in stages:
+                stage.cancel()
+            # Unblock the decoding thread if it is waiting for room in the queue
+            while not decoder.done():
+                while not decoded.empty():
+                    decoded.get_nowait()
+                await asyncio.wait({decoder}, timeout=0.05)
+
+    async def _forward_failure(self, stage, name: str, events: asyncio.Queue):
+        try:
+            await stage
+        except Exception as e:
+            await events.put(self._stage_error(name, e))
+
+    def _stage_error(self, stage: str, error: Exception) -> PipelineStageError:
+        logger.error("Navigation pipeline %s stage failed: %s", stage, error)
+        failure = PipelineStageError(stage, error)
+        failure.__cause__ = error
+        return failure
+
+    async def _transcribe(self, audio, events: asyncio.Queue) -> str:
+        try:
+            text, _ = await whisper_batcher.submit_async(audio)
+        except Exception as e:
+            await events.put(self._stage_error("transcribe", e))
+            raise
+        self.transcription = text.strip()
+        self._mark("transcription_seconds")
+        await events.put({"type": "transcription", "text": self.transcription, "seconds": self.timings["transcription_seconds"]})
+        return self.transcription
+
+    def _decode_stage(self, frames, decoded: asyncio.Queue, events: asyncio.Queue, loop):
+        """
+        Runs in a worker thread: decodes the frames and selects the key frames, handing
+        (filename, decision, payload) to the encode stage: the image of key frames, the
+        local answer to hazard frames and None for duplicates.
+        """
+        selector = FrameSelector(self.dedup_threshold)
+
+        def put(item):
+            asyncio.run_coroutine_threadsafe(decoded.put(item), loop).result()
+
+        for index, (filename, img) in enumerate(frames):
+            if self._closed.is_set():
+                return
+            decision, cues = selector.select(img)
+            if decision == "hazard":
+                result = hazard_result(cues)
+                # Reported at once, without waiting for the frames queued before it
+                loop.call_soon_threadsafe(events.put_nowait, {"type": "hazard", "index": index, "frame": filename, "result": result})
+                put((filename, decision, result))
+                continue
+            put((filename, decision, img if decision == "key" else None))
+        # On failure the stage ends without _END, the error is reported instead
+        put(_END)
+
+    async def _encode_stage(self, decoded: asyncio.Queue, encoded: asyncio.Queue, events: asyncio.Queue):
+        """
+        Starts encoding each key frame on the preprocessing pool and passes the pending
+        encode on, so several frames are encoded in parallel while the model stage waits.
+        """
+        executor = get_preprocess_executor()
+        while (item := await decoded.get()) is not _END:
+            filename, decision, payload = item
+            if decision == "hazard":
+                self.frames.add_hazard(filename, payload)
+                continue
+            if decision == "duplicate":
+                self.frames.add(filename)
+                continue
+            img = payload
+            future = asyncio.wrap_future(executor.submit(encode_frame, img, role=LIVE))
+            keyframes = len(self.frames.live_images)
+            self.frames.add(filename, future)
+            # Later frames can only be duplicates of this key frame, so the groups before it are complete
+            await events.put({"type": "groups_closed", "count": keyframes})
+            await encoded.put((keyframes, future))
+        self._mark("frames_seconds")
+        await events.put({"type": "groups_closed", "count": len(self.frames.live_images)})
+        await encoded.put(_END)
+
+    async def _model_stage(self, transcription: asyncio.Task, encoded: asyncio.Queue, events: asyncio.Queue):
+        """
+        Sends the key frames to the model `frames_per_request` at a time, with at most
+        `concurrency` requests in flight, as soon as the transcription is known.
+        """
+        waiting = time.perf_counter()
+        try:
+            await transcription
+        except Exception:
+            # Reported by the transcription stage
+            return
+        record_stage("transcription_wait", time.perf_counter() - waiting)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        requests = []
+        group = []
+        try:
+            while True:
+                item = await encoded.get()
+                if item is not _END:
+                    group.append(item)
+                if group and (item is _END or len(group) == self.frames_per_request):
+                    # Wait for a free slot before taking more frames off the queue
+                    await semaphore.acquire()
+                    requests.append(asyncio.create_task(self._process_group(group, semaphore, events)))
+                    group = []
+                if item is _END:
+                    break
+            await asyncio.gather(*requests)
+        finally:
+            for request in requests:
+                request.cancel()
+        await events.put(_END)
+
+    async def _process_group(self, group: list, semaphore: asyncio.Semaphore, events: asyncio.Queue):
+        try:
+            indices, images = [], []
+            for index, future in group:
+                try:
+                    base64_live_image = await future
+                except Exception as e:
+                    await events.put(self._stage_error("encode", e))
+                    return
+                if base64_live_image is None:
+                    await events.put({"type": "result", "index": index, "result": {"error": "Failed to process live image"}})
+                    continue
+                # Swap the pending encode for its result
+                self.frames.live_images[index] = base64_live_image
+                indices.append(index)
+                images.append(base64_live_image)
+            if not images:
+                return
+
+            self.model_calls += 1
+            results = await mistral_service.process_frame_group_async(
+                self.task, self.base64_floor_plan, images, self.transcription, self.use_cache, self.localize_only,
+            )
+            if "first_result_seconds" not in self.timings:
+                self._mark("first_result_seconds")
+            for index, result in zip(indices, results):
+                await events.put({"type": "result", "index": index, "result": result})
+        finally:
+            semaphore.release()
@@ -0,0 +1,222 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from email.utils import parsedate_to_datetime
+import httpx
+from core.config import settings
+
+class TokenBucket:
+    """
+    A bucket holding up to `capacity` units that refills continuously at `rate` units per second.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Returns how many seconds to wait until `amount` units are available (0 if they are).
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """
+        Corrects the level after the fact, e.g. when the real token usage of a request
+        differs from its estimate. Positive amounts take units away.
+        """
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+def parse_retry_after(value):
+    """
+    Parses a Retry-After header, given either in seconds or as an HTTP date.
+
+    Returns:
+    - float: The delay in seconds, or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class RequestScheduler:
+    """
+    Schedules outbound model calls within a requests-per-second and a tokens-per-minute budget.
+
+    Waiting calls are released highest priority first; by default the priority is the time
+    the call was submitted, so the newest live frames overtake stale ones. A 429 response
+    pauses every call until its Retry-After has passed, while 5xx responses and connection
+    errors are retried with jittered exponential backoff.
+    """
+
+    def __init__(self, requests_per_second: float, tokens_per_minute: float, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0):
+        self.request_bucket = TokenBucket(requests_per_second, max(1.0, requests_per_second))
+        self.token_bucket = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._queue = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._loop = None
+        self._wakeup = None
+        self._dispatcher = None
+
+        self.in_flight = 0
+        self.dispatched = 0
+        self.retries = 0
+        self.throttled = 0
+        self.server_errors = 0
+
+    def _ensure_dispatcher(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._dispatcher is None or self._dispatcher.done():
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch())
+
+    async def _dispatch(self):
+        while True:
+            # Forget calls whose caller has gone away
+            while self._queue and self._queue[0][3].done():
+                heapq.heappop(self._queue)
+
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            _, _, tokens, future = self._queue[0]
+            wait = max(
+                self.request_bucket.wait_time(1),
+                self.token_bucket.wait_time(tokens),
+                self._paused_until - time.monotonic(),
+            )
+            if wait > 0:
+                # Wake up early if a new call arrives, it may have a higher priority
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._queue)
+            self.request_bucket.consume(1)
+            self.token_bucket.consume(tokens)
+            future.set_result(None)
+
+    async def acquire(self, tokens: int, priority: float = None):
+        """
+        Waits until the call fits in the budget. Calls with a higher `priority` go first.
+        """
+        self._ensure_dispatcher()
+        if priority is None:
+            priority = time.monotonic()
+        future = self._loop.create_future()
+        heapq.heappush(self._queue, (-priority, next(self._sequence), tokens, future))
+        self._wakeup.set()
+        await future
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def record_usage(self, estimated_tokens: int, used_tokens: int):
+        self.token_bucket.adjust(used_tokens - estimated_tokens)
+
+    async def send(self, send, tokens: int, priority: float = None) -> httpx.Response:
+        """
+        Sends a request through the scheduler, retrying rate-limited and failed attempts.
+
+        Parameters:
+        - send (callable): Coroutine function performing one attempt and returning the response.
+        - tokens (int): Estimated number of tokens the request will use.
+        - priority (float): Higher values are dispatched first; defaults to the submission time.
+
+        Returns:
+        - httpx.Response: The last response received, which may still be an error response.
+        """
+        if priority is None:
+            priority = time.monotonic()
+
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(tokens, priority)
+            self.in_flight += 1
+            self.dispatched += 1
+            try:
+                response = await send()
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(self.backoff(attempt))
+                continue
+            finally:
+                self.in_flight -= 1
+
+            if response.status_code == 429:
+                self.throttled += 1
+                delay = parse_retry_after(response.headers.get("retry-after"))
+                self.pause(delay if delay is not None else self.backoff(attempt))
+            elif response.status_code >= 500:
+                self.server_errors += 1
+                delay = self.backoff(attempt)
+            else:
+                return response
+
+            if attempt == self.max_retries:
+                return response
+            # Release the connection of a streamed response that will not be read
+            await response.aclose()
+            self.retries += 1
+            if response.status_code >= 500:
+                await asyncio.sleep(delay)
+
+    def metrics(self):
+        return {
+            "queue_depth": sum(1 for entry in self._queue if not entry[3].done()),
+            "in_flight": self.in_flight,
+            "dispatched": self.dispatched,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "server_errors": self.server_errors,
+            "paused_for_seconds": round(max(0.0, self._paused_until - time.monotonic()), 3),
+        }
+
+# Initialize the scheduler shared by all outbound model calls
+request_scheduler = RequestScheduler(
+    settings.MISTRAL_REQUESTS_PER_SECOND,
+    settings.MISTRAL_TOKENS_PER_MINUTE,
+    settings.MISTRAL_MAX_RETRIES,
+    settings.MISTRAL_BACKOFF_BASE_SECONDS,
+    settings.MISTRAL_BACKOFF_MAX_SECONDS,
+)
@@ -0,0 +1,305 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from core.config import settings
+
+class SessionConflict(Exception):
+    """
+    The session was saved by another request, e.g. on another worker, since it was read.
+    """
+
+class NavigationSession:
+    """
+    What is known about one user's ongoing navigation: their request, the plan the model
+    made for it and how far along it they are. Later frames of the session are checked
+    against this plan instead of being planned from scratch.
+    """
+
+    def __init__(self, session_id: str, venue_id: str = None, transcription: str = None, target_task: str = None, current_location: str = None,
+                 plan: list = None, current_step: int = 1, arrived: bool = False, progress_checks: int = 0, replans: int = 0,
+                 cue_signature: list = None, frames_since_model: int = 0, updated_at: float = None, version: int = 0):
+        self.session_id = session_id
+        self.venue_id = venue_id
+        self.transcription = transcription
+        self.target_task = target_task
+        self.current_location = current_location
+        self.plan = plan or []
+        self.current_step = current_step
+        self.arrived = arrived
+        # Progress checks since the plan was made, and plans made over the session's lifetime
+        self.progress_checks = progress_checks
+        self.replans = replans
+        # Local cues of the last frame sent to the model, and frames answered locally since (see utils.frame_cues)
+        self.cue_signature = cue_signature
+        self.frames_since_model = frames_since_model
+        self.updated_at = updated_at or time.time()
+        # Saves of the session so far, 0 for a new one; stores only save over the version that was read
+        self.version = version
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "NavigationSession":
+        return cls(**data)
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+    @property
+    def has_plan(self) -> bool:
+        return bool(self.plan)
+
+    @property
+    def current_action(self):
+        """
+        The plan step being performed, or None when there is no plan.
+        """
+        if not self.plan:
+            return None
+        return self.plan[min(max(self.current_step, 1), len(self.plan)) - 1]
+
+    def touch(self):
+        """
+        Records activity on the session, which keeps it from expiring.
+        """
+        self.updated_at = time.time()
+
+    def apply_plan(self, transcription: str, venue_id: str, result: dict):
+        """
+        Replaces the plan with the one from a full navigation result.
+        """
+        self.transcription = transcription
+        self.venue_id = venue_id
+        self.target_task = result.get("target_task")
+        self.current_location = result.get("current_location")
+        self.plan = result.get("plan") if isinstance(result.get("plan"), list) else []
+        self.current_step = 1
+        self.arrived = False
+        self.progress_checks = 0
+        self.replans += 1
+        self.updated_at = time.time()
+
+    def apply_progress(self, result: dict) -> bool:
+        """
+        Updates the progress from a progress check result.
+
+        Returns:
+        - bool: False if the result says the person diverged from the plan, or does not
+          fit the plan, in which case nothing is updated and the plan should be remade.
+        """
+        step = result.get("current_step")
+        if result.get("on_track") is not True or not isinstance(step, int) or not 1 <= step <= len(self.plan):
+            return False
+        self.current_step = step
+        self.current_location = result.get("current_location") or self.current_location
+        self.arrived = result.get("arrived") is True
+        self.progress_checks += 1
+        self.updated_at = time.time()
+        return True
+
+    def describe_plan(self) -> str:
+        """
+        The plan and progress as text for the progress check prompt.
+        """
+        lines = [f"Target: {self.target_task or self.transcription}", "Plan:"]
+        for number, step in enumerate(self.plan, start=1):
+            if isinstance(step, dict):
+                text = step.get("action", "")
+                if step.get("description"):
+                    text += f" - {step['description']}"
+            else:
+                text = str(step)
+            lines.append(f"{number}. {text}")
+        lines.append(f"Last known location: {self.current_location or 'unknown'}, performing step {self.current_step}.")
+        return "\n".join(lines)
+
+    def navigation(self) -> dict:
+        """
+        The session's state in the shape of a navigation result.
+        """
+        return {
+            "current_location": self.current_location,
+            "target_task": self.target_task,
+            "plan": self.plan,
+            "current_step": self.current_step,
+            "current_action": self.current_action,
+            "arrived": self.arrived,
+        }
+
+class SessionStore:
+    """
+    In-memory store of navigation sessions.
+
+    Sessions expire `ttl_seconds` after their last update; at most `max_sessions` are
+    kept, the least recently used are dropped first. Saves are compare-and-swap on the
+    session's version, like in SqliteSessionStore.
+    """
+
+    def __init__(self, ttl_seconds: float, max_sessions: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conflicts = 0
+
+    def get(self, session_id: str):
+        """
+        Returns the session, or None if it does not exist or has expired.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and time.time() - session.updated_at > self.ttl_seconds:
+                del self._sessions[session_id]
+                session = None
+            if session is None:
+                self.misses += 1
+                return None
+            self._sessions.move_to_end(session_id)
+            self.hits += 1
+            # A copy, so the stored session only changes through save
+            return NavigationSession.from_dict(session.to_dict())
+
+    def save(self, session: NavigationSession):
+        """
+        Saves the session and advances its version.
+
+        :raises SessionConflict: If the stored session is not the version that was read
+        """
+        with self._lock:
+            stored = self._sessions.get(session.session_id)
+            if stored is not None and time.time() - stored.updated_at > self.ttl_seconds:
+                stored = None
+            if (stored.version if stored is not None else 0) != session.version:
+                self.conflicts += 1
+                raise SessionConflict(f"Session {session.session_id} was saved by another request")
+            self._sessions[session.session_id] = NavigationSession.from_dict({**session.to_dict(), "version": session.version + 1})
+            self._sessions.move_to_end(session.session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        session.version += 1
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "hits": self.hits,
+                "misses": self.misses,
+                "conflicts": self.conflicts,
+            }
+
+class SqliteSessionStore:
+    """
+    Navigation sessions stored in SQLite, so they survive restarts and are shared by the
+    workers of one host. Same interface and expiry as SessionStore.
+
+    Workers do not share locks, so two of them can process frames of the same session
+    at once. Each save only succeeds over the version of the session that was read;
+    the request that loses raises SessionConflict and has to read the session again.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._conn = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conflicts = 0
+
+    def _connect(self):
+        # Connect lazily so importing the service does not touch the disk
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+            if columns and "version" not in columns:
+                # A store from before sessions were versioned; sessions are short-lived, start afresh
+                self._conn.execute("DROP TABLE sessions")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    version INTEGER NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        return self._conn
+
+    def get(self, session_id: str):
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT state, updated_at, version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None or time.time() - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return NavigationSession.from_dict({**json.loads(row[0]), "version": row[2]})
+
+    def save(self, session: NavigationSession):
+        """
+        Saves the session and advances its version.
+
+        :raises SessionConflict: If the stored session is not the version that was read
+        """
+        now = time.time()
+        version = session.version + 1
+        state = json.dumps({**session.to_dict(), "version": version})
+        with self._lock:
+            conn = self._connect()
+            # One transaction, committed on success and rolled back on a conflict
+            with conn:
+                if session.version == 0:
+                    # A new session may only take the place of an expired one
+                    conn.execute("DELETE FROM sessions WHERE session_id = ? AND updated_at < ?", (session.session_id, now - self.ttl_seconds))
+                    saved = conn.execute(
+                        "INSERT OR IGNORE INTO sessions (session_id, state, updated_at, version) VALUES (?, ?, ?, ?)",
+                        (session.session_id, state, session.updated_at, version),
+                    ).rowcount
+                else:
+                    saved = conn.execute(
+                        "UPDATE sessions SET state = ?, updated_at = ?, version = ? WHERE session_id = ? AND version = ?",
+                        (state, session.updated_at, version, session.session_id, session.version),
+                    ).rowcount
+                if not saved:
+                    self.conflicts += 1
+                    raise SessionConflict(f"Session {session.session_id} was saved by another request")
+                conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl_seconds,))
+        session.version = version
+
+    def delete(self, session_id: str):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            conn.commit()
+
+    def stats(self):
+        with self._lock:
+            conn = self._connect()
+            sessions = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "sessions": sessions,
+            "hits": self.hits,
+            "misses": self.misses,
+            "conflicts": self.conflicts,
+        }
+
+# Initialize the store
+session_store = (
+    SqliteSessionStore(settings.SESSION_STORE_PATH, settings.SESSION_TTL_SECONDS)
+    if settings.SESSION_STORE_BACKEND == "sqlite"
+    else SessionStore(settings.SESSION_TTL_SECONDS, settings.SESSION_STORE_MAX_SESSIONS)
+)
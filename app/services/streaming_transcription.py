@@ -0,0 +1,158 @@
+import asyncio
+from collections import deque
+import numpy as np
+from core.config import settings
+from utils.audio_processing import SAMPLING_RATE
+
+class StreamingTranscriber:
+    """
+    Splits one live audio stream into utterances and decides when to transcribe them.
+
+    Samples (16 kHz mono float32) are fed in as they arrive and cut into short frames.
+    An energy-based voice activity detector gates the model: silence is never sent for
+    transcription. While speech is active, the current utterance is re-transcribed every
+    `partial_interval_seconds` to produce a partial hypothesis; after `silence_seconds` of
+    silence it is transcribed once more as the final hypothesis and dropped. Utterances
+    are capped at `max_utterance_seconds` and finalised early when they reach it, which
+    bounds the memory used per connection.
+
+    `feed` and `flush` return transcription requests: dicts with the request "type"
+    ("partial" or "final"), the utterance "audio" and its "start"/"end" in stream seconds.
+    """
+
+    def __init__(self, energy_threshold: float = None, silence_seconds: float = None,
+                 partial_interval_seconds: float = None, max_utterance_seconds: float = None,
+                 frame_seconds: float = 0.03, preroll_seconds: float = 0.3):
+        energy_threshold = settings.STREAM_VAD_ENERGY_THRESHOLD if energy_threshold is None else energy_threshold
+        silence_seconds = settings.STREAM_SILENCE_SECONDS if silence_seconds is None else silence_seconds
+        partial_interval_seconds = settings.STREAM_PARTIAL_INTERVAL_SECONDS if partial_interval_seconds is None else partial_interval_seconds
+        max_utterance_seconds = settings.STREAM_MAX_UTTERANCE_SECONDS if max_utterance_seconds is None else max_utterance_seconds
+
+        self.energy_threshold = energy_threshold
+        self.frame_size = int(SAMPLING_RATE * frame_seconds)
+        self.silence_frames = max(1, int(silence_seconds / frame_seconds))
+        self.partial_interval = int(SAMPLING_RATE * partial_interval_seconds)
+        self.max_utterance = int(SAMPLING_RATE * max_utterance_seconds)
+
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._preroll = deque(maxlen=max(1, int(preroll_seconds / frame_seconds)))
+        self._utterance = []
+        self._utterance_samples = 0
+        self._utterance_start = 0.0
+        self._silent_frames = 0
+        self._since_partial = 0
+        self.position = 0
+
+    def feed(self, samples) -> list:
+        pending = np.concatenate([self._pending, samples]) if len(self._pending) else np.asarray(samples, dtype=np.float32)
+        full_frames = len(pending) // self.frame_size
+
+        requests = []
+        for i in range(full_frames):
+            frame = pending[i * self.frame_size:(i + 1) * self.frame_size]
+            request = self._process_frame(frame)
+            if request is not None:
+                requests.append(request)
+
+        self._pending = pending[full_frames * self.frame_size:].copy()
+        return requests
+
+    def flush(self) -> list:
+        """
+        Finalises the utterance in progress, e.g. when the client ends the stream.
+        """
+        if not self._utterance:
+            return []
+        return [self._finish()]
+
+    def _process_frame(self, frame):
+        frame_start = self.position / SAMPLING_RATE
+        self.position += len(frame)
+        voiced = float(np.sqrt(np.mean(frame ** 2))) >= self.energy_threshold
+
+        if not self._utterance:
+            if not voiced:
+                self._preroll.append(frame)
+                return None
+            # Speech onset: keep a little audio from before it so the first word is not clipped
+            self._utterance = list(self._preroll) + [frame]
+            self._utterance_samples = sum(len(f) for f in self._utterance)
+            self._utterance_start = frame_start - (self._utterance_samples - len(frame)) / SAMPLING_RATE
+            self._preroll.clear()
+            self._silent_frames = 0
+            self._since_partial = 0
+            return None
+
+        self._utterance.append(frame)
+        self._utterance_samples += len(frame)
+        self._silent_frames = 0 if voiced else self._silent_frames + 1
+
+        if self._silent_frames >= self.silence_frames or self._utterance_samples >= self.max_utterance:
+            return self._finish()
+
+        self._since_partial += len(frame)
+        if self._since_partial >= self.partial_interval:
+            self._since_partial = 0
+            return self._request("partial")
+        return None
+
+    def _request(self, request_type):
+        audio = np.concatenate(self._utterance)
+        return {
+            "type": request_type,
+            "audio": audio,
+            "start": round(self._utterance_start, 3),
+            "end": round(self._utterance_start + len(audio) / SAMPLING_RATE, 3),
+        }
+
+    def _finish(self):
+        request = self._request("final")
+        self._utterance = []
+        self._utterance_samples = 0
+        return request
+
+class FfmpegStreamDecoder:
+    """
+    Decodes a compressed audio stream (e.g. Opus in WebM or Ogg, as recorded by browsers)
+    to 16 kHz mono float32 samples by piping it through a long-running ffmpeg process.
+    """
+
+    def __init__(self):
+        self._process = None
+
+    async def start(self):
+        self._process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-loglevel", "quiet", "-i", "pipe:0",
+            "-f", "f32le", "-ac", "1", "-ar", str(SAMPLING_RATE), "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+        )
+
+    async def write(self, data: bytes):
+        self._process.stdin.write(data)
+        await self._process.stdin.drain()
+
+    async def end(self):
+        if self._process.stdin.can_write_eof():
+            self._process.stdin.write_eof()
+
+    async def read(self):
+        """
+        Returns the next block of decoded samples, or None once ffmpeg has finished.
+        """
+        # Read about 100 ms of float32 samples at a time
+        data = await self._process.stdout.read(SAMPLING_RATE * 4 // 10)
+        if not data:
+            return None
+        remainder = len(data) % 4
+        if remainder:
+            try:
+                data += await self._process.stdout.readexactly(4 - remainder)
+            except asyncio.IncompleteReadError:
+                data = data[:len(data) - remainder]
+        return np.frombuffer(data, dtype="<f4")
+
+    async def close(self):
+        if self._process is not None and self._process.returncode is None:
+            self._process.kill()
+            await self._process.wait()
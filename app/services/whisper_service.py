@@ -1,34 +1,231 @@
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
 import torch
 from transformers import pipeline
 from transformers.utils import is_flash_attn_2_available
+from core.config import settings
+from core.telemetry import get_logger, span
+from services.batching import MicroBatcher
+from utils.audio_processing import SAMPLING_RATE, decode_audio
 
-def setup_whisper():
+logger = get_logger(__name__)
+
+# Inference backends that can be selected with WHISPER_CPU_BACKEND when no GPU is available
+CPU_BACKENDS = ("none", "int8", "compile", "onnx")
+
+def setup_whisper(cpu_backend=None):
     device = "mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu"
     torch_dtype = torch.float16 if device != "cpu" else torch.float32
+    cpu_backend = cpu_backend or settings.WHISPER_CPU_BACKEND
+    if cpu_backend not in CPU_BACKENDS:
+        raise ValueError(f"Unknown Whisper CPU backend {cpu_backend!r}, expected one of {CPU_BACKENDS}")
+
+    if device == "cpu" and cpu_backend == "onnx":
+        return setup_whisper_onnx()
 
     pipe = pipeline(
         "automatic-speech-recognition",
-        model="openai/whisper-large-v3-turbo",
+        model=settings.WHISPER_MODEL,
         torch_dtype=torch_dtype,
         device=device,
         # Uncomment the following line if you want to use flash attention 2 (when available)
         # model_kwargs={"attn_implementation": "flash_attention_2"} if is_flash_attn_2_available() else {"attn_implementation": "sdpa"},
     )
 
+    if device == "cpu":
+        optimize_for_cpu(pipe, cpu_backend)
+
     return pipe
 
-def transcribe_audio(pipe, audio):
-    result = pipe(
-        audio,
-        chunk_length_s=30,
-        batch_size=24,
-        return_timestamps=True,
+def optimize_for_cpu(pipe, cpu_backend):
+    """
+    Applies the selected CPU optimisation to a float32 pipeline in place.
+
+    - "int8": dynamic int8 quantisation of every linear layer (weights stored as int8,
+      activations quantised on the fly).
+    - "compile": compiles the model's forward pass with torch.compile; the first
+      inference pays the compilation cost, which the warm-up absorbs.
+    """
+    if settings.WHISPER_CPU_THREADS:
+        torch.set_num_threads(settings.WHISPER_CPU_THREADS)
+
+    if cpu_backend == "int8":
+        pipe.model = torch.ao.quantization.quantize_dynamic(pipe.model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif cpu_backend == "compile":
+        pipe.model.forward = torch.compile(pipe.model.forward)
+
+def onnx_export_path() -> str:
+    return os.path.join(settings.WHISPER_ONNX_EXPORT_DIR, settings.WHISPER_MODEL.replace("/", "--"))
+
+def setup_whisper_onnx():
+    """
+    Builds the pipeline on an ONNX Runtime export of the model. Requires `optimum[onnxruntime]`;
+    the export is done on first load and saved with the processor under
+    WHISPER_ONNX_EXPORT_DIR, later loads read it from there.
+    """
+    try:
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+        from transformers import AutoProcessor
+    except ImportError:
+        raise ImportError("The onnx Whisper backend requires optimum[onnxruntime] to be installed")
+
+    export_path = onnx_export_path()
+    if os.path.isdir(export_path):
+        model = ORTModelForSpeechSeq2Seq.from_pretrained(export_path)
+        processor = AutoProcessor.from_pretrained(export_path)
+    else:
+        logger.info("Exporting %s to ONNX, this takes a while on the first start", settings.WHISPER_MODEL)
+        model = ORTModelForSpeechSeq2Seq.from_pretrained(settings.WHISPER_MODEL, export=True)
+        processor = AutoProcessor.from_pretrained(settings.WHISPER_MODEL)
+        save_onnx_export(model, processor, export_path)
+    return pipeline(
+        "automatic-speech-recognition",
+        model=model,
+        tokenizer=processor.tokenizer,
+        feature_extractor=processor.feature_extractor,
     )
+
+def save_onnx_export(model, processor, export_path):
+    """
+    Saves an export next to its final path and moves it there in one step, so a start
+    interrupted mid-save, or another worker exporting at the same time, never leaves a
+    partial export behind.
+    """
+    parent = os.path.dirname(export_path)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent, prefix=".export-")
+    try:
+        model.save_pretrained(staging)
+        processor.save_pretrained(staging)
+        os.rename(staging, export_path)
+    except OSError as e:
+        # Not fatal, the next start exports again, unless another worker saved it first
+        if not os.path.isdir(export_path):
+            logger.warning("Could not save the ONNX export to %s: %s", export_path, e)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+def prepare_audio(audio):
+    """
+    Decodes uploaded audio bytes in process when the format allows it, so the pipeline
+    only has to shell out to ffmpeg for formats we cannot decode ourselves.
+    """
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        samples = decode_audio(audio)
+        if samples is not None:
+            return {"raw": samples, "sampling_rate": SAMPLING_RATE}
+    if isinstance(audio, dict):
+        # The pipeline pops keys from dict inputs, a copy keeps the item intact for retries
+        return dict(audio)
+    return audio
+
+def transcribe_audio(pipe, audio):
+    audio = prepare_audio(audio)
+    with span("whisper_inference", batch_size=1):
+        result = pipe(
+            audio,
+            chunk_length_s=30,
+            batch_size=24,
+            return_timestamps=True,
+        )
     return result["text"], result["chunks"]
 
+def transcribe_audio_batch(pipe, audios):
+    audios = [prepare_audio(audio) for audio in audios]
+    with span("whisper_inference", batch_size=len(audios)):
+        results = pipe(
+            audios,
+            chunk_length_s=30,
+            batch_size=24,
+            return_timestamps=True,
+        )
+    return [(result["text"], result["chunks"]) for result in results]
+
 class WhisperService:
-    def __init__(self):
-        self.pipe = setup_whisper()
+    def __init__(self, cpu_backend=None):
+        self.pipe = setup_whisper(cpu_backend)
 
     def transcribe(self, audio):
-        return transcribe_audio(self.pipe, audio)
\ No newline at end of file
+        return transcribe_audio(self.pipe, audio)
+
+    def transcribe_batch(self, audios):
+        return transcribe_audio_batch(self.pipe, audios)
+
+    def warm_up(self):
+        """
+        Runs one inference on a second of silence so the first real request does not pay
+        for lazy initialisation and kernel compilation.
+        """
+        silence = np.zeros(SAMPLING_RATE, dtype=np.float32)
+        self.transcribe({"raw": silence, "sampling_rate": SAMPLING_RATE})
+
+
+# Process-wide registry so the model is only ever loaded once
+_whisper_service = None
+_whisper_lock = threading.Lock()
+_whisper_loading = False
+_whisper_error = None
+
+def get_whisper_service() -> WhisperService:
+    """
+    Returns the shared WhisperService, loading and warming it up on first use.
+    Concurrent callers wait for the same load instead of loading the model again.
+    """
+    global _whisper_service, _whisper_loading, _whisper_error
+    if _whisper_service is None:
+        with _whisper_lock:
+            if _whisper_service is None:
+                _whisper_loading = True
+                try:
+                    service = WhisperService()
+                    if settings.WHISPER_WARMUP:
+                        service.warm_up()
+                    _whisper_service = service
+                    _whisper_error = None
+                except Exception as e:
+                    _whisper_error = str(e)
+                    raise
+                finally:
+                    _whisper_loading = False
+    return _whisper_service
+
+def start_background_load():
+    """
+    Loads the shared WhisperService in a daemon thread so the server can start accepting
+    requests while the model loads.
+    """
+    def load():
+        try:
+            get_whisper_service()
+        except Exception as e:
+            logger.error("Error loading Whisper model: %s", e)
+
+    threading.Thread(target=load, name="whisper-loader", daemon=True).start()
+
+def transcribe_batch(audios):
+    return get_whisper_service().transcribe_batch(audios)
+
+# Requests arriving within a few milliseconds of each other share one pipeline call
+whisper_batcher = MicroBatcher(
+    transcribe_batch,
+    settings.WHISPER_MAX_BATCH_SIZE,
+    settings.WHISPER_BATCH_MAX_WAIT_MS / 1000,
+    name="whisper-batcher",
+)
+
+def whisper_status() -> dict:
+    """
+    Whether audio requests can be served. With WHISPER_LOAD_MODE "lazy" the model only
+    loads on the first request, so it counts as ready before that unless loading failed.
+    """
+    loaded = _whisper_service is not None
+    return {
+        "ready": loaded or (settings.WHISPER_LOAD_MODE == "lazy" and _whisper_error is None),
+        "loaded": loaded,
+        "load_mode": settings.WHISPER_LOAD_MODE,
+        "loading": _whisper_loading,
+        "error": _whisper_error,
+    }
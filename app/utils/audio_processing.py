@@ -0,0 +1,214 @@
+import io
+import struct
+import numpy as np
+from core.telemetry import span
+
+try:
+    from scipy.signal import firwin, resample_poly
+except ImportError:
+    firwin = resample_poly = None
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+# Whisper models expect 16 kHz mono audio
+SAMPLING_RATE = 16000
+
+# Raw PCM sample formats accepted from clients
+PCM_ENCODINGS = {
+    "pcm_s16le": np.dtype("<i2"),
+    "pcm_f32le": np.dtype("<f4"),
+}
+
+def pcm_to_float32(data, encoding="pcm_s16le"):
+    """
+    Converts raw little-endian mono PCM bytes to float32 samples in [-1, 1].
+
+    Parameters:
+    - data (bytes): The raw PCM data; a trailing partial sample is ignored.
+    - encoding (str): One of PCM_ENCODINGS.
+
+    Returns:
+    - np.ndarray: The float32 samples.
+    """
+    dtype = PCM_ENCODINGS[encoding]
+    usable = len(data) - len(data) % dtype.itemsize
+    samples = np.frombuffer(memoryview(data)[:usable], dtype=dtype)
+    if dtype.kind == "i":
+        return samples.astype(np.float32) / 32768.0
+    return samples.astype(np.float32)
+
+# WAV format tags
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# (format tag, bits per sample) -> (sample dtype, offset, scale to [-1, 1])
+WAV_SAMPLE_FORMATS = {
+    (WAVE_FORMAT_PCM, 8): (np.dtype("u1"), 128.0, 1 / 128.0),
+    (WAVE_FORMAT_PCM, 16): (np.dtype("<i2"), 0.0, 1 / 32768.0),
+    (WAVE_FORMAT_PCM, 32): (np.dtype("<i4"), 0.0, 1 / 2147483648.0),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): (np.dtype("<f4"), 0.0, 1.0),
+    (WAVE_FORMAT_IEEE_FLOAT, 64): (np.dtype("<f8"), 0.0, 1.0),
+}
+
+def resample(samples, sample_rate, target_rate=SAMPLING_RATE):
+    """
+    Resamples float32 audio to `target_rate`, with a polyphase filter when SciPy is
+    installed and linear interpolation otherwise.
+    """
+    if sample_rate == target_rate or len(samples) == 0:
+        return samples
+    if resample_poly is not None:
+        divisor = np.gcd(int(sample_rate), int(target_rate))
+        return resample_poly(samples, target_rate // divisor, int(sample_rate) // divisor).astype(np.float32)
+    duration = len(samples) / sample_rate
+    target_length = int(round(duration * target_rate))
+    positions = np.linspace(0, len(samples) - 1, target_length)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+class StreamResampler:
+    """
+    Resamples audio that arrives in chunks, such as the messages of a live stream, to
+    `target_rate`. Resampling each chunk on its own restarts the filter at every chunk
+    boundary, which adds clicks and rounds the output length of every chunk, so the
+    stream drifts. This filter keeps the input samples it still needs and the position
+    of the next output sample from one chunk to the next, and gives the same output as
+    resampling the whole stream at once.
+
+    Uses the anti-aliasing filter of `resample_poly` when SciPy is installed, and linear
+    interpolation otherwise.
+    """
+
+    def __init__(self, sample_rate, target_rate=SAMPLING_RATE):
+        divisor = np.gcd(int(sample_rate), int(target_rate))
+        self.up = int(target_rate) // divisor
+        self.down = int(sample_rate) // divisor
+        if self.up == self.down:
+            taps, self.delay = np.ones(1), 0
+        elif firwin is not None:
+            max_rate = max(self.up, self.down)
+            self.delay = 10 * max_rate
+            taps = firwin(2 * self.delay + 1, 1.0 / max_rate, window=("kaiser", 5.0)) * self.up
+        else:
+            self.delay = self.up - 1
+            taps = 1.0 - np.abs(np.arange(2 * self.up - 1) - self.delay) / self.up
+
+        # Polyphase form: row p holds the taps applied to the input for output phase p
+        width = -(-len(taps) // self.up)
+        taps = np.concatenate([taps, np.zeros(width * self.up - len(taps))])
+        self.phases = taps.reshape(width, self.up).T.astype(np.float32)
+        # The last input samples still needed by the filter, zeros before the stream starts
+        self._history = np.zeros(width - 1, dtype=np.float32)
+        self._received = 0
+        self._produced = 0
+
+    def process(self, samples):
+        """
+        Returns the output samples that the input received so far fully determines.
+        """
+        samples = np.asarray(samples, dtype=np.float32)
+        buffer_start = self._received - len(self._history)
+        buffer = np.concatenate([self._history, samples])
+        self._received += len(samples)
+
+        # Output n is centred on the upsampled input position n * down + delay
+        last = (self._received * self.up - 1 - self.delay) // self.down
+        positions = np.arange(self._produced, last + 1, dtype=np.int64) * self.down + self.delay
+        self._produced = max(self._produced, last + 1)
+        width = self.phases.shape[1]
+        self._history = buffer[len(buffer) - (width - 1):] if width > 1 else buffer[:0]
+        if not len(positions):
+            return np.zeros(0, dtype=np.float32)
+
+        newest = positions // self.up - buffer_start
+        window = buffer[newest[:, None] - np.arange(width)[None, :]]
+        return np.einsum("nk,nk->n", window, self.phases[positions % self.up]).astype(np.float32)
+
+    def flush(self):
+        """
+        Returns the rest of the output at the end of the stream, padding the input with silence.
+        """
+        total = -(-self._received * self.up // self.down)
+        pending = total - self._produced
+        received = self._received
+        tail = self.process(np.zeros(self.phases.shape[1], dtype=np.float32))[:max(0, pending)]
+        self._received, self._produced = received, total
+        return tail
+
+def decode_wav(data):
+    """
+    Decodes a WAV file held in memory to 16 kHz mono float32 samples.
+
+    The RIFF chunks are walked through a memoryview and the sample data is read with
+    np.frombuffer, so the upload is not copied before the float conversion.
+
+    Returns:
+    - np.ndarray: The samples, or None if the data is not a WAV file in a supported sample format.
+    """
+    view = memoryview(data)
+    if len(view) < 12 or view[0:4] != b"RIFF" or view[8:12] != b"WAVE":
+        return None
+
+    sample_format = None
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = view[offset:offset + 4]
+        chunk_size = int.from_bytes(view[offset + 4:offset + 8], "little")
+        body = view[offset + 8:offset + 8 + chunk_size]
+
+        if chunk_id == b"fmt ":
+            if len(body) < 16:
+                return None
+            format_tag, channels, sample_rate = struct.unpack_from("<HHI", body, 0)
+            bits_per_sample = struct.unpack_from("<H", body, 14)[0]
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                format_tag = struct.unpack_from("<H", body, 24)[0]
+            sample_format = (format_tag, bits_per_sample, channels, sample_rate)
+        elif chunk_id == b"data":
+            if sample_format is None:
+                return None
+            return _decode_pcm_frames(body, *sample_format)
+
+        # Chunks are padded to an even number of bytes
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+def _decode_pcm_frames(body, format_tag, bits_per_sample, channels, sample_rate):
+    if (format_tag, bits_per_sample) not in WAV_SAMPLE_FORMATS or channels < 1:
+        return None
+    dtype, sample_offset, scale = WAV_SAMPLE_FORMATS[(format_tag, bits_per_sample)]
+
+    frame_size = dtype.itemsize * channels
+    usable = len(body) - len(body) % frame_size
+    samples = np.frombuffer(body[:usable], dtype=dtype).astype(np.float32)
+    if sample_offset:
+        samples -= sample_offset
+    samples *= scale
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return resample(samples, sample_rate)
+
+def decode_audio(data):
+    """
+    Decodes an uploaded audio file to 16 kHz mono float32 samples in process.
+
+    WAV is decoded natively; FLAC and Ogg are decoded with soundfile when it is installed.
+
+    Returns:
+    - np.ndarray: The samples, or None for other formats so the caller can fall back to ffmpeg.
+    """
+    with span("audio_decode", bytes=len(data)):
+        samples = decode_wav(data)
+        if samples is not None:
+            return samples
+
+        if soundfile is not None and bytes(data[:4]) in (b"fLaC", b"OggS"):
+            try:
+                samples, sample_rate = soundfile.read(io.BytesIO(data), dtype="float32", always_2d=True)
+            except RuntimeError:
+                return None
+            return resample(samples.mean(axis=1), sample_rate)
+        return None
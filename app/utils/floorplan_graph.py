@@ -0,0 +1,343 @@
+import hashlib
+import heapq
+import math
+import os
+import sys
+import cv2
+import numpy as np
+from core.config import settings
+from core.telemetry import get_logger
+
+logger = get_logger(__name__)
+
+# Bump when the grid construction changes, so stale disk caches are rebuilt
+GRID_VERSION = 1
+
+# The eight neighbours of a grid cell with the length of the step to each
+NEIGHBOURS = [(dx, dy, math.hypot(dx, dy)) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+
+# Average walking step, used to express route distances in steps
+STEP_LENGTH_METERS = 0.75
+
+def free_space_mask(img):
+    """
+    Separates walkable floor from walls with Otsu thresholding. The larger of the two
+    classes is taken to be the floor, so both dark-on-light and light-on-dark plans work.
+
+    :param img: The decoded floorplan (BGR NumPy array)
+    :return: A uint8 mask, 255 for floor and 0 for walls
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if cv2.countNonZero(mask) < mask.size / 2:
+        mask = cv2.bitwise_not(mask)
+    return mask
+
+def skeletonize(mask):
+    """
+    Computes the morphological skeleton of a binary mask: the centre lines of the
+    corridors and rooms, one pixel wide.
+    """
+    kernel = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+    skeleton = np.zeros_like(mask)
+    remaining = mask.copy()
+    while cv2.countNonZero(remaining):
+        eroded = cv2.erode(remaining, kernel)
+        opened = cv2.dilate(eroded, kernel)
+        skeleton = cv2.bitwise_or(skeleton, cv2.subtract(remaining, opened))
+        remaining = eroded
+    return skeleton
+
+class FloorplanGraph:
+    """
+    An occupancy grid of a floorplan with a local shortest-path planner.
+
+    Each cell covers `cell_size` x `cell_size` floorplan pixels and is free when it is
+    mostly floor. `clearance` holds every free cell's distance to the nearest wall in
+    cells, and `skeleton` marks the centre lines of the free space. Routes are planned
+    with A* over the 8-connected grid; steps close to walls cost more, and steps along
+    the skeleton cost nothing extra, so routes keep to the middle of corridors.
+    """
+
+    def __init__(self, free, clearance, skeleton, cell_size: int, image_size: tuple):
+        self.free = free
+        self.clearance = clearance
+        self.skeleton = skeleton
+        self.cell_size = cell_size
+        self.image_size = image_size
+        # Scale of the floorplan image, 0 when unknown
+        self.meters_per_pixel = settings.FLOORPLAN_METERS_PER_PIXEL
+        self._search_grid = self._padded_search_grid()
+
+    @classmethod
+    def from_image(cls, img, max_cells: int = None):
+        max_cells = max_cells or settings.FLOORPLAN_GRID_MAX_CELLS
+        height, width = img.shape[:2]
+        cell_size = max(1, math.ceil(max(width, height) / max_cells))
+        grid_size = (math.ceil(width / cell_size), math.ceil(height / cell_size))
+
+        mask = free_space_mask(img)
+        # Thin gaps such as door swings and furniture outlines should not block the way
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3)))
+        # A cell is free when most of its pixels are floor
+        coverage = cv2.resize(mask, grid_size, interpolation=cv2.INTER_AREA)
+        free = (coverage >= 192).astype(np.uint8) * 255
+
+        clearance = cv2.distanceTransform(free, cv2.DIST_L2, 3)
+        skeleton = skeletonize(free)
+        return cls(free > 0, clearance.astype(np.float32), skeleton > 0, cell_size, (width, height))
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            return cls(data["free"], data["clearance"], data["skeleton"], int(data["cell_size"]), tuple(data["image_size"]))
+
+    def save(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first so a crash never leaves a truncated cache behind
+        temporary_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            temporary_path, free=self.free, clearance=self.clearance, skeleton=self.skeleton,
+            cell_size=self.cell_size, image_size=np.array(self.image_size),
+        )
+        os.replace(temporary_path, path)
+
+    def _padded_search_grid(self):
+        """
+        Returns the free cells and step costs as flat Python lists over the grid padded by
+        one blocked cell on every side, with the padded width. Plain lists are much faster
+        to index than NumPy arrays in the A* loop.
+        """
+        costs = 1.0 + settings.FLOORPLAN_WALL_PENALTY / np.maximum(self.clearance, 1.0)
+        costs[self.skeleton] = 1.0
+        free = np.pad(self.free, 1, constant_values=False)
+        costs = np.pad(costs, 1, constant_values=np.inf)
+        return free.ravel().tolist(), costs.ravel().tolist(), free.shape[1]
+
+    @property
+    def grid_size(self) -> tuple:
+        return self.free.shape[1], self.free.shape[0]
+
+    def to_cell(self, position):
+        """
+        Converts a position given as fractions of the floorplan's width and height to
+        the nearest free cell, or None if there is no free cell at all.
+        """
+        x = min(max(float(position["x"]), 0.0), 1.0)
+        y = min(max(float(position["y"]), 0.0), 1.0)
+        columns, rows = self.grid_size
+        cell = (min(int(x * columns), columns - 1), min(int(y * rows), rows - 1))
+        if self.free[cell[1], cell[0]]:
+            return cell
+
+        free_rows, free_columns = np.nonzero(self.free)
+        if len(free_rows) == 0:
+            return None
+        nearest = np.argmin((free_columns - cell[0]) ** 2 + (free_rows - cell[1]) ** 2)
+        return int(free_columns[nearest]), int(free_rows[nearest])
+
+    def to_position(self, cell) -> dict:
+        columns, rows = self.grid_size
+        return {"x": round((cell[0] + 0.5) / columns, 4), "y": round((cell[1] + 0.5) / rows, 4)}
+
+    def shortest_path(self, start, goal):
+        """
+        Finds the cheapest path between two free cells with A*.
+
+        :return: The list of (column, row) cells from start to goal, or None if the goal cannot be reached
+        """
+        if start == goal:
+            return [start]
+        # Search over flat indices of the padded grid: its blocked border makes bounds checks unnecessary
+        free, costs, width = self._search_grid
+        start_index = (start[1] + 1) * width + start[0] + 1
+        goal_index = (goal[1] + 1) * width + goal[0] + 1
+        goal_x, goal_y = goal[0] + 1, goal[1] + 1
+        neighbours = [(dy * width + dx, dx, dy, length) for dx, dy, length in NEIGHBOURS]
+
+        came_from = {start_index: -1}
+        best = {start_index: 0.0}
+        expanded = set()
+        frontier = [(0.0, start_index)]
+        hypot = math.hypot
+        while frontier:
+            _, index = heapq.heappop(frontier)
+            # Skip stale queue entries of cells already reached more cheaply
+            if index in expanded:
+                continue
+            expanded.add(index)
+            if index == goal_index:
+                path = []
+                while index != -1:
+                    y, x = divmod(index, width)
+                    path.append((x - 1, y - 1))
+                    index = came_from[index]
+                return path[::-1]
+
+            cost_so_far = best[index]
+            for offset, dx, dy, length in neighbours:
+                neighbour = index + offset
+                if not free[neighbour]:
+                    continue
+                # Do not cut diagonally through the corner of a wall
+                if dx and dy and not (free[index + dx] and free[index + dy * width]):
+                    continue
+                cost = cost_so_far + length * costs[neighbour]
+                if cost < best.get(neighbour, math.inf):
+                    best[neighbour] = cost
+                    came_from[neighbour] = index
+                    # The straight-line distance never overestimates since every step costs at least its length
+                    y, x = divmod(neighbour, width)
+                    heapq.heappush(frontier, (cost + hypot(goal_x - x, goal_y - y), neighbour))
+        return None
+
+    def plan(self, start_position: dict, goal_position: dict):
+        """
+        Plans a route between two positions given as fractions of the floorplan's width
+        and height, e.g. {"x": 0.25, "y": 0.8}.
+
+        Returns:
+        - dict: The "waypoints" of the simplified route, its "distance" in floorplan pixels,
+          and "steps" in the format of the model's navigation plan; None if no route exists.
+        """
+        start = self.to_cell(start_position)
+        goal = self.to_cell(goal_position)
+        if start is None or goal is None:
+            return None
+        path = self.shortest_path(start, goal)
+        if path is None:
+            return None
+
+        if len(path) > 2:
+            # Keep only the corners of the path
+            corners = cv2.approxPolyDP(np.array(path, dtype=np.int32).reshape(-1, 1, 2), 1.0, False)
+            waypoints = [tuple(int(v) for v in point[0]) for point in corners]
+        else:
+            waypoints = path
+
+        distance = sum(math.dist(a, b) for a, b in zip(waypoints, waypoints[1:])) * self.cell_size
+        return {
+            "waypoints": [self.to_position(cell) for cell in waypoints],
+            "distance": round(distance, 1),
+            "steps": self.describe(waypoints),
+        }
+
+    def describe(self, waypoints) -> list:
+        """
+        Turns route waypoints into turn-by-turn steps.
+        """
+        if len(waypoints) < 2:
+            return [{"step_number": 1, "action": "Stay", "description": "You have arrived at your destination."}]
+
+        steps = []
+        previous = None
+        for a, b in zip(waypoints, waypoints[1:]):
+            direction = (b[0] - a[0], b[1] - a[1])
+            distance = self.describe_distance(math.hypot(*direction) * self.cell_size)
+            if previous is None:
+                action = f"Head {map_direction(direction)}"
+                description = f"Walk {distance} towards the {map_direction(direction)} of the floor plan."
+            else:
+                turn = turn_direction(previous, direction)
+                action = f"Turn {turn}" if turn != "straight" else "Continue straight"
+                description = f"{action} and walk {distance}."
+            steps.append({"step_number": len(steps) + 1, "action": action, "description": description})
+            previous = direction
+        steps.append({"step_number": len(steps) + 1, "action": "Arrive", "description": "You have arrived at your destination."})
+        return steps
+
+    def describe_distance(self, pixels: float) -> str:
+        if self.meters_per_pixel > 0:
+            meters = pixels * self.meters_per_pixel
+            return f"about {max(1, round(meters / STEP_LENGTH_METERS))} steps ({meters:.0f} m)"
+        return f"about {pixels / max(self.image_size):.0%} of the floor plan"
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate memory held by the grid, including the flat search lists.
+        """
+        arrays = self.free.nbytes + self.clearance.nbytes + self.skeleton.nbytes
+        # A list slot is a pointer; each distinct cost is a float object
+        free, costs, _ = self._search_grid
+        return arrays + 8 * (len(free) + len(costs)) + 24 * len(costs)
+
+    def stats(self):
+        return {
+            "grid_size": list(self.grid_size),
+            "cell_size": self.cell_size,
+            "free_cells": int(self.free.sum()),
+            "skeleton_cells": int(self.skeleton.sum()),
+        }
+
+def map_direction(direction) -> str:
+    """
+    Names the direction of a vector on the floor plan image, e.g. "top left".
+    """
+    angle = math.degrees(math.atan2(-direction[1], direction[0])) % 360
+    names = ["right", "top right", "top", "top left", "left", "bottom left", "bottom", "bottom right"]
+    return names[int((angle + 22.5) // 45) % 8]
+
+def turn_direction(previous, direction) -> str:
+    """
+    Classifies the turn between two consecutive route segments. The image y axis points
+    down, so a positive cross product is a turn to the right.
+    """
+    cross = previous[0] * direction[1] - previous[1] * direction[0]
+    dot = previous[0] * direction[0] + previous[1] * direction[1]
+    angle = math.degrees(math.atan2(cross, dot))
+    if abs(angle) < 30:
+        return "straight"
+    if abs(angle) > 150:
+        return "around"
+    side = "right" if angle > 0 else "left"
+    return f"slightly {side}" if abs(angle) < 60 else side
+
+def graph_cache_path(image_path: str, cache_dir: str = None) -> str:
+    """
+    Returns where the grid of a floorplan is cached, keyed by the image contents and the
+    grid parameters so a changed floorplan or setting is rebuilt.
+    """
+    with open(image_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:16]
+    name = f"{digest}-v{GRID_VERSION}-{settings.FLOORPLAN_GRID_MAX_CELLS}.npz"
+    return os.path.join(cache_dir or settings.FLOORPLAN_GRAPH_CACHE_DIR, name)
+
+def load_floorplan_graph(image_path: str, cache_dir: str = None):
+    """
+    Loads the grid of a floorplan from the disk cache, building and caching it on a miss.
+
+    Returns:
+    - FloorplanGraph: The grid, or None if the floorplan cannot be read.
+    """
+    try:
+        cache_path = graph_cache_path(image_path, cache_dir)
+    except OSError:
+        logger.error("The file %s was not found.", image_path)
+        return None
+
+    if os.path.exists(cache_path):
+        try:
+            return FloorplanGraph.load(cache_path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Rebuilding floorplan grid, failed to load %s: %s", cache_path, e)
+
+    img = cv2.imread(image_path)
+    if img is None:
+        logger.error("Failed to read image %s.", image_path)
+        return None
+    graph = FloorplanGraph.from_image(img)
+    graph.save(cache_path)
+    return graph
+
+# Offline stage: build and cache the grid ahead of time
+# python -m utils.floorplan_graph [floorplan_path]
+if __name__ == "__main__":
+    floorplan_path = sys.argv[1] if len(sys.argv) > 1 else settings.FLOORPLAN_IMAGE_PATH
+    floorplan_graph = load_floorplan_graph(floorplan_path)
+    if floorplan_graph is None:
+        sys.exit(1)
+    print(f"Floorplan grid for {floorplan_path}: {floorplan_graph.stats()}")
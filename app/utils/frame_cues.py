@@ -0,0 +1,164 @@
+import cv2
+import numpy as np
+from core.config import settings
+from core.telemetry import span
+
+# Frames are analysed at this width, which keeps the local pass at a few milliseconds on a CPU
+CUE_FRAME_WIDTH = 320
+
+# HSV range of the green of illuminated EU safety signs (RAL 6032, OpenCV hue is 0 to 180)
+EXIT_SIGN_HSV_LOW = np.array([55, 100, 70], dtype=np.uint8)
+EXIT_SIGN_HSV_HIGH = np.array([95, 255, 255], dtype=np.uint8)
+# Exit signs are landscape rectangles, mostly green around a white pictogram
+EXIT_SIGN_ASPECT_RANGE = (1.0, 4.5)
+EXIT_SIGN_MIN_FILL = 0.45
+
+# Frames darker than this (mean brightness, 0 to 1) show too little for the model
+DARK_FRAME_BRIGHTNESS = 0.08
+
+# Canny thresholds of the obstacle heuristic
+EDGE_LOW, EDGE_HIGH = 60, 150
+
+class FrameCues:
+    """
+    Cheap cues computed locally from a live frame: a visible exit sign, how cluttered
+    the walking path in front of the person is, and whether the frame is too dark to
+    tell anything.
+    """
+
+    def __init__(self, exit_sign: dict = None, obstacle_score: float = 0.0, near_obstacle_score: float = 0.0, dark: bool = False):
+        self.exit_sign = exit_sign
+        self.obstacle_score = obstacle_score
+        self.near_obstacle_score = near_obstacle_score
+        self.dark = dark
+
+    @property
+    def obstacle_ahead(self) -> bool:
+        return not self.dark and self.obstacle_score >= settings.OBSTACLE_EDGE_DENSITY
+
+    @property
+    def urgent_hazard(self) -> bool:
+        """
+        An obstacle fills the path right in front of the person.
+        """
+        return self.obstacle_ahead and self.near_obstacle_score >= settings.OBSTACLE_URGENT_EDGE_DENSITY
+
+    @property
+    def signature(self) -> list:
+        """
+        The cues that change what the person should be told; frames with the same
+        signature as the last one sent to the model can reuse its answer.
+        """
+        return [
+            self.exit_sign["side"] if self.exit_sign else None,
+            self.obstacle_ahead,
+            self.dark,
+        ]
+
+    def to_dict(self) -> dict:
+        return {
+            "exit_sign": self.exit_sign,
+            "obstacle_ahead": self.obstacle_ahead,
+            "obstacle_score": round(self.obstacle_score, 3),
+            "urgent_hazard": self.urgent_hazard,
+            "dark": self.dark,
+        }
+
+def side_of(center_x: float) -> str:
+    if center_x < 1 / 3:
+        return "left"
+    if center_x > 2 / 3:
+        return "right"
+    return "ahead"
+
+def find_exit_sign(hsv):
+    """
+    Finds the largest green, sign-shaped region in an HSV frame.
+
+    Returns:
+    - dict: Its bounding box as fractions of the frame, area fraction and side, or None.
+    """
+    height, width = hsv.shape[:2]
+    mask = cv2.inRange(hsv, EXIT_SIGN_HSV_LOW, EXIT_SIGN_HSV_HIGH)
+    # Close the holes left by the white pictogram to find the sign's outline
+    closed = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    best = None
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        area = w * h / (width * height)
+        if area < settings.EXIT_SIGN_MIN_AREA or not EXIT_SIGN_ASPECT_RANGE[0] <= w / h <= EXIT_SIGN_ASPECT_RANGE[1]:
+            continue
+        # Signs are solid green, scattered green pixels (foliage, noise) are not
+        if np.count_nonzero(mask[y:y + h, x:x + w]) / (w * h) < EXIT_SIGN_MIN_FILL:
+            continue
+        if best is None or area > best["area"]:
+            best = {
+                "box": [round(x / width, 3), round(y / height, 3), round(w / width, 3), round(h / height, 3)],
+                "area": round(area, 4),
+                "side": side_of((x + w / 2) / width),
+            }
+    return best
+
+def detect_cues(img) -> FrameCues:
+    """
+    Computes the FrameCues of a decoded frame (BGR NumPy array) with classical OpenCV
+    operations on a downscaled copy.
+
+    The obstacle heuristic relies on floors being smooth: the density of edges in the
+    walking path (the middle third of the lower half of the frame) measures clutter
+    ahead, and the density in its bottom rows how close it is. It is deliberately
+    coarse and only decides whether a frame deserves a model call, or an immediate
+    warning.
+    """
+    with span("local_cues"):
+        height, width = img.shape[:2]
+        # Subsample very large frames first, area interpolation costs grow with the input size
+        step = width // (2 * CUE_FRAME_WIDTH)
+        if step > 1:
+            img = img[::step, ::step]
+            height, width = img.shape[:2]
+        if width > CUE_FRAME_WIDTH:
+            img = cv2.resize(img, (CUE_FRAME_WIDTH, max(1, round(height * CUE_FRAME_WIDTH / width))), interpolation=cv2.INTER_AREA)
+            height, width = img.shape[:2]
+
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        if float(np.mean(hsv[:, :, 2])) / 255.0 < DARK_FRAME_BRIGHTNESS:
+            return FrameCues(dark=True)
+
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        path = gray[height // 2:, width // 3:2 * width // 3]
+        edges = cv2.Canny(cv2.GaussianBlur(path, (5, 5), 0), EDGE_LOW, EDGE_HIGH) > 0
+        near = edges[-max(1, edges.shape[0] // 3):]
+        return FrameCues(
+            exit_sign=find_exit_sign(hsv),
+            obstacle_score=float(edges.mean()) if edges.size else 0.0,
+            near_obstacle_score=float(near.mean()) if near.size else 0.0,
+        )
+
+def gate_frame(cues: FrameCues, last_signature: list, frames_since_model: int) -> str:
+    """
+    Decides what to do with a live frame from its cues.
+
+    Returns:
+    - str: "hazard" to warn the person at once without asking the model, "model" when
+      the frame needs a model call, or "skip" when the last answer still applies: the
+      cues match those of the last frame sent to the model, which was fewer than
+      LOCAL_GATE_MAX_SKIPPED_FRAMES frames ago.
+    """
+    if cues.urgent_hazard:
+        return "hazard"
+    if last_signature is None or cues.signature != last_signature or frames_since_model >= settings.LOCAL_GATE_MAX_SKIPPED_FRAMES:
+        return "model"
+    return "skip"
+
+def hazard_result(cues: FrameCues) -> dict:
+    """
+    The warning given for an urgent hazard, in the shape of a navigation result.
+    """
+    return {
+        "hazard": "obstacle_ahead",
+        "current_action": "Stop. There is an obstacle directly in front of you.",
+        "cues": cues.to_dict(),
+    }
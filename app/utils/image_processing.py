@@ -1,16 +1,28 @@
 import os
 import cv2
 import base64
+import hashlib
 import cv2
+import threading
 import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from core.config import settings
+from core.telemetry import get_logger, span
+from utils.image_sizing import get_policy, estimate_image_tokens
 
-# Define desired dimensions for resizing
+logger = get_logger(__name__)
+
+# Define desired dimensions for resizing, used when no image role is given
 DESIRED_WIDTH, DESIRED_HEIGHT = 800, 600
 DESIRED_SIZE = (DESIRED_WIDTH, DESIRED_HEIGHT)
 
 # Define JPEG quality (lower means faster encoding and smaller size)
 JPEG_QUALITY = 75
 
+# Side length of the grayscale thumbnail used to compare consecutive frames
+FRAME_SIGNATURE_SIZE = 32
+
 def reduce_image_size(input_path, output_path, desired_width=400, desired_height=300, jpeg_quality=75):
     """
     Reduces the size of the image located at input_path and saves it to output_path.
@@ -26,35 +38,35 @@ def reduce_image_size(input_path, output_path, desired_width=400, desired_height
     - bool: True if the image was successfully resized and saved, False otherwise.
     """
     if not os.path.exists(input_path):
-        print(f"Error: The file {input_path} was not found.")
+        logger.error("The file %s was not found.", input_path)
         return False
 
     img = cv2.imread(input_path)
     if img is None:
-        print(f"Error: Failed to read image {input_path}.")
+        logger.error("Failed to read image %s.", input_path)
         return False
 
     # Resize the image if it doesn't match the desired dimensions
     if img.shape[1] != desired_width or img.shape[0] != desired_height:
         try:
             img = cv2.resize(img, (desired_width, desired_height), interpolation=cv2.INTER_AREA)
-            print(f"Image resized to {desired_width}x{desired_height}.")
+            logger.info("Image resized to %dx%d.", desired_width, desired_height)
         except Exception as e:
-            print(f"Error resizing image: {e}")
+            logger.error("Error resizing image: %s", e)
             return False
     else:
-        print("Image already matches the desired dimensions. No resizing needed.")
+        logger.info("Image already matches the desired dimensions. No resizing needed.")
 
     # Save the resized image with the specified JPEG quality
     try:
         success = cv2.imwrite(output_path, img, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
         if not success:
-            print(f"Error: Failed to save image to {output_path}.")
+            logger.error("Failed to save image to %s.", output_path)
             return False
-        print(f"Image successfully saved to {output_path} with JPEG quality {jpeg_quality}.")
+        logger.info("Image successfully saved to %s with JPEG quality %d.", output_path, jpeg_quality)
         return True
     except Exception as e:
-        print(f"Error saving image: {e}")
+        logger.error("Error saving image: %s", e)
         return False
 
     """
@@ -69,8 +81,8 @@ def reduce_image_size(input_path, output_path, desired_width=400, desired_height
     # Read the image using OpenCV
     img = cv2.imread(image_path)
     if img is None:
-        print(f"Error: Failed to read image {image_path}.")
-        
+        logger.error("Failed to read image %s.", image_path)
+
         return None
 
     # Check if resizing is necessary
@@ -81,7 +93,7 @@ def reduce_image_size(input_path, output_path, desired_width=400, desired_height
     # Encode the image to JPEG format
     success, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
     if not success:
-        print(f"Error: Failed to encode image {image_path}.")
+        logger.error("Failed to encode image %s.", image_path)
         return None
 
     # Convert the JPEG buffer to a base64 string
@@ -89,57 +101,450 @@ def reduce_image_size(input_path, output_path, desired_width=400, desired_height
     return encoded_image
 
 
-def encode_image(image_input):
+def read_image(image_input):
     """
-    Encodes an image to a base64 string after resizing it to the desired dimensions.
-    Utilizes OpenCV for faster processing.
-    
-    :param image_input: Either a file path (str) or image data (bytes)
-    :return: Base64 encoded string of the image
+    Decodes an image from a file path (str) or encoded image data (bytes) with OpenCV.
+
+    :return: The decoded BGR image, or None if it could not be read
     """
     if isinstance(image_input, str):
         # If input is a file path, read the image using OpenCV
-        img = cv2.imread(image_input)
+        with span("image_decode"):
+            img = cv2.imread(image_input)
     elif isinstance(image_input, bytes):
         # If input is bytes, convert to numpy array and decode
         nparr = np.frombuffer(image_input, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        with span("image_decode"):
+            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
     else:
-        print("Error: Invalid input type for image.")
+        logger.error("Invalid input type for image.")
+        return None
+
+    if img is None:
+        logger.error("Failed to read image.")
+    return img
+
+def encode_image(image_input, size=DESIRED_SIZE, jpeg_quality=JPEG_QUALITY, role=None):
+    """
+    Encodes an image to a base64 string after resizing it to the desired dimensions.
+    Utilizes OpenCV for faster processing.
+    
+    :param image_input: Either a file path (str) or image data (bytes)
+    :param size: The (width, height) to resize the image to
+    :param jpeg_quality: The JPEG quality used for encoding (0 to 100)
+    :param role: An image role from utils.image_sizing; when given, its policy picks the size and quality
+    :return: Base64 encoded string of the image
+    """
+    img = read_image(image_input)
+    if img is None:
         return None
 
+    return encode_frame(img, size, jpeg_quality, role)
+
+def encode_image_jpeg(image_input, size=DESIRED_SIZE, jpeg_quality=JPEG_QUALITY, role=None):
+    """
+    Same as encode_image, but returns the raw JPEG bytes instead of a base64 string.
+    """
+    img = read_image(image_input)
     if img is None:
-        print("Error: Failed to read image.")
         return None
 
+    return encode_jpeg(img, size, jpeg_quality, role)
+
+def role_encoding(dimensions, role):
+    """
+    Returns the (size, jpeg_quality) the sizing policy of `role` picks for an image of
+    the given (width, height): aspect ratio preserved, patch-aligned and within the
+    role's image-token budget.
+    """
+    policy = get_policy(role)
+    return policy.target_size(*dimensions), policy.jpeg_quality
+
+def encode_jpeg(img, size=DESIRED_SIZE, jpeg_quality=JPEG_QUALITY, role=None):
+    """
+    Resizes an already decoded image (a BGR NumPy array) to the desired dimensions and
+    encodes it as JPEG.
+
+    :param img: The decoded image
+    :param size: The (width, height) to resize the image to
+    :param jpeg_quality: The JPEG quality used for encoding (0 to 100)
+    :param role: An image role from utils.image_sizing; when given, its policy picks the size and quality
+    :return: The JPEG bytes
+    """
+    if role is not None:
+        size, jpeg_quality = role_encoding((img.shape[1], img.shape[0]), role)
+
     # Check if resizing is necessary
-    if img.shape[1] != DESIRED_WIDTH or img.shape[0] != DESIRED_HEIGHT:
-        # Resize the image using INTER_AREA for downscaling
-        img = cv2.resize(img, DESIRED_SIZE, interpolation=cv2.INTER_AREA)
+    if img.shape[1] != size[0] or img.shape[0] != size[1]:
+        # Resize the image using INTER_AREA for downscaling, into this thread's reusable buffer
+        with span("image_resize"):
+            img = cv2.resize(img, size, dst=_resize_buffer(size, img), interpolation=cv2.INTER_AREA)
 
     # Encode the image to JPEG format
-    success, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    with span("image_encode"):
+        success, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
     if not success:
-        print("Error: Failed to encode image.")
+        logger.error("Failed to encode image.")
+        return None
+
+    return buffer.tobytes()
+
+_thread_local = threading.local()
+
+def _resize_buffer(size, img):
+    """
+    Returns a preallocated resize destination for the current thread, so resizing a stream
+    of frames to the same size does not allocate a new array per frame.
+    """
+    shape = (size[1], size[0]) + img.shape[2:]
+    buffers = getattr(_thread_local, "resize_buffers", None)
+    if buffers is None:
+        buffers = _thread_local.resize_buffers = {}
+    key = (shape, img.dtype.str)
+    if key not in buffers:
+        buffers[key] = np.empty(shape, dtype=img.dtype)
+    return buffers[key]
+
+def encode_frame(img, size=DESIRED_SIZE, jpeg_quality=JPEG_QUALITY, role=None):
+    """
+    Encodes an already decoded image (a BGR NumPy array) to a base64 JPEG string
+    after resizing it to the desired dimensions.
+
+    :param img: The decoded image
+    :param size: The (width, height) to resize the image to
+    :param jpeg_quality: The JPEG quality used for encoding (0 to 100)
+    :param role: An image role from utils.image_sizing; when given, its policy picks the size and quality
+    :return: Base64 encoded string of the image
+    """
+    jpeg = encode_jpeg(img, size, jpeg_quality, role)
+    if jpeg is None:
         return None
 
     # Convert the JPEG buffer to a base64 string
-    encoded_image = base64.b64encode(buffer).decode('utf-8')
+    encoded_image = base64.b64encode(jpeg).decode('utf-8')
     return encoded_image
 
-def get_cached_image(image_path):
+def jpeg_etag(jpeg):
+    """
+    Returns a strong HTTP entity tag for the given JPEG bytes.
+    """
+    return f'"{hashlib.sha1(jpeg).hexdigest()}"'
+
+class CachedImage:
+    """
+    An encoded image held by ImageCache, as raw JPEG bytes (for HTTP clients) and as a
+    base64 string (for the model payload).
+    """
+
+    def __init__(self, jpeg: bytes):
+        self.jpeg = jpeg
+        self.base64 = base64.b64encode(jpeg).decode('utf-8')
+        self.etag = jpeg_etag(jpeg)
+        self.dimensions = jpeg_dimensions(jpeg)
+
+    @property
+    def size(self) -> int:
+        return len(self.jpeg) + len(self.base64)
+
+    @property
+    def tokens(self) -> int:
+        """
+        The estimated number of image tokens the vision model spends on this image.
+        """
+        return estimate_image_tokens(*self.dimensions)
+
+class ImageCache:
+    """
+    In-memory LRU cache of encoded images.
+
+    Entries are keyed by the image's path, file size, modification time and encode
+    parameters (the size and quality, or the image role), so an image that changes on
+    disk is re-encoded on its next lookup.
+    At most `max_bytes` of encoded data is kept; the least recently used entries are
+    evicted first.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, image_path, size=DESIRED_SIZE, jpeg_quality=JPEG_QUALITY, role=None):
+        """
+        Returns the base64 encoded image, or None if it cannot be read.
+        """
+        entry = self.get_entry(image_path, size, jpeg_quality, role)
+        return entry.base64 if entry is not None else None
+
+    def get_entry(self, image_path, size=DESIRED_SIZE, jpeg_quality=JPEG_QUALITY, role=None):
+        """
+        Returns the CachedImage for the image, encoding it on a miss, or None if it cannot be read.
+        """
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            logger.error("The file %s was not found.", image_path)
+            return None
+
+        path = os.path.abspath(image_path)
+        if role is not None:
+            # The role's policy decides the size from the source dimensions
+            key = (path, stat.st_size, stat.st_mtime_ns, role, None)
+        else:
+            key = (path, stat.st_size, stat.st_mtime_ns, tuple(size), jpeg_quality)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # Encode outside the lock so other lookups are not blocked by the CPU work
+        jpeg = encode_image_jpeg(image_path, size, jpeg_quality, role)
+        if jpeg is None:
+            return None
+        entry = CachedImage(jpeg)
+        self._put(key, entry)
+        return entry
+
+    def _put(self, key, entry):
+        if entry.size > self.max_bytes:
+            return
+
+        path, _, _, size, jpeg_quality = key
+        with self._lock:
+            # Drop entries for older versions of the same file and parameters
+            for stale_key in [k for k in self._entries if k[0] == path and k[3:] == (size, jpeg_quality)]:
+                self._size -= self._entries.pop(stale_key).size
+
+            self._entries[key] = entry
+            self._size += entry.size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Process-wide cache shared by every caller of get_cached_image
+image_cache = ImageCache(settings.IMAGE_CACHE_MAX_BYTES)
+
+def get_cached_image(image_path, size=DESIRED_SIZE, jpeg_quality=JPEG_QUALITY, role=None):
     """
     Retrieves a cached base64 encoded image or encodes it if not cached.
 
     Parameters:
     - image_path (str): The file path of the image.
+    - size (tuple): The (width, height) to resize the image to.
+    - jpeg_quality (int): The JPEG quality used for encoding (0 to 100).
+    - role (str): An image role from utils.image_sizing; when given, its policy picks the size and quality.
 
     Returns:
     - str: Base64 encoded string of the image, or None if encoding fails.
     """
-    # In a real application, you might want to implement actual caching here
-    # For simplicity, we're just encoding the image every time
-    return encode_image(image_path)
+    return image_cache.get(image_path, size, jpeg_quality, role)
+
+def frame_signature(img):
+    """
+    Computes a small grayscale thumbnail of a decoded image, used to compare frames cheaply.
+
+    :param img: The decoded image (BGR NumPy array)
+    :return: A FRAME_SIGNATURE_SIZE x FRAME_SIGNATURE_SIZE float32 array
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    thumbnail = cv2.resize(gray, (FRAME_SIGNATURE_SIZE, FRAME_SIGNATURE_SIZE), interpolation=cv2.INTER_AREA)
+    return thumbnail.astype(np.float32)
+
+def frame_difference(signature_a, signature_b):
+    """
+    Returns the mean absolute difference between two frame signatures, from 0.0
+    (identical) to 1.0 (completely different).
+    """
+    return float(np.mean(np.abs(signature_a - signature_b))) / 255.0
+
+class KeyframeSelector:
+    """
+    Selects the frames worth sending to the model from a sequence of frames.
+
+    Each frame is compared with the last selected frame; frames whose difference is
+    below `threshold` are near-duplicates and are skipped. A threshold of 0 selects
+    every frame, and so does `force`.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.selected = 0
+        self.skipped = 0
+        self._last_signature = None
+
+    def is_keyframe(self, img, force: bool = False) -> bool:
+        signature = frame_signature(img)
+        if (
+            not force
+            and self._last_signature is not None
+            and self.threshold > 0
+            and frame_difference(signature, self._last_signature) < self.threshold
+        ):
+            self.skipped += 1
+            return False
+
+        self._last_signature = signature
+        self.selected += 1
+        return True
+
+# JPEG start-of-frame markers, which carry the image dimensions
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def jpeg_dimensions(data):
+    """
+    Reads the (width, height) of a JPEG from its header without decoding it.
+
+    :param data: The JPEG bytes
+    :return: (width, height), or None if the data is not a JPEG or has no frame header
+    """
+    if data[:2] != b"\xff\xd8":
+        return None
+
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # Markers without a length field
+            i += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+def base64_image_tokens(base64_image):
+    """
+    Estimates the image tokens of a base64 encoded JPEG from its header alone.
+
+    :return: The estimated token count, or None if the header could not be read
+    """
+    # The frame header of the JPEGs we encode sits well within the first kilobyte
+    head = base64.b64decode(base64_image[:2048])
+    dimensions = jpeg_dimensions(head)
+    return estimate_image_tokens(*dimensions) if dimensions is not None else None
+
+def reduced_decode_flag(dimensions, size=DESIRED_SIZE):
+    """
+    Picks the cheapest OpenCV decode flag that still yields at least `size` pixels:
+    libjpeg can decode straight to 1/2 or 1/4 resolution, skipping most of the IDCT work.
+    """
+    if dimensions is None:
+        return cv2.IMREAD_COLOR
+    # Compare long and short edges so portrait and landscape images are treated alike
+    source_long, source_short = max(dimensions), min(dimensions)
+    target_long, target_short = max(size), min(size)
+    for factor, flag in ((4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if source_long >= factor * target_long and source_short >= factor * target_short:
+            return flag
+    return cv2.IMREAD_COLOR
+
+def decode_image(image_input, size=DESIRED_SIZE, reduced_decode=True, role=None):
+    """
+    Decodes an image from a file path (str) or encoded data (bytes), decoding JPEGs that
+    are much larger than `size` at reduced resolution when `reduced_decode` is set.
+    With `role`, the target size is the one the role's sizing policy picks for the image.
+
+    :return: The decoded BGR image, or None if it could not be read
+    """
+    if isinstance(image_input, str):
+        try:
+            with open(image_input, "rb") as image_file:
+                image_input = image_file.read()
+        except OSError:
+            logger.error("Failed to read image %s.", image_input)
+            return None
+
+    flag = cv2.IMREAD_COLOR
+    if reduced_decode:
+        dimensions = jpeg_dimensions(image_input)
+        if role is not None and dimensions is not None:
+            size, _ = role_encoding(dimensions, role)
+        flag = reduced_decode_flag(dimensions, size)
+    with span("image_decode"):
+        img = cv2.imdecode(np.frombuffer(image_input, np.uint8), flag)
+    if img is None:
+        logger.error("Failed to read image.")
+    return img
+
+_preprocess_executor = None
+_preprocess_executor_lock = threading.Lock()
+
+def get_preprocess_executor():
+    """
+    Returns the thread pool shared by the batch preprocessing functions. Threads give real
+    parallelism here because OpenCV releases the GIL while decoding, resizing and encoding.
+    """
+    global _preprocess_executor
+    with _preprocess_executor_lock:
+        if _preprocess_executor is None:
+            _preprocess_executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_PREPROCESS_WORKERS or os.cpu_count(),
+                thread_name_prefix="image-preprocess",
+            )
+    return _preprocess_executor
+
+def preprocess_image(image_input, size=DESIRED_SIZE, jpeg_quality=JPEG_QUALITY, reduced_decode=True, role=None):
+    """
+    Decodes, resizes and encodes one image to a base64 JPEG string.
+    """
+    img = decode_image(image_input, size, reduced_decode, role)
+    if img is None:
+        return None
+    if role is not None:
+        # Size from the original dimensions, not those of a reduced decode
+        dimensions = jpeg_dimensions(image_input) if isinstance(image_input, bytes) else None
+        size, jpeg_quality = role_encoding(dimensions or (img.shape[1], img.shape[0]), role)
+    return encode_frame(img, size, jpeg_quality)
+
+def encode_images(image_inputs, size=DESIRED_SIZE, jpeg_quality=JPEG_QUALITY, reduced_decode=True, role=None):
+    """
+    Encodes many images (file paths or bytes) to base64 JPEG strings on the shared thread pool.
+
+    Parameters:
+    - image_inputs (iterable): File paths (str) or encoded image data (bytes).
+    - size (tuple): The (width, height) to resize the images to.
+    - jpeg_quality (int): The JPEG quality used for encoding (0 to 100).
+    - reduced_decode (bool): Decode large JPEGs at 1/2 or 1/4 resolution when that still covers `size`.
+    - role (str): An image role from utils.image_sizing; when given, its policy picks the size and quality.
+
+    Returns:
+    - list: The base64 strings in input order, with None for images that failed.
+    """
+    executor = get_preprocess_executor()
+    return list(executor.map(lambda image_input: preprocess_image(image_input, size, jpeg_quality, reduced_decode, role), image_inputs))
 
 # Example usage (can be removed in production)
 if __name__ == "__main__":
@@ -0,0 +1,68 @@
+import math
+from core.config import settings
+
+# Pixtral splits images into 16x16 pixel patches, one token each, plus one break token per row of patches
+PATCH_SIZE = 16
+
+# Image roles with their own sizing policy
+FLOORPLAN = "floorplan"
+LIVE = "live"
+
+class SizingPolicy:
+    """
+    How images of one role are sized for the vision model: the largest edge allowed,
+    the image-token budget and the JPEG quality.
+    """
+
+    def __init__(self, max_tokens: int, max_edge: int, jpeg_quality: int):
+        self.max_tokens = max_tokens
+        self.max_edge = max_edge
+        self.jpeg_quality = jpeg_quality
+
+    def target_size(self, width, height):
+        return fit_size(width, height, self.max_tokens, self.max_edge)
+
+POLICIES = {
+    # The floorplan carries small labels and thin walls, so it gets more tokens and a higher quality
+    FLOORPLAN: SizingPolicy(settings.FLOORPLAN_IMAGE_TOKEN_BUDGET, settings.FLOORPLAN_IMAGE_MAX_EDGE, settings.FLOORPLAN_JPEG_QUALITY),
+    LIVE: SizingPolicy(settings.LIVE_IMAGE_TOKEN_BUDGET, settings.LIVE_IMAGE_MAX_EDGE, settings.LIVE_JPEG_QUALITY),
+}
+
+def get_policy(role):
+    if role not in POLICIES:
+        raise ValueError(f"Unknown image role {role!r}, expected one of {sorted(POLICIES)}")
+    return POLICIES[role]
+
+def estimate_image_tokens(width, height):
+    """
+    Estimates how many tokens the vision model spends on an image of the given size.
+    """
+    columns = math.ceil(width / PATCH_SIZE)
+    rows = math.ceil(height / PATCH_SIZE)
+    return rows * columns + rows
+
+def fit_size(width, height, max_tokens, max_edge):
+    """
+    Returns the largest (width, height) with the same aspect ratio as the source that fits
+    within `max_edge` and `max_tokens`, rounded down to whole patches. Images are never
+    upscaled.
+    """
+    scale = min(1.0, max_edge / max(width, height))
+    target_width, target_height = width * scale, height * scale
+
+    patches = (target_width / PATCH_SIZE) * (target_height / PATCH_SIZE)
+    if patches > max_tokens:
+        shrink = math.sqrt(max_tokens / patches)
+        target_width, target_height = target_width * shrink, target_height * shrink
+
+    # Patch-aligned dimensions waste no tokens on partially filled patches
+    target_width = max(PATCH_SIZE, int(target_width // PATCH_SIZE) * PATCH_SIZE)
+    target_height = max(PATCH_SIZE, int(target_height // PATCH_SIZE) * PATCH_SIZE)
+
+    # Row break tokens can still push us over the budget, trim the longer edge a patch at a time
+    while estimate_image_tokens(target_width, target_height) > max_tokens and (target_width > PATCH_SIZE or target_height > PATCH_SIZE):
+        if target_width >= target_height:
+            target_width -= PATCH_SIZE
+        else:
+            target_height -= PATCH_SIZE
+    return target_width, target_height
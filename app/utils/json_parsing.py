@@ -0,0 +1,155 @@
+import json
+import re
+
+# Fenced code blocks, with or without a language tag
+CODE_FENCE = re.compile(r"```[a-zA-Z]*\s*(.*?)```", re.DOTALL)
+
+_decoder = json.JSONDecoder()
+
+def extract_json(content: str):
+    """
+    Extracts the JSON value from a model reply.
+
+    Fenced code blocks are tried first; otherwise the first complete JSON object or array
+    in the text is used, so replies without fences (or with prose around the JSON) are
+    handled too.
+
+    :raises ValueError: If the reply contains no valid JSON object or array
+    """
+    for match in CODE_FENCE.finditer(content):
+        try:
+            return json.loads(match.group(1))
+        except json.JSONDecodeError:
+            continue
+
+    for match in re.finditer(r"[{\[]", content):
+        try:
+            value, _ = _decoder.raw_decode(content, match.start())
+            return value
+        except json.JSONDecodeError:
+            continue
+    raise ValueError("No JSON found in the reply")
+
+class IncrementalJsonParser:
+    """
+    Parses a JSON document that arrives in chunks, reporting values as soon as they are
+    complete instead of waiting for the whole document.
+
+    Text before the first '{' or '[' (such as an opening code fence) is skipped. `feed`
+    returns a list of (path, value) pairs for every value completed by the new text whose
+    path is at most `max_depth` long; a path holds the object keys and array indices
+    leading to the value, e.g. ("plan", 0) for the first step of the plan.
+    """
+
+    def __init__(self, max_depth: int = 2):
+        self.max_depth = max_depth
+        self.done = False
+        self._text = ""
+        self._position = 0
+        self._started = False
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self._string_start = None
+
+    def feed(self, text: str) -> list:
+        if self.done:
+            return []
+        self._text += text
+        events = []
+        while self._position < len(self._text) and not self.done:
+            self._step(self._text[self._position], events)
+            self._position += 1
+        return events
+
+    def _step(self, char, events):
+        if not self._started:
+            if char in "{[":
+                self._started = True
+                self._open(char)
+            return
+
+        if self._in_string:
+            if self._escaped:
+                self._escaped = False
+            elif char == "\\":
+                self._escaped = True
+            elif char == '"':
+                self._in_string = False
+                self._close_string(events)
+            return
+
+        frame = self._stack[-1]
+        if char == '"':
+            self._in_string = True
+            self._string_start = self._position
+            if not frame["expect_key"]:
+                frame["value_start"] = self._position
+        elif char in "{[":
+            frame["value_start"] = self._position
+            self._open(char)
+        elif char in "}]":
+            self._end_scalar(frame, events)
+            self._stack.pop()
+            if not self._stack:
+                self.done = True
+                return
+            parent = self._stack[-1]
+            self._emit(parent, events)
+        elif char == ":":
+            frame["expect_key"] = False
+        elif char == ",":
+            self._end_scalar(frame, events)
+            if frame["is_object"]:
+                frame["expect_key"] = True
+            else:
+                frame["index"] += 1
+        elif not char.isspace() and frame["value_start"] is None and not frame["expect_key"]:
+            # Start of a number, true, false or null, complete at the next ',' or bracket
+            frame["value_start"] = self._position
+            frame["scalar"] = True
+
+    def _open(self, char):
+        path = ()
+        if self._stack:
+            path = self._path(self._stack[-1])
+        self._stack.append({
+            "is_object": char == "{",
+            "path": path,
+            "key": None,
+            "index": 0,
+            "expect_key": char == "{",
+            "value_start": None,
+            "scalar": False,
+        })
+
+    def _path(self, frame):
+        return frame["path"] + ((frame["key"],) if frame["is_object"] else (frame["index"],))
+
+    def _close_string(self, events):
+        frame = self._stack[-1]
+        if frame["expect_key"]:
+            frame["key"] = json.loads(self._text[self._string_start:self._position + 1])
+        else:
+            self._emit(frame, events)
+
+    def _end_scalar(self, frame, events):
+        if frame["scalar"]:
+            self._emit(frame, events, end=self._position)
+
+    def _emit(self, frame, events, end=None):
+        """
+        Reports the value that just ended in `frame` and resets it for the next one.
+        """
+        end = self._position + 1 if end is None else end
+        start = frame["value_start"]
+        frame["value_start"] = None
+        frame["scalar"] = False
+        if start is None:
+            return
+        path = self._path(frame)
+        if len(path) <= self.max_depth:
+            try:
+                events.append((path, json.loads(self._text[start:end])))
+            except json.JSONDecodeError:
+                pass
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import cv2
+import math
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+from core.telemetry import span
+
+# Default number of frames sampled per second of video
+DEFAULT_SAMPLE_FPS = 4
+
+def frame_interval(video_fps, fps=DEFAULT_SAMPLE_FPS):
+    """
+    Returns how many source frames lie between two sampled frames.
+
+    Parameters:
+    - video_fps (float): The frame rate reported by the video container (may be 0 or NaN).
+    - fps (float): The target number of frames to sample per second.
+
+    Returns:
+    - int: The sampling interval, always at least 1.
+    """
+    if not video_fps or math.isnan(video_fps) or fps <= 0:
+        # Unknown frame rate, keep every frame
+        return 1
+    return max(1, round(video_fps / fps))
+
+def iter_video_frames(video_path, fps=DEFAULT_SAMPLE_FPS):
+    """
+    Yields frames sampled from a video at roughly the target frame rate.
+
+    Skipped frames are only grabbed, never decoded; sampled frames are decoded with
+    retrieve(). Nothing is written to disk.
+
+    Parameters:
+    - video_path (str): The file path of the video.
+    - fps (float): The target number of frames to sample per second.
+
+    Yields:
+    - tuple: (frame_index, timestamp_seconds, frame) where frame is a BGR NumPy array.
+    """
+    video = cv2.VideoCapture(video_path)
+    if not video.isOpened():
+        raise ValueError(f"Failed to open video {video_path}")
+
+    try:
+        video_fps = video.get(cv2.CAP_PROP_FPS)
+        interval = frame_interval(video_fps, fps)
+        has_fps = bool(video_fps) and not math.isnan(video_fps)
+
+        frame_index = 0
+        while video.grab():
+            if frame_index % interval == 0:
+                with span("video_decode"):
+                    success, frame = video.retrieve()
+                if success:
+                    timestamp = frame_index / video_fps if has_fps else 0.0
+                    yield frame_index, timestamp, frame
+            frame_index += 1
+    finally:
+        video.release()
+
+def iter_named_video_frames(video_path, fps=DEFAULT_SAMPLE_FPS):
+    """
+    Yields (frame_name, frame) pairs for the sampled frames of a video, ready to be
+    fed into the navigation pipeline.
+    """
+    for frame_index, _, frame in iter_video_frames(video_path, fps):
+        yield f"frame_{frame_index:06d}", frame
+
+def copy_to_temporary_file(file_obj, suffix=""):
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as temp_file:
+        shutil.copyfileobj(file_obj, temp_file)
+        return temp_file.name
+
+@asynccontextmanager
+async def temporary_video_file(file_obj, filename=None):
+    """
+    Copies an uploaded video into a temporary file for the duration of the context,
+    since OpenCV can only open videos by path (uploads spooled to disk are anonymous
+    files). Yields the path of the temporary file. The copy runs in a worker thread, so
+    large videos do not block the event loop.
+    """
+    suffix = os.path.splitext(filename)[1] if filename else ""
+    path = await asyncio.to_thread(copy_to_temporary_file, file_obj, suffix)
+    try:
+        yield path
+    finally:
+        os.remove(path)